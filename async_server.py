@@ -0,0 +1,402 @@
+import asyncio
+import os
+import socket
+import ssl
+import time
+
+import server
+from error_handler import HTTPErrorHandler
+from http_parser import HTTPParseError
+
+# Limite de descriptores que se intenta alcanzar para soportar 10k+ conexiones
+LIMITE_DESCRIPTORES_DESEADO = 65536
+
+class ConexionAsync:
+    """
+    Adaptador con la interfaz de socket (sendall/close) que usan
+    HTTPErrorHandler y procesar_request, sobre un StreamWriter de asyncio
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.cerrada = False
+        self.ocupada = False  # True mientras se arma y envia una respuesta
+        self.outbox_programado = False  # evita agendar un envio por cada mensaje de un broadcast
+        self.client_id = None
+        # Envios pendientes en orden: bytes, (archivo, offset, count), bytes ya enviados a moderar (int)
+        # o un generador de partes (send_stream)
+        self.pendientes = []
+        self.al_vaciar = None  # registro del request cuyo envio sigue en pendientes
+
+    def sendall(self, data):
+        if self.pendientes:
+            # Hay un archivo en cola: respetar el orden de la respuesta
+            self.pendientes.append(bytes(data))
+        else:
+            # No bloquea: los datos quedan en el buffer del transporte hasta el drain()
+            self.writer.write(data)
+
+    def sendmsg(self, buffers):
+        """
+        Scatter/gather. El transporte copia lo que el socket no acepta en el momento, por eso
+        los cuerpos grandes (archivos fuera de FileCache) se envian con sendfile y no por aca
+        """
+        if self.pendientes:
+            self.pendientes.append(b"".join(buffers))
+        else:
+            self.writer.writelines(buffers)
+        return sum(len(b) for b in buffers)
+
+    def sendfile(self, f, offset=0, count=None):
+        # El llamador cierra su archivo al terminar el request: se duplica el descriptor
+        copia = os.fdopen(os.dup(f.fileno()), "rb")
+        self.pendientes.append((copia, offset, count))
+        return count
+
+    def sendstream(self, parts):
+        """Cuerpo generado de a partes: se consume en vaciar() con control de flujo, sin acumularlo"""
+        self.pendientes.append(parts)
+
+    def moderar(self, nbytes):
+        """
+        Limite de ancho de banda: el turno se reserva en vaciar(), cuando los bytes anteriores
+        ya salieron; reservarlo al encolar sumaria las esperas de todos los bloques
+        """
+        self.pendientes.append(nbytes)
+
+    def registrar_al_vaciar(self, callback):
+        """Access log y metricas despues del envio: recien ahi se conocen los bytes de un cuerpo generado"""
+        if self.pendientes:
+            self.al_vaciar = callback
+        else:
+            callback()
+
+    def close(self):
+        self.cerrada = True
+
+    def shutdown(self, how=None):
+        """Cierre forzado pedido desde otro hilo (reaper o consola): aborta el transporte en el loop"""
+        self.cerrada = True
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def programar_outbox(self):
+        """Flusher del ClientsHandler: puede llamarse desde cualquier hilo"""
+        if not self.outbox_programado:
+            self.outbox_programado = True
+            self.loop.call_soon_threadsafe(self.enviar_outbox)
+
+    def enviar_outbox(self):
+        """Pasa los broadcast pendientes al transporte (en el event loop, entre respuestas)"""
+        self.outbox_programado = False
+        if self.cerrada or self.ocupada:
+            return
+        handler = server.clients_handler
+        chunks = handler.take_output(self.client_id)
+        for chunk in chunks:
+            self.writer.write(chunk)
+        handler.output_done(self.client_id, len(chunks))
+        if self.writer.transport.get_write_buffer_size() > handler.outbox_limit:
+            # El cliente no lee: el buffer del transporte supero la marca de agua
+            handler.disconnect_client(self.client_id, reason="outbox lleno")
+
+    async def vaciar(self):
+        """Envia lo pendiente; los archivos van por loop.sendfile sin cargarse en memoria"""
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pendientes:
+                item = self.pendientes.pop(0)
+                if isinstance(item, bytes):
+                    self.writer.write(item)
+                    continue
+                if isinstance(item, int):
+                    await self.writer.drain()
+                    demora = server.ancho_banda.reserve(item)
+                    if demora > 0:
+                        await asyncio.sleep(demora)
+                    continue
+                if not isinstance(item, tuple):
+                    await self.enviar_partes(item)
+                    continue
+                f, offset, count = item
+                with f:
+                    await self.enviar_archivo(f, offset, count)
+            await self.writer.drain()
+        finally:
+            for item in self.pendientes:
+                if isinstance(item, tuple):
+                    item[0].close()
+                elif not isinstance(item, (bytes, int)):
+                    item.close()
+            self.pendientes = []
+            callback, self.al_vaciar = self.al_vaciar, None
+            if callback is not None:
+                callback()
+
+    async def enviar_archivo(self, f, offset, count):
+        """
+        sendfile de una parte del archivo. Con limite de ancho de banda sale en bloques de
+        BLOQUE_MODERADO y cada uno espera su turno: un solo descriptor por respuesta
+        """
+        loop = asyncio.get_running_loop()
+        await self.writer.drain()
+        if server.ancho_banda.rate <= 0:
+            await loop.sendfile(self.writer.transport, f, offset, count)
+            return
+        enviado = 0
+        while enviado < count:
+            bloque = min(server.BLOQUE_MODERADO, count - enviado)
+            await loop.sendfile(self.writer.transport, f, offset + enviado, bloque)
+            enviado += bloque
+            demora = server.ancho_banda.reserve(bloque)
+            if demora > 0:
+                await asyncio.sleep(demora)
+
+    async def enviar_partes(self, parts):
+        """
+        Envia un generador de send_stream: cada archivo se transmite antes de pedir la parte siguiente.
+        Las partes se generan en un hilo (renderizar un listado, leer directorios y abrir archivos del tar)
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                part = await loop.run_in_executor(None, next, parts, None)
+                if part is None:
+                    break
+                if isinstance(part, tuple):
+                    await self.enviar_archivo(*part)
+                    continue
+                self.writer.write(part)
+                if self.writer.transport.get_write_buffer_size() > server.RECV_SIZE:
+                    await self.writer.drain()
+                demora = server.ancho_banda.reserve(len(part))
+                if demora > 0:
+                    await self.writer.drain()
+                    await asyncio.sleep(demora)
+        finally:
+            parts.close()
+
+class ConexionMedidaAsync(server.ConexionMedida):
+    """ConexionMedida del motor async: tambien cuenta los cuerpos generados, que salen en vaciar()"""
+
+    __slots__ = ()
+
+    def sendstream(self, parts):
+        if not self.primer_envio_ns:
+            self.primer_envio_ns = time.perf_counter_ns()
+        self.conn.sendstream(self._contar(parts))
+
+    def _contar(self, parts):
+        try:
+            for part in parts:
+                self.bytes_enviados += part[2] if isinstance(part, tuple) else len(part)
+                yield part
+        finally:
+            parts.close()
+
+def ajustar_limite_descriptores():
+    """Sube el limite de archivos abiertos del proceso para aceptar miles de conexiones"""
+    try:
+        import resource
+    except ImportError:
+        # Windows no tiene RLIMIT_NOFILE
+        return None
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    objetivo = LIMITE_DESCRIPTORES_DESEADO
+    if hard != resource.RLIM_INFINITY:
+        objetivo = min(objetivo, hard)
+    if soft < objetivo:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (objetivo, hard))
+            soft = objetivo
+        except (ValueError, OSError):
+            pass
+    return soft
+
+async def recibir_cuerpo(reader, parser, subida):
+    """
+    Escribe el cuerpo de una subida a medida que llega (bloques de RECV_SIZE como maximo).
+    Las escrituras y el fsync final corren en un hilo para no frenar el event loop.
+    Mientras se recibe la conexion no esta inactiva para el reaper: cada lectura tiene su timeout.
+    Devuelve False si el cliente cerro antes de terminar
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        data = parser.read_body()
+        if data is None:
+            chunk = await asyncio.wait_for(reader.read(server.RECV_SIZE), server.TIMEOUT_SOCKET)
+            if not chunk:
+                return False
+            parser.feed(chunk)
+        elif data:
+            await loop.run_in_executor(None, subida.write, data)
+        else:
+            try:
+                await loop.run_in_executor(None, subida.commit)
+            except OSError:
+                # completar_subida responde el 500 al volver a pedir el resultado
+                pass
+            return True
+
+async def atender_conexion(reader, writer, admitida=False):
+    """Bucle keep-alive de una conexion dentro del event loop"""
+    addr = writer.get_extra_info("peername")
+    # asyncio solo desactiva Nagle si el socket declara proto=IPPROTO_TCP; el de escucha se crea con proto 0
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conexion = ConexionAsync(writer)
+    if not admitida and not server.admitir_conexion(conexion, addr, False):
+        # El 429 quedo en el buffer del transporte: close() lo envia antes de cerrar
+        writer.close()
+        return
+    client_id, client_name = server.registrar_cliente(conexion, addr)
+    conexion.client_id = client_id
+    server.clients_handler.set_flusher(client_id, conexion.programar_outbox)
+    server.log.debug(f"[{client_name}] CONEXION ACEPTADA (async) desde {addr[0]}:{addr[1]}")
+    if server.contadores is not None:
+        server.contadores.conexion_abierta()
+
+    conn = ConexionMedidaAsync(conexion)
+    parser = server.crear_parser()
+    requests_atendidos = 0
+
+    try:
+        while requests_atendidos < server.MAX_REQUESTS_POR_CONEXION:
+            try:
+                inicio = time.perf_counter_ns()
+                request = parser.next_request()
+            except HTTPParseError as e:
+                error_msg = server.responder_error_parseo(conn, e)
+                server.log.warning(f"[{client_name}] {error_msg}: {e.message}")
+                break
+
+            if request is None:
+                # Sin wait_for por lectura: la inactividad la controla el reaper (aborta el transporte)
+                chunk = await reader.read(server.RECV_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                continue
+
+            server.metricas.observe("parse", time.perf_counter_ns() - inicio)
+            requests_atendidos += 1
+            if server.contadores is not None:
+                server.contadores.request()
+            permitir_keep_alive = (requests_atendidos < server.MAX_REQUESTS_POR_CONEXION
+                                   and not server.drenando.is_set())
+            server.clients_handler.update_client_activity(client_id)
+            conexion.ocupada = True
+            subida = None
+            if request.streaming:
+                subida = server.iniciar_subida(conn, addr, client_name, request)
+                await conn.vaciar()
+                if subida is None:
+                    break
+                try:
+                    completo = await recibir_cuerpo(reader, parser, subida)
+                except HTTPParseError as e:
+                    subida.abort()
+                    error_msg = server.responder_error_parseo(conn, e)
+                    server.log.warning(f"[{client_name}] {error_msg}: {e.message}")
+                    break
+                except BaseException:
+                    subida.abort()
+                    raise
+                if not completo:
+                    subida.abort()
+                    server.log.debug(f"[{client_name}] El cliente cerro antes de terminar la subida")
+                    break
+            else:
+                # Comprimir al vuelo o leer un directorio grande corre en un hilo: el loop sigue atendiendo
+                tarea = server.trabajo_previo(request)
+                if tarea is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, tarea)
+            seguir = server.procesar_request(conn, addr, client_name, request, permitir_keep_alive, subida)
+            await conn.vaciar()
+            conexion.ocupada = False
+            server.clients_handler.set_client_idle(client_id)
+            if not seguir or conn.cerrada or server.drenando.is_set():
+                break
+            conexion.enviar_outbox()
+
+    except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+        server.log.debug(f"[{client_name}] Conexion interrumpida: {e}")
+    except Exception as e:
+        error_msg = HTTPErrorHandler.internal_server_error(conn, str(e))
+        server.log.error(f"[{client_name}] {error_msg}")
+    finally:
+        server.clients_handler.remove_client(client_id)
+        if server.contadores is not None:
+            server.contadores.conexion_cerrada()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        server.log.debug(f"[{client_name}] CONEXION CERRADA ({requests_atendidos} requests atendidos)")
+
+class ProtocoloTLS(asyncio.StreamReaderProtocol):
+    """Protocolo del listener HTTPS: no lee del socket hasta que start_tls tome la conexion"""
+
+    def __init__(self):
+        super().__init__(asyncio.StreamReader(), atender_conexion_tls)
+
+    def connection_made(self, transport):
+        # Si el ClientHello llegara antes de start_tls quedaria en el buffer del StreamReader
+        # y el handshake nunca lo veria: start_tls reanuda la lectura
+        transport.pause_reading()
+        super().connection_made(transport)
+
+async def atender_conexion_tls(reader, writer):
+    """Handshake TLS sobre la conexion aceptada (medido en las metricas) y despues el bucle keep-alive"""
+    if not server.limitador.connection_opened(writer.get_extra_info("peername")[0]):
+        server.log.warning(f"[LIMITES] Conexion TLS de {writer.get_extra_info('peername')[0]} rechazada")
+        writer.transport.abort()
+        return
+    inicio = time.perf_counter_ns()
+    try:
+        await asyncio.wait_for(writer.start_tls(server.contexto_tls), server.TIMEOUT_HANDSHAKE)
+    except (asyncio.TimeoutError, ssl.SSLError, ConnectionError, OSError) as e:
+        server.metricas.handshake_failed()
+        server.log.debug(f"[ASYNC] Handshake TLS fallido desde {writer.get_extra_info('peername')}: {e!r}")
+        server.limitador.connection_closed(writer.get_extra_info("peername")[0])
+        writer.transport.abort()
+        return
+    ssl_object = writer.get_extra_info("ssl_object")
+    server.metricas.handshake(ssl_object.session_reused, time.perf_counter_ns() - inicio)
+    await atender_conexion(reader, writer, admitida=True)
+
+async def servir(server_socket, backlog, tls_socket=None):
+    loop = asyncio.get_running_loop()
+    cierre = asyncio.Event()
+    # iniciar_drenaje() se llama desde el hilo de señales o de la consola
+    server.despertar_escucha = lambda: loop.call_soon_threadsafe(cierre.set)
+    servidores = [await asyncio.start_server(atender_conexion, sock=server_socket, backlog=backlog)]
+    if tls_socket is not None:
+        servidores.append(await loop.create_server(ProtocoloTLS, sock=tls_socket, backlog=backlog))
+    if server.drenando.is_set():
+        cierre.set()
+    try:
+        await cierre.wait()
+    except asyncio.CancelledError:
+        server.iniciar_drenaje("Ctrl+C")
+    # Deja de aceptar; las conexiones abiertas terminan su respuesta en curso
+    for srv in servidores:
+        srv.close()
+    await loop.run_in_executor(None, server.esperar_drenaje, server.DRENAJE_TIMEOUT)
+
+def ejecutar(server_socket, backlog, tls_socket=None):
+    """Arranca el motor asyncio sobre un socket de escucha ya creado"""
+    limite = ajustar_limite_descriptores()
+    if limite is not None:
+        server.log.info(f"[ASYNC] Limite de descriptores abiertos: {limite}")
+    server.log.info("[ASYNC] Motor event loop iniciado (un solo hilo para todas las conexiones)")
+    server_socket.setblocking(False)
+    if tls_socket is not None:
+        tls_socket.setblocking(False)
+    try:
+        asyncio.run(servir(server_socket, backlog, tls_socket))
+    except KeyboardInterrupt:
+        print("\n[ASYNC] Servidor detenido")
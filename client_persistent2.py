@@ -1,82 +1,82 @@
-import socket
-import sys
+import argparse
+import os
 import time
 
-def main():
-    if len(sys.argv) != 4:
-        print("Uso: python client_persistent2.py <server_host> <server_port> <filename>")
-        sys.exit(1)
+import tls
+from http_client import HTTPClient, HTTPClientError
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage="python client_persistent2.py <server_host> <server_port> <filename> "
+                                           "[--tls] [--guardar DIR]")
+    parser.add_argument("server_host")
+    parser.add_argument("server_port", type=int)
+    parser.add_argument("filename")
+    parser.add_argument("--tls", action="store_true",
+                        help="Conecta por HTTPS (reanuda la sesion TLS al reconectar)")
+    parser.add_argument("--guardar", metavar="DIR",
+                        help="Escribe cada archivo descargado en DIR a medida que llega")
+    return parser.parse_args()
 
-    server_host = sys.argv[1]
-    server_port = int(sys.argv[2])
-    filename = sys.argv[3]
+def main():
+    args = parse_args()
+    server_host = args.server_host
+    server_port = args.server_port
+    filename = args.filename
 
-    print(f"CLIENTE PERSISTENTE 2 - Conectando a {server_host}:{server_port}")
+    print(f"CLIENTE PERSISTENTE 2 - Conectando a {server_host}:{server_port}{' (TLS)' if args.tls else ''}")
     print("COMPORTAMIENTO: Conexion indefinida - Envia requests cada 8s")
-    
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-    try:
-        print("Estableciendo conexion...")
-        client.connect((server_host, server_port))
-        print("Conexion establecida - Modo PERSISTENTE INDEFINIDO")
+    # El pool mantiene la conexion keep-alive entre requests y reconecta si el servidor la cierra
+    client = HTTPClient(user_agent="Cliente-Persistente-2/1.0",
+                        tls_context=tls.crear_contexto_cliente() if args.tls else None)
+    if args.guardar:
+        os.makedirs(args.guardar, exist_ok=True)
 
+    try:
         request_count = 0
-        
+        # Validadores de la ultima respuesta de cada archivo: {archivo: (etag, last_modified)}
+        validadores = {}
+
         while True:
             request_count += 1
             print(f"\n--- CLIENTE 2 - Request #{request_count} ---")
-            
+
             # Rotar entre archivos
             files_rotation = [filename, "prueba.txt", "index.html"]
             current_file = files_rotation[request_count % len(files_rotation)]
-            
-            request_line = f"GET /{current_file} HTTP/1.1\r\n"
-            headers = (
-                f"Host: {server_host}\r\n"
-                "User-Agent: Cliente-Persistente-2/1.0\r\n"
-                "Connection: keep-alive\r\n"
-                "\r\n"
-            )
-            http_request = request_line + headers
+
+            # Request condicional: si el archivo no cambio el servidor responde 304 sin cuerpo
+            etag, last_modified = validadores.get(current_file, (None, None))
+            headers = {"If-None-Match": etag, "If-Modified-Since": last_modified}
 
             print(f"Enviando request para: {current_file}")
-            client.sendall(http_request.encode())
+            if args.guardar:
+                response = client.download(server_host, server_port, f"/{current_file}",
+                                           os.path.join(args.guardar, os.path.basename(current_file)),
+                                           headers, tls=args.tls)
+            else:
+                response = client.request(server_host, server_port, f"/{current_file}", headers=headers,
+                                          tls=args.tls)
 
-            # Leer respuesta
-            response = b""
-            while True:
-                chunk = client.recv(4096)
-                if not chunk:
-                    break
-                response += chunk
-                if b"\r\n\r\n" in response:
-                    headers_end = response.find(b"\r\n\r\n") + 4
-                    headers_part = response[:headers_end]
-                    if b"Content-Length:" in headers_part:
-                        content_length_pos = headers_part.find(b"Content-Length:") + 15
-                        content_length_end = headers_part.find(b"\r\n", content_length_pos)
-                        content_length = int(headers_part[content_length_pos:content_length_end].strip())
-                        total_expected = headers_end + content_length
-                        if len(response) >= total_expected:
-                            break
-                    else:
-                        if chunk.endswith(b"\r\n") or len(chunk) < 4096:
-                            break
+            print(f"Respuesta #{request_count} recibida - Status: {response.status} "
+                  f"({response.length} bytes, conexion {'reutilizada' if response.reused else 'nueva'})")
 
-            status_code = response.split(b' ')[1].decode()
-            print(f"Respuesta #{request_count} recibida - Status: {status_code}")
+            # Guardar ETag y Last-Modified para el proximo request del mismo archivo
+            validadores[current_file] = (response.get_header("ETag", etag),
+                                         response.get_header("Last-Modified", last_modified))
 
             print(f"CLIENTE 2: Esperando 8 segundos para siguiente request...")
             time.sleep(8)
 
     except KeyboardInterrupt:
         print("\nCLIENTE 2: Interrumpido por usuario")
-    except Exception as e:
+    except (OSError, HTTPClientError) as e:
         print(f"Error en el cliente persistente 2: {e}")
     finally:
+        stats = client.pool.get_stats()
         client.close()
-        print("CLIENTE 2: Conexion cerrada")
+        print(f"CLIENTE 2: Conexion cerrada ({stats['created']} conexiones abiertas, "
+              f"{stats['tls_resumed']} sesiones TLS reanudadas)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,151 +1,437 @@
 import threading
+import itertools
+import socket
 import time
-import json
+from collections import deque
+
+class ClientRecord:
+    """Estado de una conexion. Con __slots__ cada registro ocupa una fraccion de un dict"""
+
+    __slots__ = ('client_id', 'conn', 'addr', 'name', 'connected', 'busy', 'request_count', 'last_activity', 'closed_at',
+                 'outbox', 'outbox_bytes', 'flusher')
+
+    def __init__(self, client_id, conn, addr):
+        self.client_id = client_id
+        self.conn = conn
+        self.addr = addr
+        self.name = f"Cliente-{client_id}"
+        self.connected = True
+        self.busy = False  # True mientras se atiende un request (no se considera inactivo)
+        self.request_count = 0
+        self.last_activity = time.time()
+        self.closed_at = None
+        self.outbox = None  # deque de mensajes pendientes de envio (se crea con el primer broadcast)
+        self.outbox_bytes = 0
+        self.flusher = None  # callable de la capa de I/O que vacia el outbox de esta conexion
+
+    def to_dict(self):
+        return {
+            'conn': self.conn,
+            'addr': self.addr,
+            'name': self.name,
+            'connected': self.connected,
+            'request_count': self.request_count,
+            'last_activity': self.last_activity
+        }
+
+class _Shard:
+    """Una particion del registro con su propio lock y contadores"""
+
+    __slots__ = ('lock', 'clients', 'closed', 'connected', 'total', 'requests', 'pending', 'delivered', 'dropped')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}  # {client_id: ClientRecord}
+        self.closed = deque()  # (closed_at, client_id) en orden de cierre, para expirar
+        self.connected = 0
+        self.total = 0
+        self.requests = 0
+        self.pending = set()  # clientes con outbox no vacio
+        self.delivered = 0
+        self.dropped = 0
 
 class ClientsHandler:
     """
-    Clase para gestionar todas las conexiones de clientes del servidor
+    Clase para gestionar todas las conexiones de clientes del servidor.
+    El registro se reparte en particiones (shards) con lock propio para que
+    miles de hilos no compitan por un unico lock, y mantiene contadores
+    acumulados para que get_stats no recorra todos los clientes.
+    Los clientes desconectados se conservan retention segundos y luego se eliminan.
+    Los broadcast no escriben en los sockets: encolan el mensaje en el outbox de cada
+    cliente (acotado a outbox_limit bytes) y la capa de I/O lo envia sin bloquear.
+    Con un RateLimiter, cada conexion que se cierra libera su lugar en el limite por IP.
     """
-    
-    def __init__(self):
-        self.clients = {}  # {client_id: {'conn': socket, 'addr': address, 'name': str, 'connected': bool}}
-        self.client_counter = 0
-        self.lock = threading.Lock()
-    
+
+    def __init__(self, file_cache=None, num_shards=16, retention=60.0, outbox_limit=256 * 1024,
+                 overflow="drop", rate_limiter=None):
+        self.shards = [_Shard() for _ in range(num_shards)]
+        self.num_shards = num_shards
+        self.retention = retention
+        self.outbox_limit = outbox_limit
+        self.overflow = overflow  # "drop" descarta el mensaje, "disconnect" desconecta al cliente lento
+        self._ids = itertools.count(1)
+        self.file_cache = file_cache  # FileCache opcional cuyas estadisticas se muestran junto a las de clientes
+        self.rate_limiter = rate_limiter  # RateLimiter opcional que cuenta las conexiones abiertas por IP
+
+    def _shard(self, client_id):
+        return self.shards[client_id % self.num_shards]
+
+    def _expire(self, shard, now):
+        """Elimina los clientes cerrados hace mas de retention segundos (con el lock del shard tomado)"""
+        limite = now - self.retention
+        while shard.closed and shard.closed[0][0] <= limite:
+            _, client_id = shard.closed.popleft()
+            shard.clients.pop(client_id, None)
+
+    def _mark_closed(self, shard, record, now):
+        record.connected = False
+        record.closed_at = now
+        shard.connected -= 1
+        shard.closed.append((now, record.client_id))
+        if record.outbox:
+            shard.dropped += len(record.outbox)
+        record.outbox = None
+        record.outbox_bytes = 0
+        record.flusher = None
+        shard.pending.discard(record.client_id)
+        if self.rate_limiter is not None:
+            self.rate_limiter.connection_closed(record.addr[0])
+
     def add_client(self, conn, addr):
         """Agrega un nuevo cliente al handler"""
-        with self.lock:
-            self.client_counter += 1
-            client_id = self.client_counter
-            client_name = f"Cliente-{client_id}"
-            
-            self.clients[client_id] = {
-                'conn': conn,
-                'addr': addr,
-                'name': client_name,
-                'connected': True,
-                'request_count': 0,
-                'last_activity': time.time()
-            }
-            
-            print(f"[{client_name}] CONEXION AGREGADA al handler")
-            return client_id, client_name
-    
+        client_id = next(self._ids)
+        record = ClientRecord(client_id, conn, addr)
+        shard = self._shard(client_id)
+        with shard.lock:
+            self._expire(shard, record.last_activity)
+            shard.clients[client_id] = record
+            shard.connected += 1
+            shard.total += 1
+        return client_id, record.name
+
     def update_client_activity(self, client_id):
-        """Actualiza la última actividad del cliente"""
-        with self.lock:
-            if client_id in self.clients:
-                self.clients[client_id]['last_activity'] = time.time()
-                self.clients[client_id]['request_count'] += 1
-    
+        """Actualiza la última actividad del cliente al empezar a atender un request"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is not None:
+                record.last_activity = time.time()
+                record.busy = True
+                record.request_count += 1
+                shard.requests += 1
+
+    def set_client_idle(self, client_id):
+        """Marca que termino la respuesta; desde aqui corre el tiempo de inactividad"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is not None:
+                record.last_activity = time.time()
+                record.busy = False
+
+    def set_client_conn(self, client_id, conn):
+        """Reemplaza la conexion registrada (p. ej. el socket TLS que envuelve al original)"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is not None and record.connected:
+                record.conn = conn
+
+    def set_flusher(self, client_id, flusher):
+        """La capa de I/O registra como vaciar el outbox de la conexion"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is not None and record.connected:
+                record.flusher = flusher
+
+    def take_output(self, client_id):
+        """Retira los mensajes pendientes de un cliente para enviarlos"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is None or not record.outbox:
+                return []
+            chunks = list(record.outbox)
+            record.outbox.clear()
+            record.outbox_bytes = 0
+            shard.pending.discard(client_id)
+            return chunks
+
+    def output_done(self, client_id, delivered, remainder=()):
+        """La capa de I/O informa cuantos mensajes envio y devuelve lo que no pudo enviar"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            shard.delivered += delivered
+            record = shard.clients.get(client_id)
+            if not remainder:
+                return
+            if record is None or not record.connected:
+                shard.dropped += len(remainder)
+                return
+            # Lo no enviado va adelante de lo que se haya encolado mientras tanto
+            record.outbox.extendleft(reversed(remainder))
+            record.outbox_bytes += sum(len(chunk) for chunk in remainder)
+            shard.pending.add(client_id)
+
+    def flush_pending(self):
+        """Reintenta el envio de los outbox que quedaron con datos (tick periodico)"""
+        flushers = []
+        for shard in self.shards:
+            with shard.lock:
+                for client_id in shard.pending:
+                    record = shard.clients.get(client_id)
+                    if record is not None and record.flusher is not None:
+                        flushers.append(record.flusher)
+        for flusher in flushers:
+            flusher()
+        return len(flushers)
+
+    def get_client_activity(self, client_id):
+        """(connected, busy, last_activity) sin copiar el registro, o None si ya no existe"""
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is None:
+                return None
+            return record.connected, record.busy, record.last_activity
+
+    def remove_client(self, client_id):
+        """Marca como cerrada una conexion que termino normalmente"""
+        shard = self._shard(client_id)
+        now = time.time()
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is not None and record.connected:
+                self._mark_closed(shard, record, now)
+                record.conn = None
+            self._expire(shard, now)
+
+    def expire_closed(self):
+        """Elimina de todos los shards los clientes cerrados fuera de la ventana de retencion"""
+        now = time.time()
+        for shard in self.shards:
+            with shard.lock:
+                self._expire(shard, now)
+
     def get_client_info(self, client_id):
         """Obtiene información de un cliente específico"""
-        with self.lock:
-            if client_id in self.clients:
-                return self.clients[client_id].copy()
-            return None
-    
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            return record.to_dict() if record is not None else None
+
     def get_all_clients(self):
         """Obtiene información de todos los clientes"""
-        with self.lock:
-            return {cid: info.copy() for cid, info in self.clients.items()}
-    
+        result = {}
+        for shard in self.shards:
+            with shard.lock:
+                for client_id, record in shard.clients.items():
+                    result[client_id] = record.to_dict()
+        return result
+
     def get_connected_clients(self):
         """Obtiene solo los clientes conectados"""
-        with self.lock:
-            connected = {cid: info for cid, info in self.clients.items() if info['connected']}
-            return connected
-    
-    def disconnect_client(self, client_id):
+        result = {}
+        for shard in self.shards:
+            with shard.lock:
+                for client_id, record in shard.clients.items():
+                    if record.connected:
+                        result[client_id] = record.to_dict()
+        return result
+
+    def disconnect_client(self, client_id, reason="handler"):
         """Desconecta un cliente específico"""
-        with self.lock:
-            if client_id in self.clients and self.clients[client_id]['connected']:
-                client_info = self.clients[client_id]
-                try:
-                    client_info['conn'].close()
-                    client_info['connected'] = False
-                    print(f"[{client_info['name']}] Desconectado por el handler")
-                    return True
-                except:
-                    return False
-        return False
-    
+        shard = self._shard(client_id)
+        with shard.lock:
+            record = shard.clients.get(client_id)
+            if record is None or not record.connected:
+                return False
+            conn = record.conn
+            self._mark_closed(shard, record, time.time())
+            record.conn = None
+
+        # Fuera del lock: shutdown despierta al hilo que esta bloqueado en recv() y el cierra el socket
+        try:
+            if isinstance(conn, socket.socket):
+                # Metodo de socket.socket: en un SSLSocket corta el TCP sin tocar el estado TLS
+                # que esta usando el hilo de la conexion
+                socket.socket.shutdown(conn, socket.SHUT_RDWR)
+            elif hasattr(conn, "shutdown"):
+                conn.shutdown(socket.SHUT_RDWR)
+            else:
+                conn.close()
+        except OSError:
+            pass
+        print(f"[{record.name}] Desconectado por {reason}")
+        return True
+
     def disconnect_all_clients(self):
         """Desconecta todos los clientes conectados"""
-        with self.lock:
-            disconnected_count = 0
-            clients_to_disconnect = []
-            
-            # Primero recolectar los clientes a desconectar
-            for client_id, client_info in self.clients.items():
-                if client_info['connected']:
-                    clients_to_disconnect.append(client_id)
-            
-            # Luego desconectarlos
-            for client_id in clients_to_disconnect:
-                if self.disconnect_client(client_id):
-                    disconnected_count += 1
-            
-            print(f"[CLIENTS_HANDLER] Desconectados {disconnected_count} clientes")
-            return disconnected_count
-    
+        # Primero recolectar los clientes a desconectar, sin mantener tomado ningun lock
+        clients_to_disconnect = []
+        for shard in self.shards:
+            with shard.lock:
+                clients_to_disconnect.extend(cid for cid, record in shard.clients.items() if record.connected)
+
+        # Luego desconectarlos (disconnect_client toma el lock de cada shard)
+        disconnected_count = 0
+        for client_id in clients_to_disconnect:
+            if self.disconnect_client(client_id):
+                disconnected_count += 1
+
+        print(f"[CLIENTS_HANDLER] Desconectados {disconnected_count} clientes")
+        return disconnected_count
+
+    def disconnect_idle_clients(self, reason="inactividad"):
+        """
+        Desconecta los clientes que esperan su proximo request en una conexion keep-alive
+        (ya atendieron al menos uno y no estan ocupados). Se usa al drenar el servidor.
+        """
+        idle = []
+        for shard in self.shards:
+            with shard.lock:
+                idle.extend(cid for cid, record in shard.clients.items()
+                            if record.connected and not record.busy and record.request_count > 0)
+        return sum(1 for client_id in idle if self.disconnect_client(client_id, reason))
+
+    def count_connected(self):
+        """Cantidad de clientes conectados (O(shards), sin recorrer los registros)"""
+        total = 0
+        for shard in self.shards:
+            with shard.lock:
+                total += shard.connected
+        return total
+
     def broadcast_message(self, message):
-        """Envía un mensaje a todos los clientes conectados"""
-        with self.lock:
-            sent_count = 0
-            for client_id, client_info in self.clients.items():
-                if client_info['connected']:
-                    try:
-                        # Formato de mensaje de broadcast
-                        broadcast_msg = f"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {len(message)}\r\n\r\n{message}"
-                        client_info['conn'].sendall(broadcast_msg.encode())
-                        sent_count += 1
-                    except:
-                        client_info['connected'] = False
-            return sent_count
-    
-    def get_stats(self):
-        """Obtiene estadísticas de los clientes"""
-        with self.lock:
-            total_clients = len(self.clients)
-            connected_clients = len([c for c in self.clients.values() if c['connected']])
-            total_requests = sum(client['request_count'] for client in self.clients.values())
-            
-            stats = {
-                'total_clients': total_clients,
-                'connected_clients': connected_clients,
-                'disconnected_clients': total_clients - connected_clients,
-                'total_requests': total_requests,
-                'clients_info': []
-            }
-            
-            for client_id, client_info in self.clients.items():
-                stats['clients_info'].append({
-                    'client_id': client_id,
-                    'name': client_info['name'],
-                    'address': f"{client_info['addr'][0]}:{client_info['addr'][1]}",
-                    'connected': client_info['connected'],
-                    'request_count': client_info['request_count'],
-                    'last_activity': time.strftime('%H:%M:%S', time.localtime(client_info['last_activity']))
-                })
-            
-            return stats
-    
-    def print_stats(self):
+        """
+        Encola un mensaje para todos los clientes conectados y devuelve cuantos lo recibieron
+        en su outbox, cuantos lo descartaron y cuantos se desconectaron por superar outbox_limit.
+        El mensaje se codifica una sola vez y todos los outbox comparten el mismo buffer.
+        """
+        body = message.encode()
+        payload = (
+            f"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+
+        queued = dropped = 0
+        flushers = []
+        overflowed = []
+        for shard in self.shards:
+            with shard.lock:
+                for record in shard.clients.values():
+                    if not record.connected:
+                        continue
+                    if record.outbox_bytes + len(payload) > self.outbox_limit:
+                        # Cliente que no lee: su outbox alcanzo el limite
+                        if self.overflow == "disconnect":
+                            overflowed.append(record.client_id)
+                        else:
+                            shard.dropped += 1
+                            dropped += 1
+                        continue
+                    if record.outbox is None:
+                        record.outbox = deque()
+                    record.outbox.append(payload)
+                    record.outbox_bytes += len(payload)
+                    shard.pending.add(record.client_id)
+                    queued += 1
+                    if record.flusher is not None:
+                        flushers.append(record.flusher)
+
+        # Fuera de los locks: cada flusher envia sin bloquear o lo deja para su hilo/event loop
+        for flusher in flushers:
+            flusher()
+        disconnected = 0
+        for client_id in overflowed:
+            if self.disconnect_client(client_id, reason="outbox lleno"):
+                disconnected += 1
+
+        return {'queued': queued, 'dropped': dropped, 'disconnected': disconnected}
+
+    def get_stats(self, include_clients=False, limit=50):
+        """
+        Obtiene estadísticas de los clientes. Los totales salen de contadores
+        acumulados (O(shards)); el detalle por cliente es opcional y acotado por limit.
+        """
+        connected_clients = 0
+        total_clients = 0
+        total_requests = 0
+        tracked_clients = 0
+        pending_outbox = delivered = dropped = 0
+        for shard in self.shards:
+            with shard.lock:
+                connected_clients += shard.connected
+                total_clients += shard.total
+                total_requests += shard.requests
+                tracked_clients += len(shard.clients)
+                pending_outbox += len(shard.pending)
+                delivered += shard.delivered
+                dropped += shard.dropped
+
+        stats = {
+            'total_clients': total_clients,
+            'connected_clients': connected_clients,
+            'disconnected_clients': total_clients - connected_clients,
+            'tracked_clients': tracked_clients,
+            'total_requests': total_requests,
+            'broadcast': {
+                'pending_clients': pending_outbox,
+                'delivered': delivered,
+                'dropped': dropped
+            },
+            'clients_info': []
+        }
+
+        if include_clients:
+            for shard in self.shards:
+                with shard.lock:
+                    records = list(shard.clients.values())
+                for record in records:
+                    stats['clients_info'].append({
+                        'client_id': record.client_id,
+                        'name': record.name,
+                        'address': f"{record.addr[0]}:{record.addr[1]}",
+                        'connected': record.connected,
+                        'request_count': record.request_count,
+                        'last_activity': record.last_activity
+                    })
+            # Los mas recientes primero
+            stats['clients_info'].sort(key=lambda c: c['last_activity'], reverse=True)
+            del stats['clients_info'][limit:]
+            for client_info in stats['clients_info']:
+                client_info['last_activity'] = time.strftime('%H:%M:%S', time.localtime(client_info['last_activity']))
+
+        if self.file_cache is not None:
+            stats['cache'] = self.file_cache.get_stats()
+        return stats
+
+    def print_stats(self, limit=20):
         """Imprime estadísticas de los clientes"""
-        stats = self.get_stats()
+        stats = self.get_stats(include_clients=True, limit=limit)
         print("\n" + "=" * 60)
         print("ESTADISTICAS DE CLIENTES")
         print("=" * 60)
         print(f"Clientes totales: {stats['total_clients']}")
         print(f"Clientes conectados: {stats['connected_clients']}")
         print(f"Clientes desconectados: {stats['disconnected_clients']}")
+        print(f"Clientes en el registro: {stats['tracked_clients']} (retencion {self.retention:.0f}s)")
         print(f"Total de requests: {stats['total_requests']}")
-        print("\nClientes detallados:")
-        
+        broadcast = stats['broadcast']
+        print(f"Broadcast: {broadcast['delivered']} entregados, {broadcast['dropped']} descartados, "
+              f"{broadcast['pending_clients']} clientes con envios pendientes")
+        print(f"\nClientes detallados (ultimos {limit} con actividad):")
+
         for client_info in stats['clients_info']:
             status = "CONECTADO" if client_info['connected'] else "DESCONECTADO"
             print(f"  {client_info['name']} ({client_info['address']}) - {status}")
             print(f"    Requests: {client_info['request_count']}, Ultima actividad: {client_info['last_activity']}")
-        
-        print("=" * 60)
\ No newline at end of file
+
+        if 'cache' in stats:
+            cache = stats['cache']
+            print("\nCache de archivos:")
+            print(f"  Entradas: {cache['entries']}, Bytes: {cache['bytes']}/{cache['max_bytes']}")
+            print(f"  Aciertos: {cache['hits']}, Fallos: {cache['misses']}, Expulsiones: {cache['evictions']} "
+                  f"(tasa de acierto {cache['hit_ratio']:.0%})")
+
+        print("=" * 60)
@@ -0,0 +1,281 @@
+import html
+import json
+import os
+import stat
+import tarfile
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from http_utils import http_date
+from static_index import canonical_path
+
+FORMATS = ("html", "json", "tar")
+# Filas que se renderizan juntas en cada bloque del cuerpo chunked
+ROWS_PER_CHUNK = 256
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+class ListingPage:
+    """Una pagina del listado: el cuerpo si estaba en la cache, o el generador que la renderiza"""
+
+    __slots__ = ('etag', 'mtime', 'last_modified', 'body', 'chunks')
+
+    def __init__(self, etag, mtime_ns, body=None, chunks=None):
+        self.etag = etag
+        self.mtime = mtime_ns / 1e9
+        self.last_modified = http_date(self.mtime)
+        self.body = body
+        self.chunks = chunks
+
+class DirectoryListing:
+    """
+    Listados de los directorios de base_dir (HTML o JSON, paginados) y descarga de un
+    subdirectorio como tar generado al vuelo. Cada directorio se lee una vez con os.scandir
+    y su contenido ordenado se guarda mientras no cambie su mtime; las paginas renderizadas
+    van a una cache LRU de max_bytes validada con el mismo mtime. Crear, borrar o renombrar
+    una entrada cambia el mtime del directorio; modificar un archivo no, por eso el tamaño
+    mostrado puede quedar atrasado hasta el proximo cambio del directorio.
+    """
+
+    def __init__(self, base_dir, page_size=1000, max_bytes=8 * 1024 * 1024, max_dirs=16):
+        self.base_dir = base_dir
+        self.page_size = page_size
+        self.max_bytes = max_bytes
+        self.max_dirs = max_dirs
+        self.dirs = OrderedDict()  # {ruta: (mtime_ns, [(nombre, es_directorio, tamaño, mtime)])}
+        self.pages = OrderedDict()  # {(ruta, pagina, formato): (mtime_ns, cuerpo)}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.scans = 0
+        self.tars = 0
+
+    def resolve(self, uri):
+        """(ruta en disco, ruta URL terminada en /) de un directorio publicado, o None"""
+        try:
+            path = canonical_path(uri)
+        except UnicodeDecodeError:
+            return None
+        if path is None or any(segmento.startswith(".") for segmento in path.split("/") if segmento):
+            return None
+        base = os.path.realpath(self.base_dir)
+        directorio = os.path.realpath(os.path.join(base, path.lstrip("/")))
+        # Un enlace simbolico no puede sacar el listado fuera del directorio base
+        if os.path.commonpath([base, directorio]) != base or not os.path.isdir(directorio):
+            return None
+        return directorio, path.rstrip("/") + "/"
+
+    def _entries(self, directorio, mtime_ns):
+        """Contenido ordenado del directorio (subdirectorios primero), leido de nuevo solo si cambio su mtime"""
+        with self.lock:
+            cached = self.dirs.get(directorio)
+            if cached is not None and cached[0] == mtime_ns:
+                self.dirs.move_to_end(directorio)
+                return cached[1]
+
+        base = os.path.realpath(self.base_dir)
+        entries = []
+        with os.scandir(directorio) as it:
+            for item in it:
+                # Los ocultos (y las subidas temporales) no se listan, igual que en el indice
+                if item.name.startswith("."):
+                    continue
+                try:
+                    if item.is_symlink():
+                        destino = os.path.realpath(item.path)
+                        if os.path.commonpath([base, destino]) != base:
+                            continue
+                    st = item.stat()
+                except OSError:
+                    continue
+                es_dir = stat.S_ISDIR(st.st_mode)
+                if not es_dir and not stat.S_ISREG(st.st_mode):
+                    continue
+                entries.append((item.name, es_dir, 0 if es_dir else st.st_size, st.st_mtime))
+        entries.sort(key=lambda entry: (not entry[1], entry[0]))
+
+        with self.lock:
+            self.scans += 1
+            self.dirs[directorio] = (mtime_ns, entries)
+            self.dirs.move_to_end(directorio)
+            while len(self.dirs) > self.max_dirs:
+                self.dirs.popitem(last=False)
+        return entries
+
+    def preload(self, directorio):
+        """Lee el directorio si cambio desde la ultima vez (el motor async lo llama desde un hilo)"""
+        try:
+            self._entries(directorio, os.stat(directorio).st_mtime_ns)
+        except OSError:
+            pass
+
+    def page(self, directorio, url, number, formato):
+        """ListingPage de la pagina number (desde 1) del listado en formato html o json; None si no existe"""
+        try:
+            mtime_ns = os.stat(directorio).st_mtime_ns
+        except OSError:
+            # Borrado (o sin permisos) despues de resolve()
+            return None
+        etag = f'W/"{mtime_ns:x}-{number}-{formato}"'
+        key = (directorio, number, formato)
+        with self.lock:
+            cached = self.pages.get(key)
+            if cached is not None and cached[0] == mtime_ns:
+                self.pages.move_to_end(key)
+                self.hits += 1
+                return ListingPage(etag, mtime_ns, body=cached[1])
+            self.misses += 1
+
+        try:
+            entries = self._entries(directorio, mtime_ns)
+        except OSError:
+            return None
+        pages = max(1, -(-len(entries) // self.page_size))
+        if not 1 <= number <= pages:
+            return None
+        inicio = (number - 1) * self.page_size
+        rows = entries[inicio:inicio + self.page_size]
+        render = self._render_json if formato == "json" else self._render_html
+        return ListingPage(etag, mtime_ns, chunks=self._caching(key, mtime_ns,
+                                                                render(url, rows, number, pages, len(entries))))
+
+    def _caching(self, key, mtime_ns, chunks):
+        """Entrega los bloques a medida que se renderizan y guarda la pagina si se envio completa"""
+        partes = []
+        for chunk in chunks:
+            partes.append(chunk)
+            yield chunk
+        body = b"".join(partes)
+        if len(body) > self.max_bytes // 4:
+            return
+        with self.lock:
+            anterior = self.pages.pop(key, None)
+            if anterior is not None:
+                self.total_bytes -= len(anterior[1])
+            self.pages[key] = (mtime_ns, body)
+            self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes:
+                _, (_, expulsado) = self.pages.popitem(last=False)
+                self.total_bytes -= len(expulsado)
+
+    def _render_html(self, url, rows, number, pages, total):
+        titulo = html.escape(url)
+        navegacion = []
+        if number > 1:
+            navegacion.append(f'<a href="?page={number - 1}">&laquo; anterior</a>')
+        navegacion.append(f"pagina {number} de {pages} ({total} entradas)")
+        if number < pages:
+            navegacion.append(f'<a href="?page={number + 1}">siguiente &raquo;</a>')
+        navegacion = " | ".join(navegacion)
+        cabecera = (
+            f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Indice de {titulo}</title></head>\n"
+            f"<body><h1>Indice de {titulo}</h1>\n<p>{navegacion} | "
+            f"<a href=\"?format=json&amp;page={number}\">JSON</a> | <a href=\"?format=tar\">descargar .tar</a></p>\n"
+            "<table><tr><th>Nombre</th><th>Tamaño</th><th>Modificado</th></tr>\n"
+        )
+        if url != "/":
+            cabecera += '<tr><td><a href="../">../</a></td><td></td><td></td></tr>\n'
+        yield cabecera.encode()
+        for inicio in range(0, len(rows), ROWS_PER_CHUNK):
+            lineas = []
+            for nombre, es_dir, size, mtime in rows[inicio:inicio + ROWS_PER_CHUNK]:
+                sufijo = "/" if es_dir else ""
+                lineas.append(
+                    f'<tr><td><a href="{quote(url + nombre)}{sufijo}">{html.escape(nombre)}{sufijo}</a></td>'
+                    f"<td>{'-' if es_dir else size}</td><td>{http_date(mtime)}</td></tr>\n"
+                )
+            yield "".join(lineas).encode()
+        yield f"</table>\n<p>{navegacion}</p></body></html>\n".encode()
+
+    def _render_json(self, url, rows, number, pages, total):
+        yield (f'{{"path": {json.dumps(url)}, "page": {number}, "pages": {pages}, "total": {total}, '
+               f'"entries": [').encode()
+        separador = ""
+        for inicio in range(0, len(rows), ROWS_PER_CHUNK):
+            lineas = []
+            for nombre, es_dir, size, mtime in rows[inicio:inicio + ROWS_PER_CHUNK]:
+                lineas.append(separador + json.dumps({
+                    'name': nombre,
+                    'type': "directory" if es_dir else "file",
+                    'size': size,
+                    'mtime': int(mtime)
+                }))
+                separador = ", "
+            yield "".join(lineas).encode()
+        yield b"]}"
+
+    def tar_stream(self, directorio, prefijo):
+        """
+        Partes de un tar (formato PAX) del arbol de directorio, generadas a medida que se envian:
+        bytes con los headers y el relleno, y (archivo, offset, count) para el contenido, que
+        el llamador transmite con sendfile antes de pedir la siguiente parte. Solo hay en
+        memoria la pila de directorios pendientes y un archivo abierto a la vez.
+        """
+        with self.lock:
+            self.tars += 1
+        base = os.path.realpath(self.base_dir)
+        pendientes = [(directorio, prefijo)]
+        relleno_anterior = b""
+        while pendientes:
+            ruta, nombre_tar = pendientes.pop()
+            try:
+                it = os.scandir(ruta)
+            except OSError:
+                continue
+            with it:
+                items = sorted(it, key=lambda item: item.name)
+            info = tarfile.TarInfo(nombre_tar)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            try:
+                info.mtime = int(os.stat(ruta).st_mtime)
+            except OSError:
+                pass
+            yield relleno_anterior + info.tobuf(tarfile.PAX_FORMAT)
+            relleno_anterior = b""
+            subdirectorios = []
+            for item in items:
+                if item.name.startswith("."):
+                    continue
+                try:
+                    if item.is_symlink():
+                        # Los enlaces se siguen solo dentro del directorio base y nunca a directorios
+                        destino = os.path.realpath(item.path)
+                        if os.path.commonpath([base, destino]) != base or item.is_dir():
+                            continue
+                    if item.is_dir():
+                        subdirectorios.append((item.path, f"{nombre_tar}/{item.name}"))
+                        continue
+                    if not item.is_file():
+                        continue
+                    f = open(item.path, "rb")
+                except OSError:
+                    continue
+                with f:
+                    # El tamaño del header es el del archivo abierto; sendfile envia exactamente esos bytes
+                    st = os.fstat(f.fileno())
+                    info = tarfile.TarInfo(f"{nombre_tar}/{item.name}")
+                    info.size = st.st_size
+                    info.mtime = int(st.st_mtime)
+                    info.mode = 0o644
+                    yield relleno_anterior + info.tobuf(tarfile.PAX_FORMAT)
+                    if st.st_size:
+                        yield (f, 0, st.st_size)
+                relleno_anterior = b"\0" * (-st.st_size % TAR_BLOCK)
+            pendientes.extend(reversed(subdirectorios))
+        # Fin del archivo: dos bloques en cero
+        yield relleno_anterior + b"\0" * (2 * TAR_BLOCK)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'cached_pages': len(self.pages),
+                'cached_bytes': self.total_bytes,
+                'cached_dirs': len(self.dirs),
+                'hits': self.hits,
+                'misses': self.misses,
+                'scans': self.scans,
+                'tars': self.tars,
+                'page_size': self.page_size
+            }
@@ -1,91 +1,403 @@
+import os
+import time
+import uuid
+
+from http_utils import http_date
+
+# Tamaño de bloque cuando no se puede usar sendfile (memoria constante por conexion)
+CHUNK_SIZE = 64 * 1024
+
+SERVER_NAME = "Lab02-RedesDatos/1.0"
+
+# Bloques de header inmutables: se arman una sola vez como bytes
+STATUS_LINES = {
+    code: f"HTTP/1.1 {code} {reason}\r\n".encode()
+    for code, reason in (
+        (100, "Continue"), (200, "OK"), (201, "Created"), (204, "No Content"), (206, "Partial Content"),
+        (304, "Not Modified"), (400, "Bad Request"), (404, "Not Found"), (405, "Method Not Allowed"), (411, "Length Required"), (413, "Payload Too Large"), (416, "Range Not Satisfiable"),
+        (429, "Too Many Requests"), (431, "Request Header Fields Too Large"), (500, "Internal Server Error"),
+        (501, "Not Implemented"), (503, "Service Unavailable"), (505, "HTTP Version Not Supported")
+    )
+}
+CONNECTION_HEADERS = {
+    True: b"Connection: keep-alive\r\n\r\n",
+    False: b"Connection: close\r\n\r\n"
+}
+TEXT_PLAIN = b"Content-Type: text/plain; charset=utf-8\r\n"
+ACCEPT_RANGES = b"Accept-Ranges: bytes\r\n"
+TRANSFER_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+LAST_CHUNK = b"0\r\n\r\n"
+CONTINUE = STATUS_LINES[100] + b"\r\n"
+EMPTY_BODY = b"Content-Length: 0\r\n"
+
+# (segundo, b"Date: ...\r\nServer: ...\r\n"): el header Date solo cambia una vez por segundo
+_date_cache = (0, b"")
+
+def date_headers():
+    """Headers Date y Server del segundo actual, reutilizados por todas las respuestas de ese segundo"""
+    global _date_cache
+    now = int(time.time())
+    second, headers = _date_cache
+    if second != now:
+        headers = f"Date: {http_date(now)}\r\nServer: {SERVER_NAME}\r\n".encode()
+        # Reemplazar la tupla completa es atomico: otro hilo ve la vieja o la nueva
+        _date_cache = (now, headers)
+    return headers
+
+def text_headers(status, body):
+    """Status line, Content-Type y Content-Length de una respuesta de texto"""
+    return STATUS_LINES[status] + TEXT_PLAIN + b"Content-Length: %d\r\n" % len(body)
+
+def _static_response(status, message):
+    """Cuerpo fijo de un error y su bloque de headers, armados al importar el modulo"""
+    body = message.encode()
+    return text_headers(status, body), body
+
+_BAD_REQUEST = _static_response(400, "Solicitud mal formada")
+_LENGTH_REQUIRED = _static_response(411, "Falta Content-Length (o Transfer-Encoding: chunked) en el cuerpo")
+_PAYLOAD_TOO_LARGE = _static_response(413, "Cuerpo del request demasiado grande")
+_HEADERS_TOO_LARGE = _static_response(431, "Headers del request demasiado grandes")
+_TOO_MANY_REQUESTS = _static_response(429, "Demasiados requests, intente nuevamente mas tarde.")
+_SERVICE_UNAVAILABLE = _static_response(503, "Servidor saturado, intente nuevamente mas tarde.")
+
+def send_buffers(conn, buffers):
+    """
+    Envia varios buffers (headers y cuerpo) en una sola llamada con sendmsg
+    (scatter/gather), sin concatenarlos. Si la conexion no tiene sendmsg se unen y se usa sendall.
+    """
+    sendmsg = getattr(conn, "sendmsg", None)
+    if sendmsg is None:
+        conn.sendall(b"".join(buffers))
+        return
+    buffers = [b for b in buffers if b]
+    try:
+        while buffers:
+            sent = sendmsg(buffers)
+            # Envio parcial: descartar los buffers completos y recortar el primero pendiente
+            while sent:
+                first = len(buffers[0])
+                if sent >= first:
+                    sent -= first
+                    buffers.pop(0)
+                else:
+                    buffers[0] = memoryview(buffers[0])[sent:]
+                    sent = 0
+    except NotImplementedError:
+        # Sockets TLS no implementan sendmsg
+        conn.sendall(b"".join(buffers))
+
+def send_file(conn, f, offset, count):
+    """Envia count bytes del archivo desde offset sin cargarlo completo en memoria"""
+    if hasattr(conn, "sendfile"):
+        # socket.sendfile usa os.sendfile (copia cero) y si no esta disponible cae a send() por bloques
+        return conn.sendfile(f, offset, count)
+
+    f.seek(offset)
+    sent = 0
+    while sent < count:
+        chunk = f.read(min(CHUNK_SIZE, count - sent))
+        if not chunk:
+            break
+        conn.sendall(chunk)
+        sent += len(chunk)
+    return sent
+
+def chunked(parts):
+    """Enmarca las partes de un cuerpo (bytes o (archivo, offset, count)) en chunks de HTTP/1.1"""
+    for part in parts:
+        if isinstance(part, tuple):
+            yield b"%x\r\n" % part[2]
+            yield part
+            yield b"\r\n"
+        elif part:
+            yield b"%x\r\n%s\r\n" % (len(part), part)
+    yield LAST_CHUNK
+
+def send_stream(conn, parts):
+    """
+    Envia un cuerpo generado de a partes: bytes, o (archivo, offset, count) que se transmite
+    con sendfile. La parte siguiente se pide recien despues de enviar la anterior.
+    """
+    sendstream = getattr(conn, "sendstream", None)
+    if sendstream is not None:
+        # Motor async: las partes se consumen en el event loop a medida que el cliente lee
+        return sendstream(parts)
+    for part in parts:
+        if isinstance(part, tuple):
+            send_file(conn, *part)
+        else:
+            conn.sendall(part)
+
 class HTTPErrorHandler:
     """
-    Clase dedicada para el manejo de errores HTTP en el servidor
+    Clase dedicada para el manejo de errores HTTP en el servidor.
+    Las respuestas se arman con bloques de bytes pre-renderizados y se envian con send_buffers.
     """
-    
-    @staticmethod
-    def bad_request(conn, message="Solicitud mal formada"):
-        body = message
-        response = (
-            "HTTP/1.1 400 Bad Request\r\n"
-            "Content-Type: text/plain; charset=utf-8\r\n"
-            f"Content-Length: {len(body.encode())}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            f"{body}"
-        )
-        conn.sendall(response.encode())
-        conn.close()
+
+    @staticmethod
+    def _error(conn, headers, body, keep_alive=False, head=False):
+        # La respuesta a HEAD lleva los mismos headers (Content-Length incluido) sin el cuerpo
+        send_buffers(conn, (headers, date_headers(), CONNECTION_HEADERS[keep_alive], b"" if head else body))
+        if not keep_alive:
+            conn.close()
+
+    @staticmethod
+    def bad_request(conn, message=None):
+        headers, body = _BAD_REQUEST if message is None else _static_response(400, message)
+        HTTPErrorHandler._error(conn, headers, body)
         return "400 Bad Request"
 
     @staticmethod
-    def not_found(conn, filename):
-        body = f"Recurso no encontrado: {filename}"
-        response = (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain; charset=utf-8\r\n"
-            f"Content-Length: {len(body.encode())}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            f"{body}"
-        )
-        conn.sendall(response.encode())
-        conn.close()
+    def length_required(conn):
+        headers, body = _LENGTH_REQUIRED
+        HTTPErrorHandler._error(conn, headers, body)
+        return "411 Length Required"
+
+    @staticmethod
+    def payload_too_large(conn, message=None):
+        headers, body = _PAYLOAD_TOO_LARGE if message is None else _static_response(413, message)
+        HTTPErrorHandler._error(conn, headers, body)
+        return "413 Payload Too Large"
+
+    @staticmethod
+    def request_header_fields_too_large(conn, message=None):
+        headers, body = _HEADERS_TOO_LARGE if message is None else _static_response(431, message)
+        HTTPErrorHandler._error(conn, headers, body)
+        return "431 Request Header Fields Too Large"
+
+    @staticmethod
+    def not_found(conn, filename, keep_alive=False, head=False):
+        body = f"Recurso no encontrado: {filename}".encode()
+        # En conexiones persistentes un 404 no obliga a cerrar el socket
+        HTTPErrorHandler._error(conn, text_headers(404, body), body, keep_alive, head)
         return f"404 Not Found - Archivo {filename} no existe"
 
     @staticmethod
-    def method_not_implemented(conn, method):
-        body = f"Metodo no implementado: {method} (solo GET esta soportado)."
-        response = (
-            "HTTP/1.1 501 Not Implemented\r\n"
-            "Content-Type: text/plain; charset=utf-8\r\n"
-            f"Content-Length: {len(body.encode())}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            f"{body}"
-        )
-        conn.sendall(response.encode())
-        conn.close()
+    def method_not_implemented(conn, method, allow):
+        body = f"Metodo no implementado: {method} (soportados: {allow}).".encode()
+        HTTPErrorHandler._error(conn, text_headers(501, body), body)
         return f"501 Not Implemented - Metodo {method} no soportado"
 
+    @staticmethod
+    def method_not_allowed(conn, method, allow, keep_alive=False):
+        body = f"Metodo no permitido: {method}".encode()
+        HTTPErrorHandler._error(conn, text_headers(405, body) + f"Allow: {allow}\r\n".encode(), body, keep_alive)
+        return f"405 Method Not Allowed - {method}"
+
+    @staticmethod
+    def options_response(conn, allow, keep_alive=False):
+        send_buffers(conn, (STATUS_LINES[204], f"Allow: {allow}\r\n".encode(), date_headers(),
+                            CONNECTION_HEADERS[keep_alive]))
+        return f"204 No Content - Allow: {allow}"
+
+    @staticmethod
+    def continue_response(conn):
+        """Respuesta intermedia a Expect: 100-continue: el cliente puede enviar el cuerpo"""
+        send_buffers(conn, (CONTINUE,))
+
+    @staticmethod
+    def upload_response(conn, uri, created, size, keep_alive=False):
+        """201 Created con Location si el archivo es nuevo, 204 No Content si reemplazo a uno existente"""
+        if created:
+            headers = STATUS_LINES[201] + f"Location: {uri}\r\n".encode() + EMPTY_BODY
+        else:
+            headers = STATUS_LINES[204]
+        send_buffers(conn, (headers, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        return f"{'201 Created' if created else '204 No Content'} - {uri} ({size} bytes)"
+
     @staticmethod
     def http_version_not_supported(conn, version):
-        body = f"Version HTTP no soportada: {version}"
-        response = (
-            "HTTP/1.1 505 HTTP Version Not Supported\r\n"
-            "Content-Type: text/plain; charset=utf-8\r\n"
-            f"Content-Length: {len(body.encode())}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            f"{body}"
-        )
-        conn.sendall(response.encode())
-        conn.close()
+        body = f"Version HTTP no soportada: {version}".encode()
+        HTTPErrorHandler._error(conn, text_headers(505, body), body)
         return f"505 HTTP Version Not Supported - Version {version}"
 
     @staticmethod
     def internal_server_error(conn, error_message):
-        body = f"Error interno del servidor: {error_message}"
-        response = (
-            "HTTP/1.1 500 Internal Server Error\r\n"
-            "Content-Type: text/plain; charset=utf-8\r\n"
-            f"Content-Length: {len(body.encode())}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            f"{body}"
-        )
-        conn.sendall(response.encode())
-        conn.close()
+        body = f"Error interno del servidor: {error_message}".encode()
+        HTTPErrorHandler._error(conn, text_headers(500, body), body)
         return f"500 Internal Server Error - {error_message}"
 
     @staticmethod
-    def success_response(conn, content_type, body_bytes):
-        header = (
-            "HTTP/1.1 200 OK\r\n"
+    def success_response(conn, content_type, body_bytes, keep_alive=False, head=False):
+        headers = STATUS_LINES[200] + f"Content-Type: {content_type}\r\nContent-Length: {len(body_bytes)}\r\n".encode()
+        send_buffers(conn, (headers, date_headers(), CONNECTION_HEADERS[keep_alive], b"" if head else body_bytes))
+        return "200 OK"
+
+    @staticmethod
+    def cached_response(conn, entry, keep_alive=False):
+        """Respuesta 200 desde el cache: header pre-armado + cuerpo en memoria, sin copiarlos"""
+        send_buffers(conn, (entry.header, date_headers(), CONNECTION_HEADERS[keep_alive], entry.body))
+        return f"200 OK - {entry.size} bytes (cache)"
+
+    @staticmethod
+    def _content_headers(content_type, size, etag, last_modified, encoding, vary):
+        # Un archivo precomprimido no admite rangos sobre el contenido original
+        extra_headers = f"Content-Encoding: {encoding}\r\n" if encoding else "Accept-Ranges: bytes\r\n"
+        if vary:
+            extra_headers += "Vary: Accept-Encoding\r\n"
+        if etag is not None:
+            extra_headers += f"ETag: {etag}\r\n"
+        if last_modified is not None:
+            extra_headers += f"Last-Modified: {last_modified}\r\n"
+        return (
             f"Content-Type: {content_type}\r\n"
-            f"Content-Length: {len(body_bytes)}\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-        )
-        conn.sendall(header.encode() + body_bytes)
-        return "200 OK"
\ No newline at end of file
+            f"Content-Length: {size}\r\n"
+            f"{extra_headers}"
+        ).encode()
+
+    @staticmethod
+    def head_response(conn, content_type, size, keep_alive=False, etag=None, last_modified=None,
+                      encoding=None, vary=False):
+        """Headers de la respuesta 200 sin el cuerpo (HEAD)"""
+        header = HTTPErrorHandler._content_headers(content_type, size, etag, last_modified, encoding, vary)
+        send_buffers(conn, (STATUS_LINES[200], header, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        return f"200 OK - HEAD {size} bytes"
+
+    @staticmethod
+    def cached_head(conn, entry, keep_alive=False):
+        """HEAD desde el cache: el mismo header pre-armado del GET, sin el cuerpo"""
+        send_buffers(conn, (entry.header, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        return f"200 OK - HEAD {entry.size} bytes (cache)"
+
+    @staticmethod
+    def file_response(conn, content_type, f, keep_alive=False, etag=None, last_modified=None,
+                      encoding=None, vary=False):
+        """Respuesta 200 que transmite el archivo abierto f directamente al socket"""
+        size = os.fstat(f.fileno()).st_size
+        header = HTTPErrorHandler._content_headers(content_type, size, etag, last_modified, encoding, vary)
+        send_buffers(conn, (STATUS_LINES[200], header, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        send_file(conn, f, 0, size)
+        return f"200 OK - {size} bytes"
+
+    @staticmethod
+    def buffer_response(conn, content_type, body, keep_alive=False, etag=None, last_modified=None, vary=False):
+        """Respuesta 200 con un cuerpo en memoria (p. ej. la vista de un archivo mapeado), sin copiarlo"""
+        header = HTTPErrorHandler._content_headers(content_type, len(body), etag, last_modified, None, vary)
+        send_buffers(conn, (STATUS_LINES[200], header, date_headers(), CONNECTION_HEADERS[keep_alive], body))
+        return f"200 OK - {len(body)} bytes (mmap)"
+
+    @staticmethod
+    def stream_response(conn, content_type, parts, keep_alive=False, etag=None, last_modified=None,
+                        chunked_encoding=True, extra_headers="", head=False):
+        """
+        Respuesta 200 de largo desconocido generada mientras se envia: chunked en HTTP/1.1 y,
+        para clientes HTTP/1.0, delimitada por el cierre de la conexion
+        """
+        if etag is not None:
+            extra_headers += f"ETag: {etag}\r\n"
+        if last_modified is not None:
+            extra_headers += f"Last-Modified: {last_modified}\r\n"
+        header = STATUS_LINES[200] + f"Content-Type: {content_type}\r\n{extra_headers}".encode()
+        if chunked_encoding:
+            header += TRANSFER_CHUNKED
+            parts = chunked(parts)
+        else:
+            keep_alive = False
+        send_buffers(conn, (header, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        if head:
+            parts.close()
+        else:
+            send_stream(conn, parts)
+        return f"200 OK - {'chunked' if chunked_encoding else 'hasta el cierre'}"
+
+    @staticmethod
+    def partial_content(conn, content_type, source, size, ranges, keep_alive=False, etag=None, last_modified=None):
+        """
+        Respuesta 206 para uno o varios rangos (inicio, fin) inclusivos.
+        source puede ser el cuerpo en memoria o el archivo abierto (se envia con sendfile).
+        """
+        validators = ""
+        if etag is not None:
+            validators += f"ETag: {etag}\r\n"
+        if last_modified is not None:
+            validators += f"Last-Modified: {last_modified}\r\n"
+        en_memoria = isinstance(source, (bytes, bytearray, memoryview))
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            count = end - start + 1
+            header = (
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {count}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n"
+                f"{validators}"
+            ).encode()
+            buffers = [STATUS_LINES[206], header, ACCEPT_RANGES, date_headers(), CONNECTION_HEADERS[keep_alive]]
+            if en_memoria:
+                # El rango viaja en el mismo sendmsg que los headers, como vista sin copia
+                buffers.append(memoryview(source)[start:start + count])
+                send_buffers(conn, buffers)
+            else:
+                send_buffers(conn, buffers)
+                send_file(conn, source, start, count)
+            return f"206 Partial Content - bytes {start}-{end}/{size}"
+
+        # Varios rangos: multipart/byteranges, la longitud total se calcula antes de enviar
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n"
+                "\r\n"
+            ).encode()
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode()
+        length = sum(len(h) for h in part_headers) + len(closing)
+        length += sum(end - start + 1 for start, end in ranges)
+
+        header = (
+            f"Content-Type: multipart/byteranges; boundary={boundary}\r\n"
+            f"Content-Length: {length}\r\n"
+            f"{validators}"
+        ).encode()
+        buffers = [STATUS_LINES[206], header, ACCEPT_RANGES, date_headers(), CONNECTION_HEADERS[keep_alive]]
+        if en_memoria:
+            # Todo el multipart en un solo sendmsg: headers de cada parte y vistas del cuerpo
+            vista = memoryview(source)
+            for part_header, (start, end) in zip(part_headers, ranges):
+                buffers.append(part_header)
+                buffers.append(vista[start:end + 1])
+            buffers.append(closing)
+            send_buffers(conn, buffers)
+        else:
+            send_buffers(conn, buffers)
+            for part_header, (start, end) in zip(part_headers, ranges):
+                conn.sendall(part_header)
+                send_file(conn, source, start, end - start + 1)
+            conn.sendall(closing)
+        return f"206 Partial Content - {len(ranges)} rangos"
+
+    @staticmethod
+    def range_not_satisfiable(conn, size, keep_alive=False):
+        body = f"Rango no satisfacible (tamaño del recurso: {size} bytes)".encode()
+        headers = text_headers(416, body) + b"Content-Range: bytes */%d\r\n" % size
+        HTTPErrorHandler._error(conn, headers, body, keep_alive)
+        return f"416 Range Not Satisfiable - tamaño {size}"
+
+    @staticmethod
+    def not_modified(conn, etag, last_modified, keep_alive=False, validators=None):
+        """
+        Respuesta 304 sin cuerpo: el cliente ya tiene la version actual.
+        validators es el bloque ETag/Last-Modified ya armado (entradas del cache).
+        """
+        if validators is None:
+            validators = f"ETag: {etag}\r\nLast-Modified: {last_modified}\r\n".encode()
+        send_buffers(conn, (STATUS_LINES[304], validators, date_headers(), CONNECTION_HEADERS[keep_alive]))
+        if not keep_alive:
+            conn.close()
+        return f"304 Not Modified - ETag {etag}"
+
+    @staticmethod
+    def too_many_requests(conn, retry_after=1, keep_alive=False, head=False):
+        headers, body = _TOO_MANY_REQUESTS
+        # Respuesta pre-armada: rechazar a un cliente que excede su limite cuesta casi nada
+        HTTPErrorHandler._error(conn, headers + b"Retry-After: %d\r\n" % retry_after, body, keep_alive, head)
+        return f"429 Too Many Requests - Retry-After {retry_after}s"
+
+    @staticmethod
+    def service_unavailable(conn, retry_after=1):
+        headers, body = _SERVICE_UNAVAILABLE
+        HTTPErrorHandler._error(conn, headers + b"Retry-After: %d\r\n" % retry_after, body)
+        return f"503 Service Unavailable - Retry-After {retry_after}s"
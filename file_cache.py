@@ -0,0 +1,224 @@
+import os
+import gzip
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+from http_utils import make_etag, http_date
+
+try:
+    import brotli
+except ImportError:
+    # Brotli es opcional: sin el modulo solo se comprime con gzip al vuelo
+    brotli = None
+
+# Codificaciones soportadas, en orden de preferencia del servidor, y extension de su archivo precomprimido
+ENCODINGS = (None, "br", "gzip")
+PRECOMPRESSED_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+# Niveles de la compresion al vuelo: corre en el camino del request, con gzip 9 o brotli 11 un
+# archivo de varios MiB tardaria segundos. Los .gz/.br precomprimidos se generan aparte con el
+# nivel maximo y se sirven tal cual
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+class CacheEntry:
+    """Respuesta pre-armada de un archivo: header (sin Connection), bloque ETag/Last-Modified para 304 y cuerpo"""
+
+    __slots__ = ('header', 'validators', 'body', 'mtime_ns', 'size', 'source_size', 'etag', 'last_modified',
+                 'encoding', 'checked_at')
+
+    def __init__(self, header, validators, body, mtime_ns, source_size, etag, last_modified, encoding=None):
+        self.header = header
+        self.validators = validators
+        self.body = body
+        self.mtime_ns = mtime_ns
+        self.size = len(body)
+        self.source_size = source_size  # tamaño en disco, para revalidar con os.stat
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoding = encoding
+        self.checked_at = time.monotonic()
+
+    @property
+    def mtime(self):
+        return self.mtime_ns / 1e9
+
+def compress(body, encoding):
+    """Comprime el cuerpo con gzip o brotli para la compresion al vuelo"""
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    raise ValueError(f"Codificacion no soportada: {encoding}")
+
+class FileCache:
+    """
+    Cache LRU en memoria para archivos pequeños y frecuentes y para sus
+    variantes comprimidas. Limita el total de bytes, y revalida con os.stat
+    (mtime y tamaño) como maximo una vez cada revalidate_interval segundos.
+    Una sola compresion al vuelo por (archivo, encoding): los requests concurrentes
+    esperan su resultado en vez de comprimir lo mismo otra vez.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024, revalidate_interval=1.0,
+                 min_compress_size=1024, max_compress_size=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.revalidate_interval = revalidate_interval
+        self.min_compress_size = min_compress_size
+        self.max_compress_size = max_compress_size
+        self.entries = OrderedDict()  # {(filepath, encoding): CacheEntry}, el mas reciente al final
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compressing = {}  # {(filepath, encoding): threading.Event} compresiones en curso
+
+    def get(self, filepath, content_type, encoding=None, compress_on_the_fly=False, vary=False):
+        """
+        Devuelve el CacheEntry del archivo o None si no existe o no corresponde cachearlo.
+        encoding indica el Content-Encoding de la respuesta: si compress_on_the_fly es True
+        el archivo se comprime una vez y se guarda la variante; si no, filepath ya es
+        la version precomprimida (archivo.gz / archivo.br).
+        Un acierto dentro de la ventana de revalidacion no toca el sistema de archivos.
+        """
+        key = (filepath, encoding)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_interval:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            self.invalidate(filepath)
+            return None
+
+        if compress_on_the_fly:
+            size_ok = self.min_compress_size <= st.st_size <= self.max_compress_size
+        else:
+            size_ok = st.st_size <= self.max_file_size
+        if not stat.S_ISREG(st.st_mode) or not size_ok:
+            self._discard(key)
+            return None
+
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.source_size == st.st_size:
+            with self.lock:
+                entry.checked_at = time.monotonic()
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+        if compress_on_the_fly:
+            with self.lock:
+                pending = self.compressing.get(key)
+                if pending is None:
+                    self.compressing[key] = threading.Event()
+            if pending is not None:
+                # Otro request ya esta comprimiendo esta variante: se usa su resultado
+                pending.wait()
+                return self.get(filepath, content_type, encoding, compress_on_the_fly, vary)
+            try:
+                return self._load(key, st, content_type, encoding, compress_on_the_fly, vary)
+            finally:
+                with self.lock:
+                    self.compressing.pop(key).set()
+        return self._load(key, st, content_type, encoding, compress_on_the_fly, vary)
+
+    def _load(self, key, st, content_type, encoding, compress_on_the_fly, vary):
+        """Lee (y si corresponde comprime) el archivo y guarda su CacheEntry"""
+        filepath = key[0]
+        try:
+            with open(filepath, "rb") as f:
+                body = f.read()
+            if compress_on_the_fly:
+                body = compress(body, encoding)
+        except (OSError, ValueError):
+            self._discard(key)
+            return None
+
+        etag = make_etag(st.st_mtime_ns, st.st_size)
+        if encoding is not None:
+            # Cada representacion necesita su propio ETag
+            etag = f'{etag[:-1]}-{encoding}"'
+        last_modified = http_date(st.st_mtime)
+        header = (
+            "HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        )
+        if encoding is not None:
+            header += f"Content-Encoding: {encoding}\r\n"
+        else:
+            header += "Accept-Ranges: bytes\r\n"
+        if vary:
+            header += "Vary: Accept-Encoding\r\n"
+        validators = f"ETag: {etag}\r\nLast-Modified: {last_modified}\r\n"
+        header += validators
+        entry = CacheEntry(header.encode(), validators.encode(), body, st.st_mtime_ns, st.st_size, etag, last_modified, encoding)
+
+        with self.lock:
+            self.misses += 1
+            self._remove(key)
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            # Expulsar los menos usados hasta respetar el presupuesto de bytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def resize(self, max_bytes, max_file_size):
+        """Cambia los limites en caliente; si el presupuesto baja se expulsan los menos usados"""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.max_file_size = max_file_size
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+
+    def _discard(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def peek(self, filepath, encoding=None):
+        """CacheEntry en memoria sin revalidar ni leer el disco (HEAD), o None"""
+        with self.lock:
+            return self.entries.get((filepath, encoding))
+
+    def invalidate(self, filepath):
+        """Elimina un archivo y todas sus variantes comprimidas del cache"""
+        with self.lock:
+            for encoding in ENCODINGS:
+                self._remove((filepath, encoding))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get_stats(self):
+        """Obtiene estadisticas del cache"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
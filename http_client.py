@@ -0,0 +1,367 @@
+import os
+import socket
+import threading
+
+# Tamaño del buffer de recepcion de cada conexion (se reutiliza en todas sus respuestas)
+RECV_BUFFER = 64 * 1024
+MAX_CABECERA = 64 * 1024  # status line + headers de una respuesta
+USER_AGENT = "Cliente-HTTP/1.0"
+
+class HTTPClientError(Exception):
+    """Respuesta invalida o incompleta"""
+
+class ConnectionClosed(HTTPClientError):
+    """El servidor cerro la conexion antes de empezar la respuesta (el request se puede reintentar)"""
+
+class Request:
+    """Un request a enviar; si sink es un archivo abierto en modo binario el cuerpo se escribe ahi"""
+
+    __slots__ = ('method', 'uri', 'headers', 'sink')
+
+    def __init__(self, uri, method="GET", headers=None, sink=None):
+        self.method = method
+        self.uri = uri
+        self.headers = headers or {}
+        self.sink = sink
+
+    def encode(self, host, user_agent):
+        lines = [f"{self.method} {self.uri} HTTP/1.1", f"Host: {host}", f"User-Agent: {user_agent}"]
+        lines += [f"{nombre}: {valor}" for nombre, valor in self.headers.items() if valor is not None]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+class HTTPResponse:
+    """Respuesta leida: headers con nombres en minusculas; body es None si se escribio en un sink"""
+
+    __slots__ = ('status', 'reason', 'headers', 'body', 'length', 'will_close', 'reused')
+
+    def __init__(self, status, reason, headers):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = None
+        self.length = 0  # bytes del cuerpo (en memoria o escritos en el sink)
+        self.will_close = "close" in headers.get("connection", "").lower()
+        self.reused = False  # llego por una conexion keep-alive ya usada
+
+    def get_header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+class ResponseReader:
+    """
+    Parser incremental de respuestas HTTP/1.1 sobre un bytearray preasignado que se llena
+    con recv_into. Los headers se buscan solo en los bytes nuevos, y los cuerpos con
+    Content-Length se reciben directamente en su destino (sin concatenar chunks).
+    """
+
+    def __init__(self, sock, buffer_size=RECV_BUFFER):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # primer byte sin consumir
+        self.end = 0  # fin de los datos recibidos
+
+    def _fill(self):
+        """Recibe mas datos al final del buffer. Devuelve False si el servidor cerro"""
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            if self.start == 0:
+                raise HTTPClientError("Linea o cabecera de respuesta demasiado larga")
+            # Mover lo pendiente al principio para recibir detras
+            pendiente = self.end - self.start
+            self.buffer[:pendiente] = bytes(self.view[self.start:self.end])
+            self.start, self.end = 0, pendiente
+        n = self.sock.recv_into(self.view[self.end:])
+        self.end += n
+        return n > 0
+
+    def _read_until(self, separador, limite):
+        """Consume hasta separador (incluido) y devuelve los bytes previos"""
+        revisados = 0  # bytes ya revisados desde start: no se vuelven a buscar
+        while True:
+            pos = self.buffer.find(separador, self.start + revisados, self.end)
+            if pos != -1:
+                data = bytes(self.view[self.start:pos])
+                self.start = pos + len(separador)
+                return data
+            revisados = max(0, self.end - self.start - len(separador) + 1)
+            if self.end - self.start > limite:
+                raise HTTPClientError("Cabecera de respuesta demasiado larga")
+            if not self._fill():
+                raise HTTPClientError("Conexion cerrada en medio de la respuesta")
+
+    def _read_into(self, destino):
+        """Llena el memoryview destino: primero con lo recibido, el resto con recv_into directo"""
+        n = min(len(destino), self.end - self.start)
+        destino[:n] = self.view[self.start:self.start + n]
+        self.start += n
+        while n < len(destino):
+            m = self.sock.recv_into(destino[n:])
+            if m == 0:
+                raise HTTPClientError("Conexion cerrada en medio del cuerpo")
+            n += m
+
+    def _copy_to(self, sink, count):
+        """Escribe count bytes del cuerpo en sink por bloques del tamaño del buffer"""
+        while count > 0:
+            if self.start == self.end and not self._fill():
+                raise HTTPClientError("Conexion cerrada en medio del cuerpo")
+            n = min(count, self.end - self.start)
+            sink.write(self.view[self.start:self.start + n])
+            self.start += n
+            count -= n
+
+    def _read_body(self, response, count, sink, partes):
+        if sink is not None:
+            self._copy_to(sink, count)
+        else:
+            parte = bytearray(count)
+            self._read_into(memoryview(parte))
+            partes.append(parte)
+        response.length += count
+
+    def read_response(self, method="GET", sink=None):
+        """Lee la siguiente respuesta completa (los bytes de respuestas en pipeline quedan en el buffer)"""
+        try:
+            if self.start == self.end and not self._fill():
+                raise ConnectionClosed()
+        except ConnectionResetError:
+            # Todavia no llego ningun byte de esta respuesta: se puede reintentar
+            raise ConnectionClosed()
+        cabecera = self._read_until(b"\r\n\r\n", MAX_CABECERA)
+        lines = cabecera.decode("latin-1").split("\r\n")
+        partes = lines[0].split(" ", 2)
+        if len(partes) < 2 or not partes[0].startswith("HTTP/") or not partes[1].isdigit():
+            raise HTTPClientError(f"Status line invalida: {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            nombre, _, valor = line.partition(":")
+            if nombre:
+                headers[nombre.strip().lower()] = valor.strip()
+        response = HTTPResponse(int(partes[1]), partes[2] if len(partes) > 2 else "", headers)
+
+        status = response.status
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            response.body = None if sink is not None else b""
+            return response
+
+        cuerpo = []
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                linea = self._read_until(b"\r\n", MAX_CABECERA)
+                try:
+                    size = int(linea.split(b";", 1)[0], 16)
+                except ValueError:
+                    raise HTTPClientError(f"Tamaño de chunk invalido: {linea!r}")
+                if size == 0:
+                    # Trailers hasta la linea vacia
+                    while self._read_until(b"\r\n", MAX_CABECERA):
+                        pass
+                    break
+                self._read_body(response, size, sink, cuerpo)
+                if self._read_until(b"\r\n", 2):
+                    raise HTTPClientError("Chunk sin CRLF final")
+        elif "content-length" in headers:
+            self._read_body(response, int(headers["content-length"]), sink, cuerpo)
+        else:
+            # Sin longitud: el cuerpo termina cuando el servidor cierra
+            response.will_close = True
+            while self.start < self.end or self._fill():
+                n = self.end - self.start
+                if sink is not None:
+                    sink.write(self.view[self.start:self.end])
+                else:
+                    cuerpo.append(bytes(self.view[self.start:self.end]))
+                response.length += n
+                self.start = self.end
+
+        if sink is None:
+            response.body = cuerpo[0] if len(cuerpo) == 1 else b"".join(cuerpo)
+        return response
+
+class HTTPConnection:
+    """Una conexion TCP (o TLS) keep-alive a un host:port"""
+
+    def __init__(self, host, port, timeout=10.0, tls_context=None, tls_session=None):
+        self.host = host
+        self.port = port
+        sock = socket.create_connection((host, port), timeout=timeout)
+        # Sin Nagle: los requests pequeños (y los de un pipeline) salen enseguida
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if tls_context is not None:
+            sock = tls_context.wrap_socket(sock, server_hostname=host, session=tls_session)
+        self.sock = sock
+        self.reader = ResponseReader(sock)
+        self.responses = 0
+        self.closed = False
+
+    @property
+    def tls_session(self):
+        return getattr(self.sock, "session", None)
+
+    @property
+    def session_reused(self):
+        return getattr(self.sock, "session_reused", False)
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def read_response(self, method="GET", sink=None):
+        response = self.reader.read_response(method, sink)
+        response.reused = self.responses > 0
+        self.responses += 1
+        if response.will_close:
+            self.close()
+        return response
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sock.close()
+
+class ConnectionPool:
+    """
+    Conexiones keep-alive libres agrupadas por esquema://host:port. Tambien guarda la
+    ultima sesion TLS de cada destino: una conexion nueva la presenta y el servidor
+    la reanuda sin handshake completo.
+    """
+
+    def __init__(self, max_idle_per_host=4, timeout=10.0, tls_context=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.tls_context = tls_context
+        self.idle = {}  # {clave: [HTTPConnection]}
+        self.sessions = {}  # {clave: ssl.SSLSession}
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.tls_resumed = 0
+
+    @staticmethod
+    def _key(host, port, tls):
+        return f"{'https' if tls else 'http'}://{host}:{port}"
+
+    def acquire(self, host, port, tls=False):
+        """Conexion libre al destino, o una nueva si no hay"""
+        key = self._key(host, port, tls)
+        with self.lock:
+            libres = self.idle.get(key)
+            if libres:
+                self.reused += 1
+                return libres.pop()
+            session = self.sessions.get(key)
+
+        if tls and self.tls_context is None:
+            raise HTTPClientError("El pool no tiene contexto TLS")
+        conn = HTTPConnection(host, port, self.timeout, self.tls_context if tls else None, session)
+        with self.lock:
+            self.created += 1
+            self.tls_resumed += conn.session_reused
+        return conn
+
+    def release(self, conn, tls=False):
+        """Devuelve la conexion al pool (o la cierra si el servidor no la mantiene abierta)"""
+        key = self._key(conn.host, conn.port, tls)
+        with self.lock:
+            if tls and conn.tls_session is not None:
+                # Con TLS 1.3 el ticket llega despues del handshake: ya se leyo con la respuesta
+                self.sessions[key] = conn.tls_session
+            if conn.closed:
+                return
+            libres = self.idle.setdefault(key, [])
+            if len(libres) < self.max_idle_per_host:
+                libres.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            conexiones = [conn for libres in self.idle.values() for conn in libres]
+            self.idle.clear()
+        for conn in conexiones:
+            conn.close()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'idle': sum(len(libres) for libres in self.idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+                'tls_resumed': self.tls_resumed
+            }
+
+class HTTPClient:
+    """Cliente HTTP/1.1 con pool de conexiones, pipelining y descarga a disco"""
+
+    def __init__(self, pool=None, user_agent=USER_AGENT, tls_context=None, timeout=10.0):
+        self.pool = pool or ConnectionPool(timeout=timeout, tls_context=tls_context)
+        self.user_agent = user_agent
+
+    def request(self, host, port, uri, method="GET", headers=None, sink=None, tls=False):
+        return self.pipeline(host, port, [Request(uri, method, headers, sink)], tls)[0]
+
+    def pipeline(self, host, port, requests, tls=False):
+        """
+        Envia todos los requests juntos por una conexion y lee las respuestas en orden.
+        Si el servidor cierra la conexion antes de responder alguno (keep-alive vencido o
+        limite de requests por conexion), los que faltan se reenvian por otra conexion; una
+        respuesta cortada a medias solo se reintenta si su sink se puede rebobinar.
+        """
+        pendientes = list(requests)
+        respuestas = []
+        while pendientes:
+            conn = self.pool.acquire(host, port, tls)
+            nueva = conn.responses == 0
+            leyendo = False
+            try:
+                conn.send(b"".join(req.encode(host, self.user_agent) for req in pendientes))
+                while pendientes and not conn.closed:
+                    req = pendientes[0]
+                    posicion = req.sink.tell() if req.sink is not None and req.sink.seekable() else None
+                    leyendo = True
+                    respuestas.append(conn.read_response(req.method, req.sink))
+                    leyendo = False
+                    pendientes.pop(0)
+            except (ConnectionClosed, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                # En una conexion nueva que no respondio nada, reintentar no serviria
+                if nueva and conn.responses == 0:
+                    raise
+                if leyendo and not isinstance(e, ConnectionClosed):
+                    # La respuesta se corto a medias: lo escrito en el sink se descarta antes de reintentar
+                    self._rewind(pendientes[0].sink, posicion)
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            self.pool.release(conn, tls)
+        return respuestas
+
+    @staticmethod
+    def _rewind(sink, posicion):
+        """Vuelve el sink a donde empezaba la respuesta; si no se puede, el request no se reintenta"""
+        if sink is None:
+            return
+        if posicion is None:
+            raise HTTPClientError("Respuesta cortada y el sink no se puede rebobinar para reintentar")
+        sink.seek(posicion)
+        sink.truncate()
+
+    def download(self, host, port, uri, path, headers=None, tls=False):
+        """
+        Descarga uri en path escribiendo el cuerpo a disco a medida que llega.
+        Se escribe en un archivo temporal y solo un 200 reemplaza a path.
+        """
+        temporal = f"{path}.part"
+        try:
+            with open(temporal, "wb") as sink:
+                response = self.request(host, port, uri, headers=headers, sink=sink, tls=tls)
+            if response.status == 200:
+                os.replace(temporal, path)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return response
+
+    def close(self):
+        self.pool.close_all()
@@ -0,0 +1,261 @@
+class HTTPParseError(Exception):
+    """Request invalido; status indica la respuesta HTTP que corresponde (400, 413, 431)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# Digitos permitidos en el tamaño de un chunk: int() tambien aceptaria "-5", "+3", "0x3" o "3_0"
+HEX_DIGITS = frozenset(b"0123456789abcdefABCDEF")
+# Largo maximo de la linea de tamaño de un chunk y de cada trailer
+MAX_CHUNK_LINE = 1024
+
+class HTTPRequest:
+    """Request ya parseado, compartido por todas las etapas del servidor"""
+
+    __slots__ = ('method', 'uri', 'version', 'headers', 'header_list', 'raw_headers', 'body', 'streaming')
+
+    def __init__(self, method, uri, version, header_list, raw_headers):
+        self.method = method
+        self.uri = uri
+        self.version = version
+        self.header_list = header_list  # [(nombre original, valor)] en orden de llegada
+        self.headers = {}  # {nombre en minusculas: valor}
+        for name, value in header_list:
+            key = name.lower()
+            # Headers repetidos se combinan separados por coma (RFC 7230, seccion 3.2.2)
+            self.headers[key] = f"{self.headers[key]}, {value}" if key in self.headers else value
+        self.raw_headers = raw_headers
+        self.body = b""
+        self.streaming = False  # el cuerpo no esta en body: se lee con HTTPRequestParser.read_body()
+
+    def get_header(self, name, default=None):
+        """Valor de un header sin distinguir mayusculas"""
+        return self.headers.get(name.lower(), default)
+
+    @property
+    def keep_alive(self):
+        """HTTP/1.1 es persistente por defecto; HTTP/1.0 solo si lo pide el cliente"""
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return "close" not in connection
+        return "keep-alive" in connection
+
+    @property
+    def text(self):
+        """Request line y headers tal como llegaron, para mostrar en consola"""
+        return self.raw_headers.decode("latin-1")
+
+class HTTPRequestParser:
+    """
+    Parser incremental de requests HTTP/1.x sobre bytes.
+    Se alimenta con feed() a medida que llegan datos del socket y next_request()
+    devuelve cada request completo (headers y cuerpo) o None si faltan datos.
+    Soporta requests en pipeline: lo que sobra queda en el buffer para el siguiente.
+    Los requests de streaming_methods (subidas) se devuelven apenas llegan los headers:
+    su cuerpo, de hasta max_stream_body bytes, se consume de a partes con read_body()
+    antes de pedir el siguiente request, con memoria acotada al buffer de recepcion.
+    """
+
+    ESTADO_HEADERS, ESTADO_BODY, ESTADO_CHUNKED = range(3)
+
+    def __init__(self, max_header_bytes=8192, max_headers=100, max_body=1024 * 1024, streaming_methods=(),
+                 max_stream_body=1024 * 1024 * 1024):
+        self.max_header_bytes = max_header_bytes
+        self.max_headers = max_headers
+        self.max_body = max_body
+        self.streaming_methods = streaming_methods
+        self.max_stream_body = max_stream_body
+        self.buffer = bytearray()
+        self._reset()
+
+    def _reset(self):
+        self.state = self.ESTADO_HEADERS
+        self.request = None
+        self.body = bytearray()
+        self.remaining = 0  # bytes que faltan del cuerpo o del chunk actual
+        self.received = 0  # bytes de cuerpo recibidos (para el limite de los cuerpos chunked)
+        self.limit = self.max_body
+        self.scan_pos = 0  # hasta donde ya se busco el fin de headers
+        self.streaming = False  # hay un cuerpo en streaming sin terminar de leer
+
+    def feed(self, data):
+        self.buffer += data
+
+    def has_pending_data(self):
+        """True si hay datos de un request incompleto en el buffer"""
+        return bool(self.buffer) or self.state != self.ESTADO_HEADERS
+
+    def next_request(self):
+        """Devuelve el siguiente HTTPRequest completo o None. Lanza HTTPParseError si es invalido"""
+        if self.streaming:
+            raise RuntimeError("El cuerpo del request anterior no se termino de leer")
+        if self.state == self.ESTADO_HEADERS and not self._parse_headers():
+            return None
+        if self.request.streaming:
+            # Subida: el cuerpo queda en el buffer para read_body()
+            self.streaming = True
+            return self.request
+        if self.state == self.ESTADO_BODY and not self._parse_body():
+            return None
+        if self.state == self.ESTADO_CHUNKED and not self._parse_chunked():
+            return None
+
+        request = self.request
+        request.body = bytes(self.body)
+        self._reset()
+        return request
+
+    def read_body(self):
+        """
+        Siguiente parte del cuerpo del request en streaming: bytes, b"" al terminar el cuerpo
+        (el parser queda listo para el siguiente request) o None si faltan datos del socket
+        """
+        if self.state == self.ESTADO_BODY:
+            done = self._parse_body()
+        elif self.state == self.ESTADO_CHUNKED:
+            done = self._parse_chunked()
+        else:
+            done = True
+        if self.body:
+            data = bytes(self.body)
+            self.body.clear()
+            return data
+        if not done:
+            return None
+        self._reset()
+        return b""
+
+    def _parse_headers(self):
+        # Se ignoran lineas vacias antes de la request line (RFC 7230, seccion 3.5)
+        while self.buffer[:2] == b"\r\n":
+            del self.buffer[:2]
+
+        # Solo se busca en lo nuevo (retrocediendo 3 bytes por si el CRLFCRLF quedo partido)
+        fin = self.buffer.find(b"\r\n\r\n", max(0, self.scan_pos - 3))
+        if fin == -1:
+            self.scan_pos = len(self.buffer)
+            if len(self.buffer) > self.max_header_bytes:
+                raise HTTPParseError(431, "Headers demasiado grandes")
+            return False
+        if fin + 4 > self.max_header_bytes:
+            raise HTTPParseError(431, "Headers demasiado grandes")
+
+        raw_headers = bytes(self.buffer[:fin + 4])
+        del self.buffer[:fin + 4]
+
+        lines = raw_headers[:fin].split(b"\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3:
+            raise HTTPParseError(400, "Request line mal formada")
+        method, uri, version = (p.decode("latin-1") for p in parts)
+        if not version.startswith("HTTP/"):
+            raise HTTPParseError(400, "Version HTTP mal formada")
+
+        if len(lines) - 1 > self.max_headers:
+            raise HTTPParseError(431, "Demasiados headers")
+        header_list = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            if not sep or not name or name != name.strip():
+                raise HTTPParseError(400, "Header mal formado")
+            header_list.append((name.decode("latin-1"), value.strip().decode("latin-1")))
+
+        self.request = HTTPRequest(method, uri, version, header_list, raw_headers)
+        if method in self.streaming_methods:
+            self.request.streaming = True
+            self.limit = self.max_stream_body
+        self._start_body()
+        return True
+
+    def _start_body(self):
+        transfer_encoding = self.request.get_header("Transfer-Encoding")
+        content_length = self.request.get_header("Content-Length")
+
+        if transfer_encoding is not None:
+            # Con ambos headers un intermediario podria interpretar otro limite (request smuggling)
+            if content_length is not None:
+                raise HTTPParseError(400, "Content-Length y Transfer-Encoding a la vez")
+            if transfer_encoding.lower().split(",")[-1].strip() != "chunked":
+                raise HTTPParseError(400, f"Transfer-Encoding no soportado: {transfer_encoding}")
+            self.state = self.ESTADO_CHUNKED
+            self.remaining = -1  # -1: falta leer la linea con el tamaño del chunk
+            return
+
+        if content_length is not None:
+            # Solo digitos ASCII: en latin-1 '²' o '¹' tambien son isdigit() pero int() los rechaza
+            if not (content_length.isascii() and content_length.isdigit()):
+                raise HTTPParseError(400, "Content-Length invalido")
+            self.remaining = int(content_length)
+            if self.remaining > self.limit:
+                raise HTTPParseError(413, f"Cuerpo de {self.remaining} bytes supera el limite de {self.limit}")
+            self.state = self.ESTADO_BODY
+            return
+
+        self.state = self.ESTADO_HEADERS
+
+    def _take(self, count):
+        """Mueve hasta count bytes del buffer al cuerpo. Devuelve cuantos movio"""
+        chunk = self.buffer[:count]
+        del self.buffer[:len(chunk)]
+        self.body += chunk
+        self.received += len(chunk)
+        return len(chunk)
+
+    def _parse_body(self):
+        self.remaining -= self._take(self.remaining)
+        if self.remaining > 0:
+            return False
+        self.state = self.ESTADO_HEADERS
+        return True
+
+    def _parse_chunked(self):
+        while True:
+            if self.remaining == -1:
+                # Linea "tamaño[;extensiones]\r\n"
+                fin = self.buffer.find(b"\r\n")
+                if fin == -1:
+                    if len(self.buffer) > MAX_CHUNK_LINE:
+                        raise HTTPParseError(400, "Linea de chunk demasiado larga")
+                    return False
+                if fin > MAX_CHUNK_LINE:
+                    raise HTTPParseError(400, "Linea de chunk demasiado larga")
+                size_line = bytes(self.buffer[:fin]).split(b";", 1)[0].strip()
+                del self.buffer[:fin + 2]
+                # Un proxy delante podria leer de otra forma un tamaño no estrictamente hexadecimal
+                if not size_line or not HEX_DIGITS.issuperset(size_line):
+                    raise HTTPParseError(400, "Tamaño de chunk invalido")
+                size = int(size_line, 16)
+                if size == 0:
+                    self.remaining = -2
+                    continue
+                if self.received + size > self.limit:
+                    raise HTTPParseError(413, f"Cuerpo supera el limite de {self.limit} bytes")
+                self.remaining = size + 2  # datos + CRLF final del chunk
+
+            elif self.remaining == -2:
+                # Trailers opcionales terminados en una linea vacia
+                fin = self.buffer.find(b"\r\n")
+                if fin == -1:
+                    if len(self.buffer) > MAX_CHUNK_LINE:
+                        raise HTTPParseError(400, "Trailer demasiado largo")
+                    return False
+                if fin > MAX_CHUNK_LINE:
+                    raise HTTPParseError(400, "Trailer demasiado largo")
+                del self.buffer[:fin + 2]
+                if fin == 0:
+                    self.state = self.ESTADO_HEADERS
+                    return True
+
+            else:
+                if self.remaining > 2:
+                    self.remaining -= self._take(self.remaining - 2)
+                    if self.remaining > 2:
+                        return False
+                if len(self.buffer) < 2:
+                    return False
+                if self.buffer[:2] != b"\r\n":
+                    raise HTTPParseError(400, "Chunk mal terminado")
+                del self.buffer[:2]
+                self.remaining = -1
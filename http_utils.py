@@ -0,0 +1,119 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+def make_etag(mtime_ns, size):
+    """ETag fuerte a partir del tamaño y la fecha de modificacion del archivo"""
+    return f'"{size:x}-{mtime_ns:x}"'
+
+def http_date(timestamp):
+    """Fecha en formato HTTP (RFC 7231), p. ej. 'Sun, 06 Nov 1994 08:49:37 GMT'"""
+    return formatdate(timestamp, usegmt=True)
+
+def is_not_modified(if_none_match, if_modified_since, etag, mtime):
+    """
+    Evalua los headers condicionales de un GET.
+    If-None-Match tiene prioridad sobre If-Modified-Since (RFC 7232, seccion 6).
+    """
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Comparacion debil: W/"x" equivale a "x"
+        etag_base = etag[2:] if etag.startswith("W/") else etag
+        for candidato in if_none_match.split(","):
+            candidato = candidato.strip()
+            if candidato.startswith("W/"):
+                candidato = candidato[2:]
+            if candidato == etag_base:
+                return True
+        return False
+
+    if if_modified_since is not None:
+        try:
+            fecha = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if fecha is None:
+            return False
+        # La fecha HTTP tiene resolucion de segundos
+        return int(mtime) <= fecha.timestamp()
+
+    return False
+
+def parse_range(range_header, size, max_ranges=16):
+    """
+    Interpreta un header Range de bytes para un recurso de 'size' bytes.
+    Devuelve una lista de (inicio, fin) inclusivos, [] si ningun rango es
+    satisfacible (416), o None si el header no aplica y se responde 200 completo.
+    """
+    if not range_header:
+        return None
+    unidad, _, specs = range_header.partition("=")
+    if unidad.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        inicio, guion, fin = spec.strip().partition("-")
+        if not guion:
+            return None
+        inicio, fin = inicio.strip(), fin.strip()
+        try:
+            if inicio == "":
+                # Rango sufijo: los ultimos N bytes
+                n = int(fin)
+                if n < 0:
+                    return None
+                if n == 0 or size == 0:
+                    continue
+                ranges.append((max(0, size - n), size - 1))
+            else:
+                start = int(inicio)
+                end = int(fin) if fin else None
+                if start < 0 or (end is not None and end < start):
+                    return None
+                if start >= size:
+                    continue
+                ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+        except ValueError:
+            return None
+
+    # Demasiados rangos: se ignora el header en vez de armar una respuesta enorme
+    if len(ranges) > max_ranges:
+        return None
+    return ranges
+
+def range_applies(if_range, etag, last_modified):
+    """If-Range: el rango solo se respeta si el validador coincide exactamente (comparacion fuerte)"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return if_range == last_modified
+
+def accepted_encodings(accept_encoding, supported=("br", "gzip")):
+    """
+    Codificaciones de 'supported' aceptadas por el cliente segun Accept-Encoding,
+    ordenadas por q descendente y, a igual q, por el orden de preferencia del servidor.
+    """
+    if not accept_encoding:
+        return []
+    calidades = {}
+    for item in accept_encoding.split(","):
+        nombre, _, params = item.strip().partition(";")
+        nombre = nombre.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if nombre:
+            calidades[nombre] = q
+
+    aceptadas = []
+    for preferencia, encoding in enumerate(supported):
+        q = calidades.get(encoding, calidades.get("*", 0.0))
+        if q > 0:
+            aceptadas.append((-q, preferencia, encoding))
+    return [encoding for _, _, encoding in sorted(aceptadas)]
@@ -0,0 +1,109 @@
+import threading
+import time
+
+class IdleReaper:
+    """
+    Cierra las conexiones keep-alive inactivas usando una rueda de tiempo (hashed timing wheel).
+    Cada conexion se agenda en la ranura de su vencimiento; en cada tick solo se revisa
+    la ranura actual, asi el costo es proporcional a las conexiones que vencen y no al total.
+    La actividad no mueve la entrada: al vencer se consulta last_activity en el registro
+    y, si hubo actividad, se vuelve a agendar (reprogramacion perezosa).
+    """
+
+    def __init__(self, clients_handler, timeout, tick=1.0, num_slots=64):
+        self.clients_handler = clients_handler
+        self.timeout = timeout
+        self.tick = tick
+        self.num_slots = num_slots
+        self.slots = [[] for _ in range(num_slots)]
+        self.lock = threading.Lock()
+        self.current_tick = int(time.time() / tick)
+        self.running = False
+        self.thread = None
+        self.reaped = 0
+        self.scheduled = 0
+
+    def _tick_of(self, deadline):
+        return int(deadline / self.tick) + 1
+
+    def schedule(self, client_id, deadline=None):
+        """Agenda la revision de un cliente para cuando venza su tiempo de inactividad"""
+        if deadline is None:
+            deadline = time.time() + self.timeout
+        with self.lock:
+            target = max(self._tick_of(deadline), self.current_tick + 1)
+            self.slots[target % self.num_slots].append((target, client_id))
+            self.scheduled += 1
+
+    def _process_slot(self, tick, now):
+        with self.lock:
+            slot = self.slots[tick % self.num_slots]
+            self.slots[tick % self.num_slots] = []
+
+        for target, client_id in slot:
+            if target > tick:
+                # Entrada de una vuelta futura de la rueda
+                self._reinsert(target, client_id)
+                continue
+
+            activity = self.clients_handler.get_client_activity(client_id)
+            if activity is None:
+                continue
+            connected, busy, last_activity = activity
+            if not connected:
+                continue
+            deadline = last_activity + self.timeout
+            if busy or deadline > now:
+                # Hubo actividad (o hay una respuesta en curso): volver a agendar
+                self.schedule(client_id, max(deadline, now + self.tick))
+                continue
+            if self.clients_handler.disconnect_client(client_id, reason="inactividad"):
+                self.reaped += 1
+
+    def _reinsert(self, target, client_id):
+        with self.lock:
+            self.slots[target % self.num_slots].append((target, client_id))
+
+    def run_once(self):
+        """Procesa todas las ranuras vencidas desde el ultimo tick"""
+        now = time.time()
+        now_tick = int(now / self.tick)
+        while True:
+            with self.lock:
+                if self.current_tick >= now_tick:
+                    break
+                self.current_tick += 1
+                tick = self.current_tick
+            self._process_slot(tick, now)
+        # Tareas periodicas del registro: limpiar clientes cerrados y reintentar outbox pendientes
+        self.clients_handler.expire_closed()
+        self.clients_handler.flush_pending()
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.tick)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[REAPER] Error: {e}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="IdleReaper")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        with self.lock:
+            pending = sum(len(slot) for slot in self.slots)
+        return {
+            'timeout': self.timeout,
+            'pending': pending,
+            'scheduled': self.scheduled,
+            'reaped': self.reaped
+        }
@@ -0,0 +1,500 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import tls
+
+MIX_POR_DEFECTO = "index.html:5,prueba.txt:3,admin.html:1"
+
+# Matriz de benchmark: motores del servidor x conexiones x (keep-alive, profundidad de pipeline)
+MATRIZ_MOTORES = ("threads", "async")
+MATRIZ_CONEXIONES = (1, 16, 64)
+MATRIZ_MODOS = ((False, 1), (True, 1), (True, 8))
+
+class ConexionCerrada(Exception):
+    """El servidor cerro la conexion antes de completar la respuesta"""
+
+def parsear_mix(texto):
+    """'index.html:5,prueba.txt:3' -> (['/index.html', '/prueba.txt'], [5.0, 3.0])"""
+    archivos, pesos = [], []
+    for item in texto.split(","):
+        nombre, _, peso = item.strip().partition(":")
+        if not nombre:
+            continue
+        archivos.append("/" + nombre.lstrip("/"))
+        pesos.append(float(peso) if peso else 1.0)
+    if not archivos:
+        raise ValueError("El mix de archivos esta vacio")
+    return archivos, pesos
+
+def armar_request(host, uri, keep_alive):
+    return (
+        f"GET {uri} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        "User-Agent: Generador-Carga/1.0\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode()
+
+def parsear_cabecera(raw):
+    """Status line y headers de una respuesta -> (status, {header en minusculas: valor})"""
+    lines = raw.decode("latin-1").split("\r\n")
+    partes = lines[0].split(" ", 2)
+    if len(partes) < 2 or not partes[1].isdigit():
+        raise ValueError(f"Status line invalida: {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        nombre, _, valor = line.partition(":")
+        if nombre:
+            headers[nombre.strip().lower()] = valor.strip()
+    return int(partes[1]), headers
+
+def percentil(ordenados, p):
+    """Percentil p (0 a 1) de una lista ya ordenada, por el metodo del rango mas cercano"""
+    if not ordenados:
+        return 0
+    indice = min(len(ordenados) - 1, max(0, math.ceil(p * len(ordenados)) - 1))
+    return ordenados[indice]
+
+class Resultados:
+    """Mediciones de un hilo o tarea; al final se combinan con merge()"""
+
+    def __init__(self):
+        self.latencias_ns = []
+        self.bytes = 0
+        self.status = {}
+        self.errores = 0
+        self.reintentos = 0
+        self.conexiones = 0
+        self.reanudadas = 0  # conexiones TLS que reanudaron la sesion anterior
+
+    def registrar(self, latencia_ns, status, bytes_respuesta):
+        self.latencias_ns.append(latencia_ns)
+        self.bytes += bytes_respuesta
+        self.status[status] = self.status.get(status, 0) + 1
+
+    def merge(self, otro):
+        self.latencias_ns.extend(otro.latencias_ns)
+        self.bytes += otro.bytes
+        for status, cantidad in otro.status.items():
+            self.status[status] = self.status.get(status, 0) + cantidad
+        self.errores += otro.errores
+        self.reintentos += otro.reintentos
+        self.conexiones += otro.conexiones
+        self.reanudadas += otro.reanudadas
+
+    def resumen(self, duracion):
+        ordenadas = sorted(self.latencias_ns)
+        total = len(ordenadas)
+        return {
+            'requests': total,
+            'duracion': duracion,
+            'req_s': total / duracion if duracion > 0 else 0.0,
+            'mb_s': self.bytes / duracion / 1e6 if duracion > 0 else 0.0,
+            'bytes': self.bytes,
+            'p50_ms': percentil(ordenadas, 0.50) / 1e6,
+            'p99_ms': percentil(ordenadas, 0.99) / 1e6,
+            'p999_ms': percentil(ordenadas, 0.999) / 1e6,
+            'max_ms': (ordenadas[-1] if ordenadas else 0) / 1e6,
+            'status': {str(k): v for k, v in sorted(self.status.items())},
+            'errores': self.errores,
+            'reintentos': self.reintentos,
+            'conexiones': self.conexiones,
+            'tls_reanudadas': self.reanudadas
+        }
+
+class LectorRespuestas:
+    """Lee respuestas HTTP completas de un socket bloqueante (Content-Length, chunked o hasta el cierre)"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.recv_buffer = bytearray(64 * 1024)
+
+    def _recibir(self):
+        n = self.sock.recv_into(self.recv_buffer)
+        if n == 0:
+            return False
+        self.buffer += memoryview(self.recv_buffer)[:n]
+        return True
+
+    def _leer_hasta(self, separador):
+        while True:
+            fin = self.buffer.find(separador)
+            if fin != -1:
+                data = bytes(self.buffer[:fin])
+                del self.buffer[:fin + len(separador)]
+                return data
+            if not self._recibir():
+                raise ConexionCerrada()
+
+    def _leer_exacto(self, count):
+        while len(self.buffer) < count:
+            if not self._recibir():
+                raise ConexionCerrada()
+        del self.buffer[:count]
+
+    def leer(self, metodo="GET"):
+        """Devuelve (status, bytes de la respuesta, el servidor cierra la conexion)"""
+        cabecera = self._leer_hasta(b"\r\n\r\n")
+        status, headers = parsear_cabecera(cabecera)
+        total = len(cabecera) + 4
+        cierra = "close" in headers.get("connection", "").lower()
+
+        if metodo == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return status, total, cierra
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                linea = self._leer_hasta(b"\r\n")
+                size = int(linea.split(b";", 1)[0], 16)
+                total += len(linea) + 2
+                if size == 0:
+                    # Trailers hasta la linea vacia
+                    while self._leer_hasta(b"\r\n"):
+                        pass
+                    return status, total, cierra
+                self._leer_exacto(size + 2)
+                total += size + 2
+        if "content-length" in headers:
+            size = int(headers["content-length"])
+            self._leer_exacto(size)
+            return status, total + size, cierra
+        # Sin longitud: el cuerpo termina cuando el servidor cierra
+        while self._recibir():
+            pass
+        total += len(self.buffer)
+        self.buffer.clear()
+        return status, total, True
+
+async def leer_respuesta_async(reader, metodo="GET"):
+    """Version asyncio de LectorRespuestas.leer()"""
+    try:
+        cabecera = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        raise ConexionCerrada()
+    status, headers = parsear_cabecera(cabecera[:-4])
+    total = len(cabecera)
+    cierra = "close" in headers.get("connection", "").lower()
+
+    try:
+        if metodo == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return status, total, cierra
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                linea = await reader.readuntil(b"\r\n")
+                size = int(linea.split(b";", 1)[0], 16)
+                total += len(linea)
+                if size == 0:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return status, total, cierra
+                await reader.readexactly(size + 2)
+                total += size + 2
+        if "content-length" in headers:
+            size = int(headers["content-length"])
+            await reader.readexactly(size)
+            return status, total + size, cierra
+        resto = await reader.read()
+        return status, total + len(resto), True
+    except asyncio.IncompleteReadError:
+        raise ConexionCerrada()
+
+def elegir_lote(rng, config, pendientes):
+    """URIs del proximo lote: varias en pipeline con keep-alive, una sola sin keep-alive"""
+    profundidad = config.pipeline if config.keep_alive else 1
+    return rng.choices(config.archivos, weights=config.pesos, k=min(profundidad, pendientes))
+
+def trabajador_hilo(config, indice, resultados):
+    """
+    Una conexion del modo threads: envia config.requests requests y mide cada respuesta.
+    Un error (timeout, conexion rechazada o cerrada sin respuesta, respuesta invalida) se cuenta,
+    se reconecta y se sigue; la conexion abandona recien despues de config.max_errores errores
+    """
+    rng = random.Random(config.semilla + indice)
+    res = Resultados()
+    sock = lector = None
+    sesion = None  # sesion TLS de la conexion anterior, para reanudarla al reconectar
+    lote = []
+    completados = 0
+    try:
+        while completados < config.requests:
+            try:
+                if sock is None:
+                    sock = socket.create_connection((config.host, config.port), timeout=config.timeout)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    if config.tls is not None:
+                        sock = config.tls.wrap_socket(sock, server_hostname=config.host, session=sesion)
+                        res.reanudadas += sock.session_reused
+                    lector = LectorRespuestas(sock)
+                    res.conexiones += 1
+                # Los requests de un lote cortado por un cierre del servidor se reenvian
+                if not lote:
+                    lote = elegir_lote(rng, config, config.requests - completados)
+                inicio = time.perf_counter_ns()
+                sock.sendall(b"".join(armar_request(config.host, uri, config.keep_alive) for uri in lote))
+
+                cierra = True
+                leidos = completados
+                try:
+                    while lote:
+                        status, size, cierra = lector.leer()
+                        res.registrar(time.perf_counter_ns() - inicio, status, size)
+                        lote.pop(0)
+                        completados += 1
+                        if cierra:
+                            break
+                except (ConexionCerrada, ConnectionError):
+                    res.reintentos += 1
+                    if completados == leidos:
+                        # Cerro sin responder nada: es un error (espera y cuenta para max_errores)
+                        raise ConnectionResetError("el servidor cerro la conexion sin responder") from None
+            except (OSError, ValueError) as e:
+                res.errores += 1
+                if config.verbose:
+                    print(f"[HILO-{indice}] Error: {e}")
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                if res.errores > config.max_errores:
+                    break
+                time.sleep(min(1.0, 0.05 * res.errores))
+                continue
+            if lote or cierra or not config.keep_alive:
+                if config.tls is not None:
+                    # Con TLS 1.3 el ticket llega despues del handshake: ya se leyo junto con la respuesta
+                    sesion = sock.session
+                sock.close()
+                sock = None
+    finally:
+        if sock is not None:
+            sock.close()
+    resultados[indice] = res
+
+def ejecutar_hilos(config):
+    resultados = [None] * config.conexiones
+    hilos = [threading.Thread(target=trabajador_hilo, args=(config, i, resultados))
+             for i in range(config.conexiones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+async def trabajador_async(config, indice):
+    """Una conexion del modo asyncio; misma logica que trabajador_hilo"""
+    rng = random.Random(config.semilla + indice)
+    res = Resultados()
+    writer = reader = None
+    lote = []
+    completados = 0
+    try:
+        while completados < config.requests:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(config.host, config.port, limit=1024 * 1024, ssl=config.tls,
+                                                server_hostname=config.host if config.tls else None),
+                        config.timeout)
+                    res.conexiones += 1
+                    ssl_object = writer.get_extra_info("ssl_object")
+                    if ssl_object is not None:
+                        res.reanudadas += ssl_object.session_reused
+                if not lote:
+                    lote = elegir_lote(rng, config, config.requests - completados)
+                inicio = time.perf_counter_ns()
+                writer.write(b"".join(armar_request(config.host, uri, config.keep_alive) for uri in lote))
+                await writer.drain()
+
+                cierra = True
+                leidos = completados
+                try:
+                    while lote:
+                        status, size, cierra = await asyncio.wait_for(leer_respuesta_async(reader),
+                                                                      config.timeout)
+                        res.registrar(time.perf_counter_ns() - inicio, status, size)
+                        lote.pop(0)
+                        completados += 1
+                        if cierra:
+                            break
+                except (ConexionCerrada, ConnectionError):
+                    res.reintentos += 1
+                    if completados == leidos:
+                        # Cerro sin responder nada: es un error (espera y cuenta para max_errores)
+                        raise ConnectionResetError("el servidor cerro la conexion sin responder") from None
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                res.errores += 1
+                if config.verbose:
+                    print(f"[TAREA-{indice}] Error: {e!r}")
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                if res.errores > config.max_errores:
+                    break
+                await asyncio.sleep(min(1.0, 0.05 * res.errores))
+                continue
+            if lote or cierra or not config.keep_alive:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+    return res
+
+def ejecutar_async(config):
+    async def todas():
+        return await asyncio.gather(*(trabajador_async(config, i) for i in range(config.conexiones)))
+    return asyncio.run(todas())
+
+def ejecutar_carga(config):
+    """Corre una configuracion de carga y devuelve el resumen de las mediciones"""
+    inicio = time.perf_counter()
+    parciales = ejecutar_async(config) if config.modo == "async" else ejecutar_hilos(config)
+    duracion = time.perf_counter() - inicio
+    total = Resultados()
+    for parcial in parciales:
+        total.merge(parcial)
+    resumen = total.resumen(duracion)
+    # Una corrida corta (conexiones que agotaron sus reintentos) no es comparable con las demas
+    resumen['esperados'] = config.conexiones * config.requests
+    resumen['completa'] = resumen['requests'] >= resumen['esperados']
+    return resumen
+
+def imprimir_resumen(config, resumen):
+    print("=" * 60)
+    print(f"CARGA: {config.conexiones} conexiones x {config.requests} requests ({config.modo}, "
+          f"{'keep-alive' if config.keep_alive else 'sin keep-alive'}, pipeline {config.pipeline}"
+          f"{', TLS' if config.tls else ''})")
+    print("=" * 60)
+    print(f"Requests: {resumen['requests']} de {resumen['esperados']} en {resumen['duracion']:.2f}s "
+          f"-> {resumen['req_s']:.0f} req/s")
+    if not resumen['completa']:
+        print("ATENCION: corrida incompleta, hay conexiones que agotaron sus reintentos")
+    print(f"Throughput: {resumen['mb_s']:.2f} MB/s ({resumen['bytes']} bytes)")
+    print(f"Latencia: p50 {resumen['p50_ms']:.2f} ms, p99 {resumen['p99_ms']:.2f} ms, "
+          f"p999 {resumen['p999_ms']:.2f} ms, max {resumen['max_ms']:.2f} ms")
+    print(f"Status: {resumen['status']}")
+    print(f"Conexiones abiertas: {resumen['conexiones']}, reintentos: {resumen['reintentos']}, "
+          f"errores: {resumen['errores']}")
+    if config.tls is not None:
+        print(f"TLS: {resumen['tls_reanudadas']} de {resumen['conexiones']} conexiones reanudaron la sesion")
+
+def esperar_servidor(host, port, proceso, timeout=10.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor termino con codigo {proceso.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("El servidor no empezo a escuchar a tiempo")
+
+def iniciar_servidor(motor, port, extra_args=()):
+    """Lanza server.py en un subproceso con el log de acceso descartado"""
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    comando = [sys.executable, "server.py", "--engine", motor, "--port", str(port),
+               "--log-level", "warning", "--access-log", os.devnull, "--analisis-muestreo", "0", *extra_args]
+    return subprocess.Popen(comando, cwd=directorio, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def ejecutar_matriz(args):
+    """Corre la matriz completa contra un servidor local por motor y devuelve las filas"""
+    filas = []
+    motores = args.motores.split(",")
+    for motor in motores:
+        proceso = iniciar_servidor(motor, args.port)
+        try:
+            esperar_servidor("127.0.0.1", args.port, proceso)
+            for conexiones in MATRIZ_CONEXIONES:
+                for keep_alive, pipeline in MATRIZ_MODOS:
+                    config = crear_config(args, host="127.0.0.1", conexiones=conexiones,
+                                          keep_alive=keep_alive, pipeline=pipeline, tls=None)
+                    resumen = ejecutar_carga(config)
+                    fila = {'motor': motor, 'conexiones': conexiones, 'keep_alive': keep_alive,
+                            'pipeline': pipeline, **resumen}
+                    filas.append(fila)
+                    aviso = "" if fila['completa'] else f"  INCOMPLETA {fila['requests']}/{fila['esperados']}"
+                    print(f"{motor:<8} {conexiones:>4} {'si' if keep_alive else 'no':>3} {pipeline:>3} "
+                          f"{fila['req_s']:>9.0f} {fila['mb_s']:>8.2f} {fila['p50_ms']:>8.2f} "
+                          f"{fila['p99_ms']:>8.2f} {fila['p999_ms']:>8.2f} {fila['errores']:>5}{aviso}")
+        finally:
+            proceso.terminate()
+            proceso.wait()
+    return filas
+
+def crear_config(args, **cambios):
+    archivos, pesos = parsear_mix(args.mix)
+    config = argparse.Namespace(
+        host=args.host, port=args.port, conexiones=args.conexiones, requests=args.requests,
+        modo=args.modo, keep_alive=not args.sin_keepalive, pipeline=max(1, args.pipeline),
+        archivos=archivos, pesos=pesos, semilla=args.semilla, timeout=args.timeout, verbose=args.verbose,
+        max_errores=args.max_errores,
+        tls=tls.crear_contexto_cliente() if args.tls else None
+    )
+    for clave, valor in cambios.items():
+        setattr(config, clave, valor)
+    return config
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Generador de carga y benchmark para el servidor HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("-c", "--conexiones", type=int, default=16,
+                        help="Conexiones concurrentes")
+    parser.add_argument("-n", "--requests", type=int, default=200,
+                        help="Requests por conexion")
+    parser.add_argument("--modo", choices=["threads", "async"], default="async",
+                        help="Un hilo por conexion o un event loop para todas")
+    parser.add_argument("--sin-keepalive", action="store_true",
+                        help="Una conexion nueva por request (Connection: close)")
+    parser.add_argument("--pipeline", type=int, default=1,
+                        help="Requests enviados juntos sin esperar respuesta (con keep-alive)")
+    parser.add_argument("--mix", default=MIX_POR_DEFECTO,
+                        help="Archivos y pesos, p. ej. 'index.html:5,prueba.txt:3,admin.html:1'")
+    parser.add_argument("--semilla", type=int, default=1,
+                        help="Semilla de la secuencia de archivos (misma semilla = misma carga)")
+    parser.add_argument("--tls", action="store_true",
+                        help="Conecta por HTTPS (--port del listener TLS); el modo threads reanuda la sesion "
+                             "al reconectar, asyncio no permite pasar la sesion y siempre hace handshake completo")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Segundos maximos de espera de cada respuesta")
+    parser.add_argument("--max-errores", type=int, default=10,
+                        help="Errores por conexion (timeouts, reconexiones fallidas) antes de abandonarla")
+    parser.add_argument("--matriz", action="store_true",
+                        help="Lanza el servidor local y corre la matriz de benchmark completa")
+    parser.add_argument("--motores", default=",".join(MATRIZ_MOTORES),
+                        help="Motores del servidor a comparar en la matriz")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.matriz:
+        print(f"MATRIZ DE BENCHMARK - {args.requests} requests por conexion, cliente {args.modo}, "
+              f"semilla {args.semilla}")
+        print(f"{'motor':<8} {'conn':>4} {'ka':>3} {'pip':>3} {'req/s':>9} {'MB/s':>8} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'p999 ms':>8} {'err':>5}")
+        resultados = ejecutar_matriz(args)
+    else:
+        config = crear_config(args)
+        resultados = ejecutar_carga(config)
+        imprimir_resumen(config, resultados)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"Resultados guardados en {args.salida}")
+
+if __name__ == "__main__":
+    main()
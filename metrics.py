@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Limites superiores de los buckets de latencia, en nanosegundos (50us .. 5s)
+BUCKETS_NS = (
+    50_000, 100_000, 250_000, 500_000,
+    1_000_000, 2_500_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000,
+    100_000_000, 250_000_000, 500_000_000, 1_000_000_000, 2_500_000_000, 5_000_000_000
+)
+
+# Etapas de un request que se miden por separado
+FASES = ("parse", "resolve", "send")
+# Tipos de handshake TLS: completo o reanudado con un ticket/sesion previa
+HANDSHAKES = ("full", "resumed")
+
+class _ThreadMetrics:
+    """Contadores de un solo hilo: solo ese hilo los escribe, asi que no necesitan lock"""
+
+    __slots__ = ('status', 'bytes_sent', 'requests', 'histograms', 'sums', 'handshakes', 'handshake_sums',
+                 'handshake_failures')
+
+    def __init__(self):
+        self.status = {}  # {codigo: cantidad}
+        self.bytes_sent = 0
+        self.requests = 0
+        # Un bucket extra al final para las mediciones mayores que el ultimo limite (+Inf)
+        self.histograms = {fase: [0] * (len(BUCKETS_NS) + 1) for fase in FASES}
+        self.sums = {fase: 0 for fase in FASES}
+        self.handshakes = {tipo: [0] * (len(BUCKETS_NS) + 1) for tipo in HANDSHAKES}
+        self.handshake_sums = {tipo: 0 for tipo in HANDSHAKES}
+        self.handshake_failures = 0
+
+def _histograma(counts, sum_ns):
+    return {'buckets_ns': list(BUCKETS_NS), 'counts': counts, 'count': sum(counts), 'sum_ns': sum_ns}
+
+def _lineas_histograma(nombre, etiqueta, histogramas):
+    """Lineas de un histograma de Prometheus (en segundos) con una serie por valor de la etiqueta"""
+    lines = []
+    for valor, hist in histogramas.items():
+        acumulado = 0
+        for limite, count in zip(BUCKETS_NS, hist['counts']):
+            acumulado += count
+            lines.append(f'{nombre}_bucket{{{etiqueta}="{valor}",le="{limite / 1e9:g}"}} {acumulado}')
+        lines.append(f'{nombre}_bucket{{{etiqueta}="{valor}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{nombre}_sum{{{etiqueta}="{valor}"}} {hist["sum_ns"] / 1e9:.9f}')
+        lines.append(f'{nombre}_count{{{etiqueta}="{valor}"}} {hist["count"]}')
+    return lines
+
+class ServerMetrics:
+    """
+    Metricas del servidor para /metrics (formato de texto de Prometheus) y /stats.json.
+    Cada hilo registra en sus propios contadores (threading.local) y la lectura suma
+    todos: el camino caliente no toma locks. Los totales pueden estar apenas desfasados
+    mientras se leen, lo que es aceptable para monitoreo.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()  # solo para registrar los contadores de un hilo nuevo
+        self._threads = []
+        self.started_at = time.time()
+
+    def _mine(self):
+        metrics = getattr(self._local, "metrics", None)
+        if metrics is None:
+            metrics = _ThreadMetrics()
+            self._local.metrics = metrics
+            with self._lock:
+                self._threads.append(metrics)
+        return metrics
+
+    def observe(self, fase, duracion_ns):
+        """Registra la duracion de una etapa (parse, resolve o send)"""
+        metrics = self._mine()
+        metrics.histograms[fase][bisect_left(BUCKETS_NS, duracion_ns)] += 1
+        metrics.sums[fase] += duracion_ns
+
+    def handshake(self, resumed, duracion_ns):
+        """Registra la duracion de un handshake TLS terminado (completo o reanudado)"""
+        metrics = self._mine()
+        tipo = "resumed" if resumed else "full"
+        metrics.handshakes[tipo][bisect_left(BUCKETS_NS, duracion_ns)] += 1
+        metrics.handshake_sums[tipo] += duracion_ns
+
+    def handshake_failed(self):
+        self._mine().handshake_failures += 1
+
+    def request(self, status, bytes_sent):
+        """Registra un request terminado con su codigo de estado y los bytes enviados"""
+        metrics = self._mine()
+        metrics.requests += 1
+        metrics.bytes_sent += bytes_sent
+        metrics.status[status] = metrics.status.get(status, 0) + 1
+
+    def snapshot(self):
+        """Suma los contadores de todos los hilos"""
+        with self._lock:
+            threads = list(self._threads)
+
+        status = {}
+        bytes_sent = 0
+        requests = 0
+        histograms = {fase: [0] * (len(BUCKETS_NS) + 1) for fase in FASES}
+        sums = {fase: 0 for fase in FASES}
+        handshakes = {tipo: [0] * (len(BUCKETS_NS) + 1) for tipo in HANDSHAKES}
+        handshake_sums = {tipo: 0 for tipo in HANDSHAKES}
+        handshake_failures = 0
+        for metrics in threads:
+            for code, count in list(metrics.status.items()):
+                status[code] = status.get(code, 0) + count
+            bytes_sent += metrics.bytes_sent
+            requests += metrics.requests
+            for fase in FASES:
+                for i, count in enumerate(metrics.histograms[fase]):
+                    histograms[fase][i] += count
+                sums[fase] += metrics.sums[fase]
+            for tipo in HANDSHAKES:
+                for i, count in enumerate(metrics.handshakes[tipo]):
+                    handshakes[tipo][i] += count
+                handshake_sums[tipo] += metrics.handshake_sums[tipo]
+            handshake_failures += metrics.handshake_failures
+
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started_at,
+            'requests': requests,
+            'bytes_sent': bytes_sent,
+            'status': dict(sorted(status.items())),
+            'latency': {fase: _histograma(histograms[fase], sums[fase]) for fase in FASES},
+            'tls_handshakes': {tipo: _histograma(handshakes[tipo], handshake_sums[tipo]) for tipo in HANDSHAKES},
+            'tls_handshake_failures': handshake_failures
+        }
+
+    def prometheus(self, active_connections, extra_gauges=None, extra_counters=None):
+        """Metricas en el formato de texto de Prometheus (version 0.0.4)"""
+        snap = self.snapshot()
+        lines = [
+            "# HELP http_requests_total Requests atendidos por codigo de estado.",
+            "# TYPE http_requests_total counter"
+        ]
+        for code, count in snap['status'].items():
+            lines.append(f'http_requests_total{{code="{code}"}} {count}')
+
+        lines += [
+            "# HELP http_response_bytes_total Bytes enviados en respuestas.",
+            "# TYPE http_response_bytes_total counter",
+            f"http_response_bytes_total {snap['bytes_sent']}",
+            "# HELP http_active_connections Conexiones abiertas en este proceso.",
+            "# TYPE http_active_connections gauge",
+            f"http_active_connections {active_connections}",
+            "# HELP process_uptime_seconds Segundos desde que inicio el proceso.",
+            "# TYPE process_uptime_seconds gauge",
+            f"process_uptime_seconds {snap['uptime']:.3f}"
+        ]
+        for name, (help_text, value) in (extra_gauges or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        for name, (help_text, value) in (extra_counters or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+        lines += [
+            "# HELP http_request_phase_seconds Duracion de cada etapa del request.",
+            "# TYPE http_request_phase_seconds histogram"
+        ]
+        lines += _lineas_histograma("http_request_phase_seconds", "phase", snap['latency'])
+
+        lines += [
+            "# HELP tls_handshake_seconds Duracion del handshake TLS, completo o reanudado.",
+            "# TYPE tls_handshake_seconds histogram"
+        ]
+        lines += _lineas_histograma("tls_handshake_seconds", "type", snap['tls_handshakes'])
+        lines += [
+            "# HELP tls_handshake_failures_total Handshakes TLS fallidos o abandonados.",
+            "# TYPE tls_handshake_failures_total counter",
+            f"tls_handshake_failures_total {snap['tls_handshake_failures']}"
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,212 @@
+import mmap
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+from http_utils import make_etag, http_date
+
+class MappedFile:
+    """Un archivo mapeado en memoria y compartido entre todas las conexiones que lo sirven"""
+
+    __slots__ = ('path', 'mm', 'view', 'size', 'mtime_ns', 'etag', 'last_modified', 'refs', 'last_used',
+                 'checked_at', 'retired')
+
+    def __init__(self, path, mm, st):
+        self.path = path
+        self.mm = mm
+        self.view = memoryview(mm)
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.etag = make_etag(st.st_mtime_ns, st.st_size)
+        self.last_modified = http_date(st.st_mtime)
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.checked_at = self.last_used
+        self.retired = False  # reemplazado o expulsado: se libera cuando termine el ultimo envio
+
+    @property
+    def mtime(self):
+        return self.mtime_ns / 1e9
+
+    def _unmap(self):
+        try:
+            self.view.release()
+            self.mm.close()
+        except BufferError:
+            # Queda alguna vista exportada (p. ej. en el buffer de un transporte): el mapeo
+            # se libera cuando el recolector descarte la ultima referencia
+            pass
+
+class MmapPool:
+    """
+    Pool de mapeos mmap con contador de referencias para archivos medianos: demasiado
+    grandes para FileCache pero pedidos seguido. Todas las conexiones que sirven el mismo
+    archivo comparten un solo mapeo de las paginas del page cache y envian vistas
+    (memoryview) del mapeo, tambien para los rangos. Los mapeos sin uso durante
+    idle_timeout segundos se liberan, y el total mapeado se limita a max_bytes.
+    Lo usa el motor threads, donde cada envio bloquea hasta que el kernel toma la vista.
+    """
+
+    def __init__(self, min_file_size, max_file_size=32 * 1024 * 1024, max_bytes=256 * 1024 * 1024,
+                 idle_timeout=30.0, revalidate_interval=1.0):
+        self.min_file_size = min_file_size
+        self.max_file_size = max_file_size
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.revalidate_interval = revalidate_interval
+        self.maps = OrderedDict()  # {ruta: MappedFile}, el usado mas recientemente al final
+        self.total_bytes = 0
+        self.reserved = 0  # bytes de mapeos en curso (fuera del lock), ya descontados del presupuesto
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.maps_created = 0
+        self.unmapped = 0
+        self.running = False
+        self.thread = None
+        self.pid = None
+
+    def acquire(self, path):
+        """
+        Devuelve el MappedFile de path con una referencia tomada, o None si el archivo
+        no esta en el rango de tamaños del pool o no hay presupuesto. Llamar release() al terminar.
+        """
+        now = time.monotonic()
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is not None and now - mapped.checked_at < self.revalidate_interval:
+                return self._take(mapped, now)
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._retire_path(path)
+            return None
+        if not stat.S_ISREG(st.st_mode) or not self.min_file_size < st.st_size <= self.max_file_size:
+            self._retire_path(path)
+            return None
+
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is not None and mapped.mtime_ns == st.st_mtime_ns and mapped.size == st.st_size:
+                mapped.checked_at = now
+                return self._take(mapped, now)
+            # El archivo cambio: el mapeo viejo sigue valido para los envios en curso
+            if mapped is not None:
+                self._retire(mapped)
+            if not self._make_room(st.st_size):
+                return None
+            # Reservado antes de mapear: los hilos que mapean a la vez no superan max_bytes entre todos
+            self.reserved += st.st_size
+
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            with self.lock:
+                self.reserved -= st.st_size
+            return None
+        mapped = MappedFile(path, mm, st)
+
+        with self.lock:
+            self.reserved -= st.st_size
+            actual = self.maps.get(path)
+            if actual is not None and actual.mtime_ns == mapped.mtime_ns and actual.size == mapped.size:
+                # Otro hilo lo mapeo mientras tanto: se usa el suyo
+                mapped._unmap()
+                return self._take(actual, now)
+            if actual is not None:
+                self._retire(actual)
+            self.maps[path] = mapped
+            self.total_bytes += mapped.size
+            self.maps_created += 1
+            mapped.refs += 1
+            return mapped
+
+    def _take(self, mapped, now):
+        mapped.refs += 1
+        mapped.last_used = now
+        self.maps.move_to_end(mapped.path)
+        self.hits += 1
+        return mapped
+
+    def release(self, mapped):
+        """Devuelve la referencia tomada con acquire()"""
+        with self.lock:
+            mapped.refs -= 1
+            mapped.last_used = time.monotonic()
+            if mapped.retired and mapped.refs == 0:
+                mapped._unmap()
+                self.unmapped += 1
+
+    def _retire(self, mapped):
+        """Saca el mapeo del pool (con el lock tomado); se libera ya o al soltar la ultima referencia"""
+        if self.maps.get(mapped.path) is mapped:
+            del self.maps[mapped.path]
+            self.total_bytes -= mapped.size
+        mapped.retired = True
+        if mapped.refs == 0:
+            mapped._unmap()
+            self.unmapped += 1
+
+    def _retire_path(self, path):
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is not None:
+                self._retire(mapped)
+
+    def invalidate(self, path):
+        """Retira el mapeo de un archivo reemplazado; los envios en curso terminan con el mapeo anterior"""
+        self._retire_path(path)
+
+    def _make_room(self, size):
+        """Libera mapeos sin uso (los menos recientes primero) hasta que entre size bytes"""
+        if self.total_bytes + self.reserved + size <= self.max_bytes:
+            return True
+        for mapped in list(self.maps.values()):
+            if mapped.refs == 0:
+                self._retire(mapped)
+                if self.total_bytes + self.reserved + size <= self.max_bytes:
+                    return True
+        return False
+
+    def expire_idle(self):
+        """Libera los mapeos que nadie uso durante idle_timeout segundos"""
+        limite = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for mapped in list(self.maps.values()):
+                if mapped.refs == 0 and mapped.last_used < limite:
+                    self._retire(mapped)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.idle_timeout / 2)
+            self.expire_idle()
+
+    def start(self):
+        """Inicia el hilo que libera los mapeos inactivos (tambien en un proceso hijo creado con fork)"""
+        if self.running and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="MmapPool")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        with self.lock:
+            in_use = sum(1 for mapped in self.maps.values() if mapped.refs > 0)
+            return {
+                'maps': len(self.maps),
+                'in_use': in_use,
+                'bytes': self.total_bytes,
+                'reserved': self.reserved,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'maps_created': self.maps_created,
+                'unmapped': self.unmapped
+            }
@@ -0,0 +1,208 @@
+import multiprocessing
+import os
+import threading
+import signal
+import socket
+import time
+
+# Segundos entre revisiones del supervisor a sus procesos hijos
+INTERVALO_SUPERVISION = 1.0
+
+class ContadoresCompartidos:
+    """
+    Contadores por proceso worker en memoria compartida (multiprocessing.Array).
+    Cada worker escribe solo en su propio slot; el supervisor los lee todos.
+    """
+
+    CAMPOS = 3  # requests totales, clientes conectados, conexiones totales
+    REQUESTS, CONECTADOS, CONEXIONES = range(CAMPOS)
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self.array = multiprocessing.Array('q', num_workers * self.CAMPOS, lock=False)
+        self.slot = None
+        self.lock = None
+
+    def asignar_slot(self, slot):
+        """Se llama dentro del proceso worker antes de atender conexiones"""
+        self.slot = slot
+        # Los hilos del mismo worker comparten el slot: basta un lock local al proceso
+        self.lock = threading.Lock()
+
+    def _sumar(self, campo, valor):
+        with self.lock:
+            self.array[self.slot * self.CAMPOS + campo] += valor
+
+    def request(self):
+        self._sumar(self.REQUESTS, 1)
+
+    def conexion_abierta(self):
+        self._sumar(self.CONECTADOS, 1)
+        self._sumar(self.CONEXIONES, 1)
+
+    def conexion_cerrada(self):
+        self._sumar(self.CONECTADOS, -1)
+
+    def reiniciar_conectados(self, slot):
+        """Un worker que murio ya no tiene clientes conectados"""
+        self.array[slot * self.CAMPOS + self.CONECTADOS] = 0
+
+    def get_stats(self):
+        """Obtiene estadisticas por worker y totales"""
+        workers = []
+        for slot in range(self.num_workers):
+            base = slot * self.CAMPOS
+            workers.append({
+                'worker': slot,
+                'total_requests': self.array[base + self.REQUESTS],
+                'connected_clients': self.array[base + self.CONECTADOS],
+                'total_clients': self.array[base + self.CONEXIONES]
+            })
+        return {
+            'total_requests': sum(w['total_requests'] for w in workers),
+            'connected_clients': sum(w['connected_clients'] for w in workers),
+            'total_clients': sum(w['total_clients'] for w in workers),
+            'workers': workers
+        }
+
+def proceso_worker(slot, args, contadores):
+    """Punto de entrada de cada proceso hijo"""
+    import server
+
+    # Ctrl+C lo gestiona el supervisor; SIGTERM y SIGHUP los atiende el motor (drenaje y recarga)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for senal in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(senal, signal.SIG_DFL)
+
+    contadores.asignar_slot(slot)
+    server.contadores = contadores
+    sock = server.crear_socket_servidor(args.backlog, reuse_port=True)
+    sock_tls = None
+    if server.contexto_tls is not None:
+        # El contexto se heredo del supervisor: un ticket emitido por otro worker tambien se acepta aqui
+        sock_tls = server.crear_socket_servidor(args.backlog, reuse_port=True, port=args.tls_port)
+    print(f"[WORKER-{slot}] PID {multiprocessing.current_process().pid} escuchando con SO_REUSEPORT")
+    server.ejecutar_motor(sock, args, consola=False, servidor_tls=sock_tls)
+
+class Supervisor:
+    """
+    Lanza N procesos que escuchan HOST:PORT con SO_REUSEPORT, los reinicia si
+    terminan de forma inesperada y muestra sus contadores con el comando stats.
+    SIGHUP se reenvia a los workers (recargan la configuracion) y SIGTERM los drena.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.num_workers = args.procesos
+        self.contadores = ContadoresCompartidos(self.num_workers)
+        self.procesos = [None] * self.num_workers
+        self.reinicios = [0] * self.num_workers
+        self.activo = True
+
+    def iniciar_worker(self, slot):
+        proceso = multiprocessing.Process(
+            target=proceso_worker,
+            args=(slot, self.args, self.contadores),
+            name=f"Worker-{slot}"
+        )
+        proceso.daemon = True
+        proceso.start()
+        self.procesos[slot] = proceso
+
+    def vigilar(self):
+        """Reinicia los workers caidos mientras el supervisor este activo"""
+        while self.activo:
+            for slot, proceso in enumerate(self.procesos):
+                if not self.activo:
+                    break
+                if not proceso.is_alive():
+                    print(f"[SUPERVISOR] Worker-{slot} termino (codigo {proceso.exitcode}), reiniciando")
+                    self.contadores.reiniciar_conectados(slot)
+                    self.reinicios[slot] += 1
+                    self.iniciar_worker(slot)
+            time.sleep(INTERVALO_SUPERVISION)
+
+    def reenviar_senal(self, senal):
+        for proceso in self.procesos:
+            if proceso is not None and proceso.is_alive():
+                os.kill(proceso.pid, senal)
+
+    def instalar_senales(self):
+        def terminar(senal, frame):
+            self.activo = False
+
+        def recargar(senal, frame):
+            print("[SUPERVISOR] SIGHUP: recargando la configuracion de los workers")
+            self.reenviar_senal(signal.SIGHUP)
+
+        signal.signal(signal.SIGTERM, terminar)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, recargar)
+
+    def detener(self):
+        """Drena los workers con SIGTERM; los que no terminan a tiempo se matan"""
+        self.activo = False
+        for proceso in self.procesos:
+            if proceso is not None and proceso.is_alive():
+                proceso.terminate()
+        limite = time.monotonic() + self.args.drenaje_timeout + 5
+        for proceso in self.procesos:
+            if proceso is not None:
+                proceso.join(timeout=max(0, limite - time.monotonic()))
+                if proceso.is_alive():
+                    print(f"[SUPERVISOR] {proceso.name} no termino de drenar, se fuerza el cierre")
+                    proceso.kill()
+                    proceso.join()
+        print("[SUPERVISOR] Workers detenidos")
+
+    def print_stats(self):
+        """Imprime los contadores agregados de todos los workers"""
+        stats = self.contadores.get_stats()
+        print("\n" + "=" * 60)
+        print("ESTADISTICAS PRE-FORK")
+        print("=" * 60)
+        print(f"Workers: {self.num_workers}")
+        print(f"Clientes conectados: {stats['connected_clients']}")
+        print(f"Clientes totales: {stats['total_clients']}")
+        print(f"Total de requests: {stats['total_requests']}")
+        print("\nDetalle por worker:")
+        for worker in stats['workers']:
+            proceso = self.procesos[worker['worker']]
+            pid = proceso.pid if proceso is not None else "-"
+            print(f"  Worker-{worker['worker']} (PID {pid}) - Conectados: {worker['connected_clients']}, "
+                  f"Clientes: {worker['total_clients']}, Requests: {worker['total_requests']}, "
+                  f"Reinicios: {self.reinicios[worker['worker']]}")
+        print("=" * 60)
+
+    def consola(self):
+        while self.activo:
+            try:
+                cmd = input("\nComando (q=quit, stats=estadisticas): ").strip().lower()
+                if cmd == 'q':
+                    print("Cerrando servidor (los workers terminan las respuestas en curso)...")
+                    self.activo = False
+                elif cmd == 'stats':
+                    self.print_stats()
+            except:
+                break
+
+    def ejecutar(self):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            print("[SUPERVISOR] SO_REUSEPORT no esta disponible en este sistema operativo")
+            return
+
+        self.instalar_senales()
+        print(f"[SUPERVISOR] Iniciando {self.num_workers} workers")
+        for slot in range(self.num_workers):
+            self.iniciar_worker(slot)
+
+        thread = threading.Thread(target=self.consola)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            self.vigilar()
+        except KeyboardInterrupt:
+            print("\n[SUPERVISOR] Interrumpido por usuario")
+        finally:
+            self.detener()
@@ -0,0 +1,206 @@
+import math
+import os
+import threading
+import time
+
+class _Bucket:
+    """Estado de una IP: token bucket de requests y conexiones abiertas"""
+
+    __slots__ = ('tokens', 'updated', 'connections')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.connections = 0
+
+class _Stripe:
+    """Una particion de la tabla con su propio lock: IPs distintas rara vez compiten por el mismo"""
+
+    __slots__ = ('lock', 'buckets', 'limited', 'rejected')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}  # {ip: _Bucket}
+        self.limited = 0  # requests rechazados por el token bucket
+        self.rejected = 0  # conexiones rechazadas por el limite de conexiones simultaneas
+
+class RateLimiter:
+    """
+    Limites por IP: token bucket de requests (rate por segundo con rafagas de hasta burst)
+    y maximo de conexiones simultaneas. La tabla se reparte en particiones con lock propio y
+    un hilo elimina las IPs sin conexiones abiertas ni requests en idle_ttl segundos (su
+    bucket ya estaria lleno), asi la memoria depende de los clientes activos y no del historial.
+    Un limite en 0 esta desactivado y no toma ningun lock.
+    clock es el reloj en segundos (time.monotonic; las pruebas inyectan uno manual).
+    """
+
+    def __init__(self, rate=0, burst=0, max_connections=0, num_stripes=16, idle_ttl=60.0, clock=time.monotonic):
+        self.clock = clock
+        self.stripes = [_Stripe() for _ in range(num_stripes)]
+        self.num_stripes = num_stripes
+        self.idle_ttl = idle_ttl
+        self.configure(rate, burst, max_connections)
+        self.expired = 0
+        self.running = False
+        self.thread = None
+        self.pid = None
+
+    def configure(self, rate, burst, max_connections):
+        """Cambia los limites en caliente: los buckets existentes se ajustan en su proximo uso"""
+        self.rate = rate
+        # Sin rafaga explicita se permite un segundo de requests (al menos uno)
+        self.burst = burst if burst > 0 else max(1.0, rate)
+        self.max_connections = max_connections
+
+    def _stripe(self, ip):
+        return self.stripes[hash(ip) % self.num_stripes]
+
+    def _bucket(self, stripe, ip, now):
+        bucket = stripe.buckets.get(ip)
+        if bucket is None:
+            bucket = stripe.buckets[ip] = _Bucket(self.burst, now)
+        return bucket
+
+    def allow_request(self, ip):
+        """Consume un token de la IP. Devuelve 0 si el request pasa o los segundos hasta el proximo token"""
+        rate = self.rate
+        if rate <= 0:
+            return 0
+        stripe = self._stripe(ip)
+        now = self.clock()
+        with stripe.lock:
+            bucket = self._bucket(stripe, ip, now)
+            tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            if tokens >= 1:
+                bucket.tokens = tokens - 1
+                return 0
+            bucket.tokens = tokens
+            stripe.limited += 1
+            return (1 - tokens) / rate
+
+    def connection_opened(self, ip):
+        """Registra una conexion nueva de la IP; False si ya tiene max_connections abiertas"""
+        if self.max_connections <= 0:
+            return True
+        stripe = self._stripe(ip)
+        now = self.clock()
+        with stripe.lock:
+            bucket = self._bucket(stripe, ip, now)
+            if bucket.connections >= self.max_connections:
+                stripe.rejected += 1
+                return False
+            bucket.connections += 1
+            return True
+
+    def connection_closed(self, ip):
+        stripe = self._stripe(ip)
+        with stripe.lock:
+            bucket = stripe.buckets.get(ip)
+            if bucket is not None and bucket.connections > 0:
+                bucket.connections -= 1
+                bucket.updated = self.clock()
+
+    def expire_idle(self):
+        """Elimina las IPs inactivas, una particion a la vez para no retener mucho cada lock"""
+        limite = self.clock() - self.idle_ttl
+        expired = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                inactivas = [ip for ip, bucket in stripe.buckets.items()
+                             if bucket.connections == 0 and bucket.updated <= limite]
+                for ip in inactivas:
+                    del stripe.buckets[ip]
+            expired += len(inactivas)
+        self.expired += expired
+        return expired
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.idle_ttl / 2)
+            self.expire_idle()
+
+    def start(self):
+        """Inicia el hilo que expira las IPs inactivas (tambien en un proceso hijo creado con fork)"""
+        if self.running and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="RateLimiter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        tracked = limited = rejected = 0
+        for stripe in self.stripes:
+            with stripe.lock:
+                tracked += len(stripe.buckets)
+                limited += stripe.limited
+                rejected += stripe.rejected
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'max_connections': self.max_connections,
+            'tracked_ips': tracked,
+            'limited_requests': limited,
+            'rejected_connections': rejected,
+            'expired_ips': self.expired
+        }
+
+class BandwidthShaper:
+    """
+    Limite global de ancho de banda de salida (bytes por segundo) compartido por todas las
+    conexiones, con el algoritmo GCRA: cada envio reserva su turno en un reloj virtual
+    (tat) y el emisor espera lo que reserve() le indique. Se admiten rafagas de hasta
+    burst bytes sin espera. rate en 0 lo desactiva.
+    """
+
+    def __init__(self, rate=0, burst=256 * 1024, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.tat = 0.0  # instante (de clock) en que terminaria de salir lo ya reservado
+        self.shaped_bytes = 0
+        self.delay_total = 0.0
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+
+    def reserve(self, nbytes):
+        """Reserva nbytes ya enviados o por enviar; devuelve los segundos que el emisor debe esperar"""
+        rate = self.rate
+        if rate <= 0 or nbytes <= 0:
+            return 0.0
+        now = self.clock()
+        with self.lock:
+            tat = max(self.tat, now) + nbytes / rate
+            self.tat = tat
+            delay = tat - now - self.burst / rate
+            self.shaped_bytes += nbytes
+            if delay <= 0:
+                return 0.0
+            self.delay_total += delay
+            return delay
+
+    def backlog(self):
+        """Segundos que esperaria un envio que se reserve ahora (0 si hay margen de rafaga)"""
+        if self.rate <= 0:
+            return 0.0
+        return max(0.0, self.tat - self.clock() - self.burst / self.rate)
+
+    def get_stats(self):
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'shaped_bytes': self.shaped_bytes,
+            'delay_seconds': round(self.delay_total, 3),
+            'backlog_seconds': round(self.backlog(), 3)
+        }
+
+def retry_after(seconds):
+    """Segundos enteros para el header Retry-After (minimo 1)"""
+    return max(1, math.ceil(seconds))
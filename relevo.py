@@ -0,0 +1,143 @@
+import json
+import os
+import socket
+import threading
+
+# Segundos que espera cada lado del relevo una respuesta del otro
+RELEVO_TIMEOUT = 10.0
+PEDIDO = b"RELEVO\n"
+
+def _recibir_linea(conn):
+    data = b""
+    while not data.endswith(b"\n") and len(data) < 256:
+        chunk = conn.recv(256)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def pedir_sockets(ruta):
+    """
+    Proceso nuevo: pide los sockets de escucha al proceso en servicio por el socket
+    de control. Devuelve (conexion de control, {"http": socket, "https": socket}).
+    La conexion queda abierta hasta confirmar() que el proceso nuevo ya atiende.
+    """
+    if not hasattr(socket, "recv_fds"):
+        raise RuntimeError("El relevo de sockets necesita socket.recv_fds (Unix, Python 3.9+)")
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(RELEVO_TIMEOUT)
+    try:
+        conn.connect(ruta)
+        conn.sendall(PEDIDO)
+        msg, fds, _, _ = socket.recv_fds(conn, 4096, 4)
+    except OSError:
+        conn.close()
+        raise
+    nombres = json.loads(msg.decode()) if msg else []
+    if len(nombres) != len(fds):
+        for fd in fds:
+            os.close(fd)
+        conn.close()
+        raise RuntimeError("El proceso en servicio no entrego los sockets de escucha")
+    return conn, {nombre: socket.socket(fileno=fd) for nombre, fd in zip(nombres, fds)}
+
+def confirmar(conn):
+    """Proceso nuevo: avisa que ya acepta conexiones; el proceso anterior empieza a drenar"""
+    try:
+        conn.sendall(f"OK {os.getpid()}\n".encode())
+    finally:
+        conn.close()
+
+def escuchar_control(ruta, heredado=False):
+    """
+    Crea el socket de control en ruta. Falla si otro proceso en servicio lo esta usando,
+    salvo heredado=True: la ruta es del proceso anterior, que ya entrego los sockets.
+    """
+    if os.path.exists(ruta) and not heredado:
+        prueba = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            prueba.connect(ruta)
+            raise RuntimeError(f"Ya hay un servidor en el socket de control {ruta} (usar --heredar)")
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Quedo de un proceso que termino: se reemplaza
+            pass
+        finally:
+            prueba.close()
+    try:
+        os.unlink(ruta)
+    except FileNotFoundError:
+        pass
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.bind(ruta)
+    control.listen(1)
+    return control
+
+class ServidorRelevo:
+    """
+    Atiende el socket de control de un proceso en servicio. Cuando un proceso nuevo pide
+    el relevo le pasa los descriptores de los sockets de escucha (SCM_RIGHTS) y, al
+    recibir su confirmacion, llama a al_entregar() para que este proceso deje de aceptar
+    y drene sus conexiones. La cola de accept se comparte: no se pierde ninguna conexion.
+    Si el proceso nuevo no confirma, este sigue atendiendo como si nada.
+    """
+
+    def __init__(self, ruta, control, listeners, al_entregar):
+        self.ruta = ruta
+        self.control = control
+        self.listeners = listeners  # {nombre: socket de escucha}
+        self.al_entregar = al_entregar
+        self.thread = None
+
+    def _atender(self, conn):
+        conn.settimeout(RELEVO_TIMEOUT)
+        if _recibir_linea(conn) != PEDIDO:
+            return None
+        nombres = list(self.listeners)
+        socket.send_fds(conn, [json.dumps(nombres).encode()], [self.listeners[n].fileno() for n in nombres])
+        respuesta = _recibir_linea(conn)
+        if not respuesta.startswith(b"OK "):
+            return None
+        return respuesta[3:].strip().decode()
+
+    def _run(self):
+        while self.control is not None:
+            try:
+                conn, _ = self.control.accept()
+            except (OSError, AttributeError):
+                return
+            try:
+                pid = self._atender(conn)
+            except OSError as e:
+                print(f"[RELEVO] Relevo fallido, se sigue atendiendo: {e}")
+                pid = None
+            finally:
+                conn.close()
+            if pid is None:
+                continue
+            print(f"[RELEVO] Sockets de escucha entregados al proceso {pid}")
+            # La ruta ya es del proceso nuevo: se cierra sin borrarla
+            self.control.close()
+            self.control = None
+            self.al_entregar(pid)
+            return
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="Relevo")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Cierra el socket de control sin relevo (cierre ordenado): la ruta deja de existir"""
+        control, self.control = self.control, None
+        if control is None:
+            return
+        try:
+            # shutdown despierta al hilo bloqueado en accept()
+            control.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        control.close()
+        try:
+            os.unlink(self.ruta)
+        except FileNotFoundError:
+            pass
@@ -1,27 +1,138 @@
 import socket
 import os
+import sys
 import threading
 import uuid
+import argparse
+import random
+import time
+import json
+import ssl
+import signal
+import selectors
 from error_handler import HTTPErrorHandler
+from worker_pool import WorkerPool
+from file_cache import FileCache, PRECOMPRESSED_EXTENSIONS, brotli
+from clients_handler import ClientsHandler
+from idle_reaper import IdleReaper
+from metrics import ServerMetrics
+from static_index import StaticIndex
+from mmap_pool import MmapPool
+from dir_listing import DirectoryListing, FORMATS as FORMATOS_LISTADO
+from upload import Upload, UploadError, resolve_target
+from rate_limiter import RateLimiter, BandwidthShaper, retry_after
+import tls
+import relevo
+from http_parser import HTTPRequestParser, HTTPParseError
+from server_logger import ServerLogger, LEVELS
+from urllib.parse import parse_qs, quote
+from http_utils import make_etag, http_date, is_not_modified, parse_range, range_applies, accepted_encodings
 
 HOST = "0.0.0.0"
 PORT = 8081
 BASE_DIR = "files"
+INDICE_REFRESCO = 2.0  # segundos entre re-escaneos del indice de BASE_DIR
+BACKLOG = 128
+ENGINE = "threads"  # "threads" (pool de hilos) o "async" (event loop)
 
-clientes_conectados = {}
-contador_clientes = 0
-
-def get_content_type(filename):
-    if filename.endswith(".html"):
-        return "text/html; charset=utf-8"
-    elif filename.endswith(".txt"):
-        return "text/plain; charset=utf-8"
-    elif filename.endswith(".jpg") or filename.endswith(".jpeg"):
-        return "image/jpeg"
-    elif filename.endswith(".png"):
-        return "image/png"
-    else:
-        return "application/octet-stream"
+# Pool de hilos del motor "threads"
+POOL_WORKERS = 64
+POOL_COLA = 256
+RETRY_AFTER = 1  # segundos sugeridos al cliente cuando se responde 503
+
+# Modo pre-fork (0 = un solo proceso)
+PROCESOS = 0
+
+# Cache en memoria de archivos pequeños
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+CACHE_MAX_ARCHIVO = 256 * 1024
+CACHE_REVALIDACION = 1.0  # segundos entre os.stat de un mismo archivo cacheado
+COMPRESION_MIN_BYTES = 1024  # por debajo de esto comprimir no compensa
+
+# Archivos medianos (entre CACHE_MAX_ARCHIVO y MMAP_MAX_ARCHIVO) se sirven desde mapeos mmap compartidos.
+# Solo en el motor threads: sendmsg bloquea hasta enviar la vista. El transporte de asyncio copiaria
+# al heap lo que el cliente no leyo, asi que el motor async sigue usando sendfile para estos archivos
+MMAP_MAX_ARCHIVO = 32 * 1024 * 1024
+MMAP_MAX_BYTES = 256 * 1024 * 1024
+MMAP_INACTIVIDAD = 30.0  # segundos sin uso antes de liberar un mapeo
+
+# Listados de directorios sin index.html (HTML o JSON, paginados) y descarga como tar (?format=tar)
+LISTADO_POR_PAGINA = 1000
+LISTADO_CACHE_BYTES = 8 * 1024 * 1024
+
+# Conexiones persistentes (HTTP/1.1 keep-alive)
+KEEPALIVE_TIMEOUT = 15  # segundos de inactividad antes de que el reaper cierre la conexion
+TIMEOUT_SOCKET = 60  # respaldo del motor threads: limita envios a clientes que no leen
+MAX_REQUESTS_POR_CONEXION = 100
+DRENAJE_TIMEOUT = 30  # segundos para que terminen las respuestas en curso al cerrar el servidor
+
+# Limites por cliente y de ancho de banda (0 = sin limite); los excesos se responden con 429
+LIMITE_REQUESTS = 0  # requests por segundo por IP (token bucket)
+LIMITE_RAFAGA = 0  # requests seguidos que admite el bucket (0 = un segundo de requests)
+LIMITE_CONEXIONES = 0  # conexiones simultaneas por IP
+ANCHO_BANDA = 0  # bytes por segundo de salida compartidos por todas las conexiones
+ANCHO_BANDA_RAFAGA = 256 * 1024
+ANCHO_BANDA_MAX_ESPERA = 2.0  # segundos de envios en espera a partir de los cuales se rechazan requests
+BLOQUE_MODERADO = 64 * 1024  # con ancho de banda limitado los envios se parten en bloques de este tamaño
+LIMITES_INACTIVIDAD = 60.0  # segundos sin actividad antes de olvidar el estado de una IP
+
+# Subidas con PUT/POST a BASE_DIR (desactivadas por defecto: cualquier cliente podria escribir archivos)
+SUBIDAS = False
+MAX_TAMANO_SUBIDA = 1024 * 1024 * 1024
+METODOS_SUBIDA = ("PUT", "POST")
+
+# Limites del parser de requests
+MAX_TAMANO_HEADERS = 8192  # mas grande responde 431
+MAX_HEADERS = 100  # mas headers responde 431
+MAX_TAMANO_CUERPO = 1024 * 1024  # cuerpos mas grandes responden 413
+RECV_SIZE = 64 * 1024
+
+# Logging
+LOG_LEVEL = "info"
+ACCESS_LOG = "-"  # "-" = salida estandar
+ACCESS_LOG_FORMATO = "combined"  # "combined" o "json"
+ANALISIS_MUESTREO = 0.01  # fraccion de requests con analisis completo por capas (0 = nunca, 1 = todos)
+
+# HTTPS opcional en un segundo puerto (0 = desactivado)
+TLS_PORT = 0
+TLS_CERT = os.path.join("certs", "servidor.crt")
+TLS_KEY = os.path.join("certs", "servidor.key")
+TIMEOUT_HANDSHAKE = 10  # segundos para completar el handshake TLS
+
+# Relevo sin cortes: socket Unix por el que un proceso nuevo recibe los sockets de escucha ("" = desactivado)
+SOCKET_CONTROL = ""
+
+# Opciones que se aplican en caliente con SIGHUP (el resto requiere reiniciar)
+RECARGABLES = ("log_level", "analisis_muestreo", "keepalive_timeout", "timeout_socket", "max_requests",
+               "drenaje_timeout", "cache_max_bytes", "cache_max_archivo", "pool_workers", "pool_cola",
+               "limite_requests", "limite_rafaga", "limite_conexiones", "ancho_banda")
+
+# Endpoints de monitoreo servidos por el propio servidor
+RUTA_METRICAS = "/metrics"  # formato de texto de Prometheus
+RUTA_STATS = "/stats.json"
+
+pool = None
+contadores = None  # contadores compartidos con el supervisor en modo pre-fork
+cache_archivos = FileCache(CACHE_MAX_BYTES, CACHE_MAX_ARCHIVO, CACHE_REVALIDACION, COMPRESION_MIN_BYTES)
+limitador = RateLimiter(LIMITE_REQUESTS, LIMITE_RAFAGA, LIMITE_CONEXIONES, idle_ttl=LIMITES_INACTIVIDAD)
+ancho_banda = BandwidthShaper(ANCHO_BANDA, ANCHO_BANDA_RAFAGA)
+clients_handler = ClientsHandler(file_cache=cache_archivos, rate_limiter=limitador)
+reaper = IdleReaper(clients_handler, KEEPALIVE_TIMEOUT)
+metricas = ServerMetrics()
+indice_estatico = StaticIndex(BASE_DIR, INDICE_REFRESCO)
+listados = DirectoryListing(BASE_DIR, LISTADO_POR_PAGINA, LISTADO_CACHE_BYTES)
+mapeos = MmapPool(CACHE_MAX_ARCHIVO, MMAP_MAX_ARCHIVO, MMAP_MAX_BYTES, MMAP_INACTIVIDAD, CACHE_REVALIDACION)
+log = ServerLogger(LOG_LEVEL)
+contexto_tls = None  # ssl.SSLContext del listener HTTPS, compartido por todos los procesos
+drenando = threading.Event()  # cierre ordenado en curso: no se aceptan conexiones ni se mantienen keep-alive
+despertar_escucha = None  # lo registra el motor: saca al bucle de accept de su espera
+servidor_relevo = None
+ARGV = []  # argumentos originales: SIGHUP relee el archivo de configuracion y vuelve a aplicarlos encima
+config_actual = None
+
+# Identidad de red del servidor: se calcula una vez al iniciar, no en cada request
+IP_SERVIDOR = None
+MAC_SERVIDOR = None
 
 def obtener_direccion_mac():
     """Obtiene la dirección MAC del servidor usando uuid"""
@@ -39,246 +150,1278 @@ def obtener_direccion_mac():
     except Exception as e:
         return f"Error al obtener MAC: {str(e)}"
 
+def obtener_direccion_ip():
+    """Obtiene la dirección IP local del servidor"""
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return None
+
 def analizar_headers_http(request):
-    """Analiza y muestra los headers HTTP organizados por categorías"""
-    lines = request.splitlines()
-    if not lines:
-        return
-    
+    """Analiza los headers HTTP organizados por categorías. Devuelve el texto del analisis"""
+    lineas = []
     # Línea de request
-    print("=== REQUEST LINE ===")
-    print(lines[0])
-    print()
+    lineas.append("=== REQUEST LINE ===")
+    lineas.append(f"{request.method} {request.uri} {request.version}")
+    lineas.append("")
     
-    # Headers organizados
-    print("=== HEADERS HTTP ===")
-    headers = {}
-    for line in lines[1:]:
-        if not line.strip():  # Línea vacía fin de headers
-            break
-        if ':' in line:
-            key, value = line.split(':', 1)
-            headers[key.strip()] = value.strip()
+    # Headers organizados (ya parseados por HTTPRequestParser)
+    lineas.append("=== HEADERS HTTP ===")
+    headers = request.headers
     
     # Mostrar por categorías
-    print("Headers de Conexion:")
+    lineas.append("Headers de Conexion:")
     for key in ['Host', 'Connection']:
-        if key in headers:
-            print(f"  {key}: {headers[key]}")
+        if key.lower() in headers:
+            lineas.append(f"  {key}: {headers[key.lower()]}")
     
-    print("\nHeaders de User-Agent:")
+    lineas.append("\nHeaders de User-Agent:")
     for key in ['User-Agent', 'sec-ch-ua', 'sec-ch-ua-mobile', 'sec-ch-ua-platform']:
-        if key in headers:
-            print(f"  {key}: {headers[key]}")
+        if key.lower() in headers:
+            lineas.append(f"  {key}: {headers[key.lower()]}")
     
-    print("\nHeaders de Accept:")
+    lineas.append("\nHeaders de Accept:")
     for key in ['Accept', 'Accept-Encoding', 'Accept-Language']:
-        if key in headers:
-            print(f"  {key}: {headers[key]}")
+        if key.lower() in headers:
+            lineas.append(f"  {key}: {headers[key.lower()]}")
     
-    print("\nHeaders de Seguridad:")
+    lineas.append("\nHeaders de Seguridad:")
     for key in ['Cache-Control', 'Upgrade-Insecure-Requests', 'Sec-Fetch-Site', 
                 'Sec-Fetch-Mode', 'Sec-Fetch-User', 'Sec-Fetch-Dest']:
-        if key in headers:
-            print(f"  {key}: {headers[key]}")
+        if key.lower() in headers:
+            lineas.append(f"  {key}: {headers[key.lower()]}")
     
-    print("\nHeaders de Cache:")
+    lineas.append("\nHeaders de Cache:")
     for key in ['Cache-Control', 'Pragma']:
-        if key in headers:
-            print(f"  {key}: {headers[key]}")
+        if key.lower() in headers:
+            lineas.append(f"  {key}: {headers[key.lower()]}")
+    return "\n".join(lineas)
 
 def analizar_capas_red(addr, request):
-    """Analiza y muestra información de las diferentes capas de red"""
-    lines = request.splitlines()
-    if not lines:
-        return
+    """Analiza la información de las diferentes capas de red. Devuelve el texto del analisis"""
+    lineas = []
+    method, uri, http_version = request.method, request.uri, request.version
     
-    first_line = lines[0]
-    parts = first_line.split()
-    if len(parts) >= 3:
-        method, uri, http_version = parts[0], parts[1], parts[2]
-    else:
-        method, uri, http_version = "Unknown", "Unknown", "Unknown"
+    lineas.append("=== ANALISIS POR CAPAS DE RED ===")
     
-    print("=== ANALISIS POR CAPAS DE RED ===")
+    lineas.append("Capa de Aplicacion (HTTP):")
+    lineas.append(f"  Metodo: {method}")
+    lineas.append(f"  URI: {uri}")
+    lineas.append(f"  Version HTTP: {http_version}")
     
-    print("Capa de Aplicacion (HTTP):")
-    print(f"  Metodo: {method}")
-    print(f"  URI: {uri}")
-    print(f"  Version HTTP: {http_version}")
+    lineas.append("\nCapa de Transporte (TCP):")
+    lineas.append(f"  Puerto origen (cliente): {addr[1]}")
+    lineas.append(f"  Puerto destino (servidor): {PORT}")
+    lineas.append(f"  Protocolo: TCP")
     
-    print("\nCapa de Transporte (TCP):")
-    print(f"  Puerto origen (cliente): {addr[1]}")
-    print(f"  Puerto destino (servidor): {PORT}")
-    print(f"  Protocolo: TCP")
+    lineas.append("\nCapa de Red (IP):")
+    lineas.append(f"  Direccion IP origen: {addr[0]}")
+    # Calculadas una sola vez al iniciar el servidor
+    lineas.append(f"  Direccion IP destino: {IP_SERVIDOR or 'No disponible'}")
+    lineas.append(f"  Protocolo: IPv4")
     
-    print("\nCapa de Red (IP):")
-    print(f"  Direccion IP origen: {addr[0]}")
+    lineas.append("\nCapa de Enlace (Ethernet):")
+    lineas.append(f"  Direccion MAC servidor: {MAC_SERVIDOR or 'No disponible'}")
+    lineas.append(f"  Direccion MAC cliente: No disponible (nivel aplicacion)")
+    lineas.append(f"  Tipo de trama: Ethernet II")
+    lineas.append(f"  Nota: Comunicacion local via loopback - MACs fisicas no utilizadas")
+    return "\n".join(lineas)
+
+def crear_parser():
+    # PUT y POST se entregan al llegar los headers: su cuerpo se escribe a disco de a partes
+    return HTTPRequestParser(MAX_TAMANO_HEADERS, MAX_HEADERS, MAX_TAMANO_CUERPO, METODOS_SUBIDA, MAX_TAMANO_SUBIDA)
+
+def metodos_permitidos():
+    return "GET, HEAD, OPTIONS, PUT, POST" if SUBIDAS else "GET, HEAD, OPTIONS"
+
+def leer_request(conn, parser, recv_buffer):
+    """Lee del socket hasta que el parser tenga un request completo. Devuelve None si el cliente cerro"""
+    while True:
+        inicio = time.perf_counter_ns()
+        request = parser.next_request()
+        if request is not None:
+            metricas.observe("parse", time.perf_counter_ns() - inicio)
+            return request
+        n = conn.recv_into(recv_buffer)
+        if n == 0:
+            return None
+        parser.feed(memoryview(recv_buffer)[:n])
+
+def responder_error_parseo(conn, error):
+    """Responde a un HTTPParseError con el status que corresponde y cierra la conexion"""
+    if error.status == 431:
+        return HTTPErrorHandler.request_header_fields_too_large(conn, error.message)
+    if error.status == 413:
+        return HTTPErrorHandler.payload_too_large(conn, error.message)
+    return HTTPErrorHandler.bad_request(conn, error.message)
+
+def es_comprimible(content_type):
+    """Solo vale la pena comprimir texto: las imagenes ya vienen comprimidas"""
+    return content_type.startswith("text/")
+
+def seleccionar_representacion(entrada, accept_encoding):
+    """
+    Negocia Content-Encoding. Prioriza un archivo precomprimido (archivo.br / archivo.gz),
+    luego la compresion al vuelo cacheada y por ultimo el archivo original.
+    Devuelve (entry del cache o None, ruta a servir, encoding o None)
+    """
+    filepath, content_type = entrada.path, entrada.content_type
+    aceptadas = accepted_encodings(accept_encoding)
+    vary = es_comprimible(content_type)
+
+    # Las variantes precomprimidas disponibles ya estan en el indice
+    for encoding in aceptadas:
+        variante = entrada.variants.get(encoding)
+        if variante is not None:
+            return cache_archivos.get(variante, content_type, encoding, vary=True), variante, encoding
+
+    if vary:
+        for encoding in aceptadas:
+            if encoding == "br" and brotli is None:
+                continue
+            entry = cache_archivos.get(filepath, content_type, encoding, compress_on_the_fly=True, vary=True)
+            if entry is not None:
+                return entry, filepath, encoding
+
+    return cache_archivos.get(filepath, content_type, vary=vary), filepath, None
+
+def trabajo_previo(request):
+    """
+    Motor async: trabajo bloqueante que despachar_request haria en el event loop (comprimir al
+    vuelo o leer un directorio que cambio), para adelantarlo en un hilo. None si no hay
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    entrada = indice_estatico.lookup(request.uri)
+    if entrada is None or (pide_formato(request.uri) and entrada.uri.endswith("/index.html")):
+        directorio = listados.resolve(request.uri)
+        if directorio is None:
+            return None
+        return lambda: listados.preload(directorio[0])
+    if compresion_pendiente(request, entrada):
+        return lambda: seleccionar_representacion(entrada, request.get_header("Accept-Encoding"))
+    return None
+
+def compresion_pendiente(request, entrada):
+    """True si el GET comprimiria al vuelo porque la variante aun no esta en la cache (mismo orden que seleccionar_representacion)"""
+    if request.method != "GET" or not es_comprimible(entrada.content_type):
+        return False
+    if not cache_archivos.min_compress_size <= entrada.size <= cache_archivos.max_compress_size:
+        return False
+    aceptadas = accepted_encodings(request.get_header("Accept-Encoding"))
+    if any(encoding in entrada.variants for encoding in aceptadas):
+        return False
+    for encoding in aceptadas:
+        if encoding == "br" and brotli is None:
+            continue
+        entry = cache_archivos.peek(entrada.path, encoding)
+        return entry is None or entry.mtime_ns != entrada.mtime_ns or entry.source_size != entrada.size
+    return False
+
+def rangos_solicitados(request, size, etag, last_modified):
+    """Rangos pedidos con Range/If-Range, [] si no son satisfacibles o None para responder completo"""
+    range_header = request.get_header("Range")
+    if range_header is None:
+        return None
+    if not range_applies(request.get_header("If-Range"), etag, last_modified):
+        return None
+    return parse_range(range_header, size)
+
+class ConexionMedida:
+    """
+    Envuelve la conexion para contar los bytes enviados en cada respuesta (access log)
+    y marcar cuando empieza el envio (separa las etapas resolve y send en las metricas).
+    Con ANCHO_BANDA los envios salen en bloques y esperan su turno en el BandwidthShaper.
+    """
+
+    __slots__ = ('conn', 'bytes_enviados', 'primer_envio_ns')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.bytes_enviados = 0
+        self.primer_envio_ns = 0
+
+    def moderar(self, nbytes):
+        """Espera el turno de los bytes enviados; el motor async lo hace al enviarlos, sin dormir el loop"""
+        moderar = getattr(self.conn, "moderar", None)
+        if moderar is not None:
+            moderar(nbytes)
+            return
+        demora = ancho_banda.reserve(nbytes)
+        if demora > 0:
+            time.sleep(demora)
+
+    def sendall(self, data):
+        if not self.primer_envio_ns:
+            self.primer_envio_ns = time.perf_counter_ns()
+        if ancho_banda.rate > 0:
+            vista = memoryview(data)
+            for inicio in range(0, len(vista), BLOQUE_MODERADO):
+                bloque = vista[inicio:inicio + BLOQUE_MODERADO]
+                self.conn.sendall(bloque)
+                self.moderar(len(bloque))
+        else:
+            self.conn.sendall(data)
+        self.bytes_enviados += len(data)
+
+    def sendmsg(self, buffers):
+        if not self.primer_envio_ns:
+            self.primer_envio_ns = time.perf_counter_ns()
+        if ancho_banda.rate > 0:
+            # Se envia como maximo un bloque: send_buffers reintenta con el resto como en un envio parcial
+            bloque, restante = [], BLOQUE_MODERADO
+            for buffer in buffers:
+                if restante <= 0:
+                    break
+                buffer = memoryview(buffer)[:restante]
+                bloque.append(buffer)
+                restante -= len(buffer)
+            sent = self.conn.sendmsg(bloque)
+            self.moderar(sent)
+        else:
+            sent = self.conn.sendmsg(buffers)
+        self.bytes_enviados += sent
+        return sent
+
+    def sendfile(self, f, offset=0, count=None):
+        if not self.primer_envio_ns:
+            self.primer_envio_ns = time.perf_counter_ns()
+        # El motor async encola el archivo una sola vez y vaciar() lo modera bloque a bloque
+        if ancho_banda.rate <= 0 or getattr(self.conn, "moderar", None) is not None:
+            sent = self.conn.sendfile(f, offset, count)
+            self.bytes_enviados += sent or 0
+            return sent
+        sent = 0
+        while count is None or sent < count:
+            bloque = BLOQUE_MODERADO if count is None else min(BLOQUE_MODERADO, count - sent)
+            enviado = self.conn.sendfile(f, offset + sent, bloque) or 0
+            if not enviado:
+                break
+            sent += enviado
+            self.bytes_enviados += enviado
+            self.moderar(enviado)
+        return sent
+
+    def close(self):
+        self.conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+def procesar_request(conn, addr, client_name, request, permitir_keep_alive, subida=None):
+    """
+    Procesa un request, envia la respuesta y registra el acceso. Devuelve True si la conexion sigue abierta.
+    En un PUT/POST subida es el archivo ya recibido (ver iniciar_subida)
+    """
+    inicio = time.perf_counter_ns()
+    conn.bytes_enviados = 0
+    conn.primer_envio_ns = 0
+
+    # El analisis completo por capas es caro: solo se hace para una muestra de los requests
+    if ANALISIS_MUESTREO > 0 and random.random() < ANALISIS_MUESTREO:
+        log.info(
+            f"[{client_name}] === ANALISIS COMPLETO DEL REQUEST (muestra) ===\n"
+            f"{analizar_capas_red(addr, request)}\n\n"
+            f"{analizar_headers_http(request)}\n\n"
+            f"=== CONTENIDO COMPLETO DEL REQUEST ===\n{request.text}"
+        )
+
+    # Limites: token bucket de la IP y envios acumulados en el limite de ancho de banda
+    # (una subida ya los paso antes de leer el cuerpo)
+    espera = 0 if subida is not None else limitador.allow_request(addr[0])
+    if not espera and subida is None and ancho_banda.backlog() > ANCHO_BANDA_MAX_ESPERA:
+        espera = ancho_banda.backlog()
+    if espera:
+        mensaje = HTTPErrorHandler.too_many_requests(conn, retry_after(espera), permitir_keep_alive,
+                                                     head=request.method == "HEAD")
+        keep_alive = permitir_keep_alive
+    else:
+        mensaje, keep_alive = despachar_request(conn, client_name, request, permitir_keep_alive, subida)
+
+    diferir = getattr(conn, "registrar_al_vaciar", None)
+    if diferir is not None:
+        # Motor async: el cuerpo se envia (y se cuenta) despues, en vaciar()
+        diferir(lambda: registrar_respuesta(conn, addr, client_name, request, mensaje, inicio))
+    else:
+        registrar_respuesta(conn, addr, client_name, request, mensaje, inicio)
+    return keep_alive
+
+def registrar_respuesta(conn, addr, client_name, request, mensaje, inicio):
+    """Metricas por etapa y access log de una respuesta ya enviada"""
+    fin = time.perf_counter_ns()
+    primer_envio = conn.primer_envio_ns or fin
+    status = int(mensaje[:3])
+    metricas.observe("resolve", primer_envio - inicio)
+    metricas.observe("send", fin - primer_envio)
+    metricas.request(status, conn.bytes_enviados)
+
+    duracion_ms = (fin - inicio) / 1e6
+    log.access(addr, request.method, request.uri, request.version, status, conn.bytes_enviados,
+               duracion_ms, request.get_header("Referer"), request.get_header("User-Agent"))
+    log.debug(f"[{client_name}] {mensaje}")
+
+def iniciar_subida(conn, addr, client_name, request):
+    """
+    PUT/POST: valida el destino y los limites apenas llegan los headers, antes de leer el cuerpo,
+    y responde 100 Continue si el cliente lo espera. Devuelve el Upload donde el motor escribe
+    el cuerpo, o None si ya se respondio un error: la conexion se cierra sin leer el cuerpo.
+    """
+    inicio = time.perf_counter_ns()
+    conn.bytes_enviados = 0
+    conn.primer_envio_ns = 0
+    espera = limitador.allow_request(addr[0])
     try:
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-        print(f"  Direccion IP destino: {local_ip}")
-    except:
-        print(f"  Direccion IP destino: No disponible")
-    print(f"  Protocolo: IPv4")
-    
-    print("\nCapa de Enlace (Ethernet):")
-    mac_servidor = obtener_direccion_mac()
-    print(f"  Direccion MAC servidor: {mac_servidor}")
-    print(f"  Direccion MAC cliente: No disponible (nivel aplicacion)")
-    print(f"  Tipo de trama: Ethernet II")
-    print(f"  Nota: Comunicacion local via loopback - MACs fisicas no utilizadas")
-
-def manejar_cliente(conn, addr, client_id):
-    client_name = f"Cliente-{client_id}"
-    clientes_conectados[client_id] = {
-        'name': client_name,
-        'addr': addr,
-        'connected': True
-    }
-    
-    print(f"\n[{client_name}] CONEXION ACEPTADA")
-    print(f"[{client_name}] Direccion remota: {addr[0]}:{addr[1]}")
+        if espera:
+            mensaje = HTTPErrorHandler.too_many_requests(conn, retry_after(espera))
+        elif not SUBIDAS:
+            mensaje = HTTPErrorHandler.method_not_allowed(conn, request.method, metodos_permitidos())
+        elif request.version not in ("HTTP/1.0", "HTTP/1.1"):
+            mensaje = HTTPErrorHandler.http_version_not_supported(conn, request.version)
+        elif request.get_header("Content-Length") is None and request.get_header("Transfer-Encoding") is None:
+            # Sin largo ni chunked el cuerpo no tiene fin: no se acepta una subida vacia por omision
+            mensaje = HTTPErrorHandler.length_required(conn)
+        else:
+            uri, destino = resolve_target(BASE_DIR, request.uri)
+            subida = Upload(uri, destino)
+            if request.version == "HTTP/1.1" and (request.get_header("Expect") or "").lower() == "100-continue":
+                HTTPErrorHandler.continue_response(conn)
+            log.debug(f"[{client_name}] Recibiendo {request.method} {uri} -> {subida.temp_path}")
+            return subida
+    except UploadError as e:
+        if e.status == 404:
+            mensaje = HTTPErrorHandler.not_found(conn, e.message)
+        else:
+            mensaje = HTTPErrorHandler.bad_request(conn, e.message)
+    except OSError as e:
+        mensaje = HTTPErrorHandler.internal_server_error(conn, f"No se pudo crear el archivo: {e}")
+    registrar_respuesta(conn, addr, client_name, request, mensaje, inicio)
+    return None
+
+def leer_cuerpo(conn, parser, recv_buffer, subida):
+    """Motor threads: escribe el cuerpo de la subida a medida que llega. False si el cliente cerro antes"""
+    while True:
+        data = parser.read_body()
+        if data is None:
+            n = conn.recv_into(recv_buffer)
+            if n == 0:
+                return False
+            parser.feed(memoryview(recv_buffer)[:n])
+        elif data:
+            subida.write(data)
+        else:
+            return True
+
+def completar_subida(conn, client_name, subida, keep_alive):
+    """Publica el archivo recibido y descarta las copias del anterior en la cache, el mmap y el indice"""
+    try:
+        creado = subida.commit()
+    except OSError as e:
+        return HTTPErrorHandler.internal_server_error(conn, f"No se pudo guardar {subida.uri}: {e}"), False
+    cache_archivos.invalidate(subida.path)
+    mapeos.invalidate(subida.path)
+    indice_estatico.add(subida.uri, subida.path)
+    log.info(f"[{client_name}] Archivo {'creado' if creado else 'reemplazado'}: {subida.uri} ({subida.size} bytes)")
+    return HTTPErrorHandler.upload_response(conn, subida.uri, creado, subida.size, keep_alive), keep_alive
+
+def responder_head(conn, request, entrada, keep_alive):
+    """
+    HEAD de un archivo sin abrirlo: los headers salen de la cache (si la copia en memoria
+    coincide con el indice) o de los metadatos del indice, con la misma negociacion que el GET
+    """
+    content_type = entrada.content_type
+    vary = es_comprimible(content_type)
+    aceptadas = accepted_encodings(request.get_header("Accept-Encoding"))
+
+    for encoding in aceptadas:
+        variante = indice_estatico.revalidate(
+            indice_estatico.entries.get(entrada.uri + PRECOMPRESSED_EXTENSIONS[encoding])) \
+            if encoding in entrada.variants else None
+        if variante is not None:
+            etag = make_etag(variante.mtime_ns, variante.size)
+            return servir_head(conn, request, content_type, variante.size, variante.mtime_ns,
+                               f'{etag[:-1]}-{encoding}"', encoding, True, keep_alive)
+
+    # Compresion al vuelo solo si ya esta cacheada: si no, el GET tambien enviaria el original
+    for encoding in (aceptadas if vary else []) + [None]:
+        entry = cache_archivos.peek(entrada.path, encoding)
+        if entry is not None and entry.mtime_ns == entrada.mtime_ns and entry.source_size == entrada.size:
+            if is_not_modified(request.get_header("If-None-Match"), request.get_header("If-Modified-Since"),
+                               entry.etag, entry.mtime):
+                return HTTPErrorHandler.not_modified(conn, entry.etag, entry.last_modified, keep_alive,
+                                                     entry.validators)
+            return HTTPErrorHandler.cached_head(conn, entry, keep_alive)
+
+    return servir_head(conn, request, content_type, entrada.size, entrada.mtime_ns,
+                       make_etag(entrada.mtime_ns, entrada.size), None, vary, keep_alive)
+
+def servir_head(conn, request, content_type, size, mtime_ns, etag, encoding, vary, keep_alive):
+    """Responde 304 o los headers de un 200 armados con los metadatos del indice"""
+    last_modified = http_date(mtime_ns / 1e9)
+    if is_not_modified(request.get_header("If-None-Match"), request.get_header("If-Modified-Since"),
+                       etag, mtime_ns / 1e9):
+        return HTTPErrorHandler.not_modified(conn, etag, last_modified, keep_alive)
+    return HTTPErrorHandler.head_response(conn, content_type, size, keep_alive, etag, last_modified, encoding, vary)
+
+def responder_metricas(conn, uri, keep_alive, head=False):
+    """Sirve /metrics o /stats.json con las metricas de este proceso"""
+    clientes = clients_handler.get_stats()
+    pool_stats = pool.get_stats() if pool is not None else None
+
+    if uri == RUTA_METRICAS:
+        gauges = {
+            'cache_bytes': ("Bytes ocupados por la cache de archivos.", clientes['cache']['bytes']),
+            'cache_entries': ("Entradas en la cache de archivos.", clientes['cache']['entries'])
+        }
+        if pool_stats is not None:
+            gauges['pool_busy_workers'] = ("Hilos del pool atendiendo una conexion.", pool_stats['busy_workers'])
+            gauges['pool_queue_depth'] = ("Conexiones esperando un hilo libre.", pool_stats['queue_depth'])
+        if limitador.rate > 0 or limitador.max_connections > 0:
+            gauges['ratelimit_tracked_ips'] = ("IPs con estado en la tabla de limites.",
+                                               limitador.get_stats()['tracked_ips'])
+        if ancho_banda.rate > 0:
+            gauges['bandwidth_backlog_seconds'] = ("Segundos de envios en espera del limite de ancho de banda.",
+                                                   ancho_banda.backlog())
+        counters = {
+            'log_dropped_records_total': ("Registros de log descartados con el buffer lleno.", log.dropped)
+        }
+        body = metricas.prometheus(clientes['connected_clients'], gauges, counters).encode()
+        return HTTPErrorHandler.success_response(conn, "text/plain; version=0.0.4; charset=utf-8", body, keep_alive,
+                                                 head)
+
+    stats = metricas.snapshot()
+    stats['clients'] = clientes
+    stats['pool'] = pool_stats
+    stats['reaper'] = reaper.get_stats()
+    stats['indice'] = indice_estatico.get_stats()
+    stats['mmap'] = mapeos.get_stats()
+    stats['listados'] = listados.get_stats()
+    stats['log'] = log.get_stats()
+    stats['tls'] = tls.get_stats(contexto_tls) if contexto_tls is not None else None
+    stats['limites'] = {'clientes': limitador.get_stats(), 'ancho_banda': ancho_banda.get_stats()}
+    body = json.dumps(stats).encode()
+    return HTTPErrorHandler.success_response(conn, "application/json", body, keep_alive, head)
+
+def servir_mapeado(conn, request, mapeado, content_type, keep_alive, vary):
+    """Responde 304, 416, 206 o 200 con el cuerpo tomado de un MappedFile"""
+    etag, last_modified = mapeado.etag, mapeado.last_modified
+    if is_not_modified(request.get_header("If-None-Match"), request.get_header("If-Modified-Since"),
+                       etag, mapeado.mtime):
+        return HTTPErrorHandler.not_modified(conn, etag, last_modified, keep_alive)
+    ranges = rangos_solicitados(request, mapeado.size, etag, last_modified)
+    if ranges == []:
+        return HTTPErrorHandler.range_not_satisfiable(conn, mapeado.size, keep_alive)
+    if ranges:
+        return HTTPErrorHandler.partial_content(conn, content_type, mapeado.view, mapeado.size, ranges,
+                                                keep_alive, etag, last_modified)
+    return HTTPErrorHandler.buffer_response(conn, content_type, mapeado.view, keep_alive, etag, last_modified, vary)
+
+def pide_formato(uri):
+    """True si el query string tiene el parametro format (?format=json|tar lista el directorio aunque tenga index.html)"""
+    query = uri.partition("?")[2]
+    return bool(query) and "format" in parse_qs(query)
 
+def content_disposition(nombre):
+    """
+    Header Content-Disposition de una descarga: filename solo con ASCII imprimible y con
+    comillas y barras escapadas, y el nombre exacto en filename* (RFC 6266)
+    """
+    ascii_seguro = "".join(c if " " <= c < "\x7f" else "_" for c in nombre)
+    ascii_seguro = ascii_seguro.replace("\\", "\\\\").replace('"', '\\"')
+    return f"Content-Disposition: attachment; filename=\"{ascii_seguro}\"; filename*=UTF-8''{quote(nombre)}\r\n"
+
+def responder_directorio(conn, client_name, request, directorio, url, keep_alive):
+    """Listado paginado de un directorio (?page=N, ?format=json) o el directorio completo como tar (?format=tar)"""
+    query = parse_qs(request.uri.partition("?")[2])
+    formato = query.get("format", [None])[0]
+    if formato is None:
+        formato = "json" if "application/json" in (request.get_header("Accept") or "") else "html"
     try:
-        request = conn.recv(1024).decode(errors="ignore")
-        if not request:
-            print(f"[{client_name}] Request vacio")
+        pagina = int(query.get("page", ["1"])[0])
+    except ValueError:
+        pagina = 0
+    if formato not in FORMATOS_LISTADO or pagina < 1:
+        return HTTPErrorHandler.bad_request(conn, "Parametros de listado invalidos (format=html|json|tar, page>=1)"), False
+    # Sin Transfer-Encoding chunked en HTTP/1.0
+    chunked = request.version == "HTTP/1.1"
+    head = request.method == "HEAD"
+
+    if formato == "tar":
+        nombre = os.path.basename(url.rstrip("/")) or os.path.basename(os.path.realpath(BASE_DIR))
+        if not chunked:
+            # Cuerpo de largo desconocido: delimitado por el cierre de la conexion
+            keep_alive = False
+        mensaje = HTTPErrorHandler.stream_response(
+            conn, "application/x-tar", listados.tar_stream(directorio, nombre), keep_alive,
+            chunked_encoding=chunked, extra_headers=content_disposition(f"{nombre}.tar"),
+            head=head)
+        log.debug(f"[{client_name}] Directorio {url} enviado como tar")
+        return mensaje, keep_alive
+
+    listado = listados.page(directorio, url, pagina, formato)
+    if listado is None:
+        return HTTPErrorHandler.not_found(conn, f"{url}?page={pagina}", keep_alive, head), keep_alive
+    if is_not_modified(request.get_header("If-None-Match"), request.get_header("If-Modified-Since"),
+                       listado.etag, listado.mtime):
+        return HTTPErrorHandler.not_modified(conn, listado.etag, listado.last_modified, keep_alive), keep_alive
+    content_type = "application/json" if formato == "json" else "text/html; charset=utf-8"
+    body = listado.body
+    if body is None and (head or not chunked):
+        # HEAD necesita el Content-Length: la pagina se renderiza completa (y queda en la cache)
+        body = b"".join(listado.chunks)
+    if head:
+        mensaje = HTTPErrorHandler.head_response(conn, content_type, len(body), keep_alive, listado.etag,
+                                                 listado.last_modified)
+    elif body is not None:
+        mensaje = HTTPErrorHandler.buffer_response(conn, content_type, body, keep_alive, listado.etag,
+                                                   listado.last_modified)
+    else:
+        # Primera vez: la pagina se envia a medida que se renderiza y queda en la cache
+        mensaje = HTTPErrorHandler.stream_response(conn, content_type, listado.chunks, keep_alive, listado.etag,
+                                                   listado.last_modified)
+    log.debug(f"[{client_name}] Listado de {url} pagina {pagina} ({formato}, "
+              f"{'cache' if listado.body is not None else 'renderizado'})")
+    return mensaje, keep_alive
+
+def despachar_request(conn, client_name, request, permitir_keep_alive, subida=None):
+    """Valida el request y envia la respuesta. Devuelve (mensaje de estado, sigue abierta la conexion)"""
+    # El parser ya valido la request line
+    method, uri, version = request.method, request.uri, request.version
+
+    # Validaciones
+    if version not in ["HTTP/1.0", "HTTP/1.1"]:
+        return HTTPErrorHandler.http_version_not_supported(conn, version), False
+
+    keep_alive = permitir_keep_alive and request.keep_alive
+
+    if method == "OPTIONS":
+        return HTTPErrorHandler.options_response(conn, metodos_permitidos(), keep_alive), keep_alive
+    if subida is not None:
+        return completar_subida(conn, client_name, subida, keep_alive)
+    if method not in ("GET", "HEAD"):
+        return HTTPErrorHandler.method_not_implemented(conn, method, metodos_permitidos()), False
+    head = method == "HEAD"
+
+    if uri in (RUTA_METRICAS, RUTA_STATS):
+        return responder_metricas(conn, uri, keep_alive, head), keep_alive
+
+    # Resolver archivo: una busqueda en el indice, sin tocar el disco para 404 ni rutas con '..'
+    entrada = indice_estatico.lookup(uri)
+    if entrada is None or (pide_formato(uri) and entrada.uri.endswith("/index.html")):
+        # El indice solo tiene archivos: un directorio sin index.html se lista (con ?format= aunque lo tenga)
+        directorio = listados.resolve(uri)
+        if directorio is None:
+            return HTTPErrorHandler.not_found(conn, uri, keep_alive, head), keep_alive
+        return responder_directorio(conn, client_name, request, *directorio, keep_alive)
+    # Un archivo editado en el lugar no se nota hasta el proximo escaneo completo: HEAD responde
+    # con los metadatos del indice y las variantes .gz/.br podrian haber quedado viejas
+    if head or entrada.variants:
+        entrada = indice_estatico.revalidate(entrada)
+        if entrada is None:
+            return HTTPErrorHandler.not_found(conn, uri, keep_alive, head), keep_alive
+    filename = entrada.uri.lstrip("/")
+    content_type = entrada.content_type
+    log.debug(f"[{client_name}] Archivo resuelto: {uri} -> {entrada.path}")
+
+    if head:
+        return responder_head(conn, request, entrada, keep_alive), keep_alive
+
+    if_none_match = request.get_header("If-None-Match")
+    if_modified_since = request.get_header("If-Modified-Since")
+    entry, ruta, encoding = seleccionar_representacion(entrada, request.get_header("Accept-Encoding"))
+    vary = es_comprimible(content_type)
+
+    # Los archivos pequeños (y sus variantes comprimidas) se sirven desde memoria sin tocar el disco
+    if entry is not None:
+        if is_not_modified(if_none_match, if_modified_since, entry.etag, entry.mtime):
+            return HTTPErrorHandler.not_modified(conn, entry.etag, entry.last_modified, keep_alive,
+                                                 entry.validators), keep_alive
+        # Los rangos solo se aplican a la representacion sin comprimir
+        ranges = None
+        if encoding is None:
+            ranges = rangos_solicitados(request, entry.size, entry.etag, entry.last_modified)
+        if ranges == []:
+            success_msg = HTTPErrorHandler.range_not_satisfiable(conn, entry.size, keep_alive)
+        elif ranges:
+            success_msg = HTTPErrorHandler.partial_content(conn, content_type, entry.body, entry.size, ranges,
+                                                           keep_alive, entry.etag, entry.last_modified)
+        else:
+            success_msg = HTTPErrorHandler.cached_response(conn, entry, keep_alive)
+        log.debug(f"[{client_name}] Archivo servido desde cache: {filename} ({content_type}, "
+                  f"encoding={encoding or 'identity'}, {'keep-alive' if keep_alive else 'close'})")
+        return success_msg, keep_alive
+
+    # Archivos medianos sin comprimir: vistas de un mapeo compartido entre todas las conexiones
+    if encoding is None and ENGINE == "threads":
+        mapeado = mapeos.acquire(ruta)
+        if mapeado is not None:
+            try:
+                success_msg = servir_mapeado(conn, request, mapeado, content_type, keep_alive, vary)
+            finally:
+                mapeos.release(mapeado)
+            log.debug(f"[{client_name}] Archivo servido desde mmap: {filename} ({content_type})")
+            return success_msg, keep_alive
+
+    # Servir archivo (puede haberse borrado despues del ultimo escaneo del indice)
+    try:
+        f = open(ruta, "rb")
+    except (FileNotFoundError, IsADirectoryError):
+        return HTTPErrorHandler.not_found(conn, filename, keep_alive), keep_alive
+    with f:
+        st = os.fstat(f.fileno())
+        etag = make_etag(st.st_mtime_ns, st.st_size)
+        if encoding is not None:
+            etag = f'{etag[:-1]}-{encoding}"'
+        last_modified = http_date(st.st_mtime)
+        if is_not_modified(if_none_match, if_modified_since, etag, st.st_mtime):
+            return HTTPErrorHandler.not_modified(conn, etag, last_modified, keep_alive), keep_alive
+        # El archivo (o sus rangos) se transmite con sendfile, sin leerlo completo en memoria
+        ranges = None
+        if encoding is None:
+            ranges = rangos_solicitados(request, st.st_size, etag, last_modified)
+        if ranges == []:
+            success_msg = HTTPErrorHandler.range_not_satisfiable(conn, st.st_size, keep_alive)
+        elif ranges:
+            success_msg = HTTPErrorHandler.partial_content(conn, content_type, f, st.st_size, ranges,
+                                                           keep_alive, etag, last_modified)
+        else:
+            success_msg = HTTPErrorHandler.file_response(conn, content_type, f, keep_alive, etag, last_modified,
+                                                         encoding, vary)
+    log.debug(f"[{client_name}] Archivo servido: {os.path.basename(ruta)} ({content_type}, "
+              f"encoding={encoding or 'identity'}, {'keep-alive' if keep_alive else 'close'})")
+    return success_msg, keep_alive
+
+def admitir_conexion(conn, addr, cifrada):
+    """
+    Limite de conexiones simultaneas por IP, antes de registrar la conexion. Si se supera
+    responde 429 y cierra (una conexion TLS sin handshake solo se cierra) y devuelve False.
+    """
+    if limitador.connection_opened(addr[0]):
+        return True
+    if cifrada:
+        conn.close()
+        error_msg = "conexion TLS cerrada"
+    else:
+        try:
+            error_msg = HTTPErrorHandler.too_many_requests(conn, RETRY_AFTER)
+        except OSError:
             conn.close()
-            return
+            error_msg = "429 Too Many Requests"
+    log.warning(f"[LIMITES] Conexion de {addr[0]} rechazada ({limitador.max_connections} abiertas): {error_msg}")
+    return False
 
-        print(f"\n[{client_name}] === ANALISIS COMPLETO DEL REQUEST ===")
-        
-        # Análisis por capas de red
-        analizar_capas_red(addr, request)
-        
-        # Análisis detallado de headers HTTP
-        analizar_headers_http(request)
-        
-        print(f"\n[{client_name}] === CONTENIDO COMPLETO DEL REQUEST ===")
-        print("=" * 60)
-        print(request)
-        print("=" * 60)
-
-        # Procesamiento del request
-        lines = request.splitlines()
-        if not lines:
-            error_msg = HTTPErrorHandler.bad_request(conn)
-            print(f"[{client_name}] {error_msg}")
-            return
+def registrar_cliente(conn, addr):
+    """Registra la conexion en el ClientsHandler y la agenda en el reaper de inactividad"""
+    client_id, client_name = clients_handler.add_client(conn, addr)
+    reaper.schedule(client_id)
+    return client_id, client_name
 
-        first_line = lines[0]
-        parts = first_line.split()
-        if len(parts) < 3:
-            error_msg = HTTPErrorHandler.bad_request(conn)
-            print(f"[{client_name}] {error_msg}")
-            return
+class OutboxConexion:
+    """
+    Envia los mensajes de broadcast pendientes de una conexion del motor threads sin bloquear.
+    Si el hilo de la conexion esta respondiendo (tiene lock_envio) no se hace nada:
+    ese hilo vacia el outbox al terminar la respuesta.
+    """
 
-        method, uri, version = parts[0], parts[1], parts[2]
-        print(f"[{client_name}] Resumen: Metodo={method}, URI={uri}, Version={version}")
+    __slots__ = ('client_id', 'sock', 'lock_envio', 'mensaje_cortado')
 
-        # Validaciones
-        if method != "GET":
-            error_msg = HTTPErrorHandler.method_not_implemented(conn, method)
-            print(f"[{client_name}] {error_msg}")
+    def __init__(self, client_id, sock, lock_envio):
+        self.client_id = client_id
+        self.sock = sock
+        self.lock_envio = lock_envio
+        self.mensaje_cortado = False  # el primer mensaje del outbox ya salio en parte
+
+    def vaciar(self):
+        if not self.lock_envio.acquire(blocking=False):
             return
+        try:
+            chunks = clients_handler.take_output(self.client_id)
+            enviados = 0
+            while enviados < len(chunks):
+                chunk = chunks[enviados]
+                try:
+                    # El socket tiene timeout (descriptor no bloqueante): os.write devuelve EAGAIN en vez de esperar
+                    n = os.write(self.sock.fileno(), chunk)
+                except OSError:
+                    break
+                if n < len(chunk):
+                    chunks[enviados] = memoryview(chunk)[n:]
+                    self.mensaje_cortado = True
+                    break
+                self.mensaje_cortado = False
+                enviados += 1
+            # Lo que no entro en el buffer del socket vuelve al outbox hasta el proximo tick
+            clients_handler.output_done(self.client_id, enviados, chunks[enviados:])
+        finally:
+            self.lock_envio.release()
 
-        if version not in ["HTTP/1.0", "HTTP/1.1"]:
-            error_msg = HTTPErrorHandler.http_version_not_supported(conn, version)
-            print(f"[{client_name}] {error_msg}")
+    def completar(self):
+        """
+        Con lock_envio tomado y antes de escribir una respuesta: termina (bloqueando) el
+        mensaje que quedo a medias, para que la respuesta no caiga en el medio
+        """
+        if not self.mensaje_cortado:
+            return
+        self.mensaje_cortado = False
+        chunks = clients_handler.take_output(self.client_id)
+        if not chunks:
             return
+        try:
+            self.sock.sendall(chunks[0])
+        except OSError:
+            clients_handler.output_done(self.client_id, 0, chunks)
+            raise
+        clients_handler.output_done(self.client_id, 1, chunks[1:])
 
-        # Resolver archivo
-        if uri == "/":
-            filename = "index.html"
-        else:
-            filename = uri.lstrip("/")
+def enviar_outbox_tls(client_id, conn):
+    """
+    Envia los broadcast pendientes de una conexion TLS desde su propio hilo: un SSLSocket
+    no admite que otro hilo escriba mientras este lee, asi que no se registra flusher
+    y los mensajes salen despues de cada respuesta
+    """
+    chunks = clients_handler.take_output(client_id)
+    if not chunks:
+        return
+    try:
+        conn.sendall(b"".join(chunks))
+    except OSError:
+        clients_handler.output_done(client_id, 0)
+        return
+    clients_handler.output_done(client_id, len(chunks))
 
-        filepath = os.path.join(BASE_DIR, filename)
-        print(f"[{client_name}] Buscando archivo: {filename}")
+def negociar_tls(conn, client_id, client_name):
+    """Handshake TLS del lado servidor, medido en las metricas. Devuelve el SSLSocket o None si fallo"""
+    inicio = time.perf_counter_ns()
+    try:
+        conn = contexto_tls.wrap_socket(conn, server_side=True, do_handshake_on_connect=False)
+        # El reaper y la consola cierran la conexion registrada: ahora es el socket TLS
+        clients_handler.set_client_conn(client_id, conn)
+        conn.settimeout(TIMEOUT_HANDSHAKE)
+        conn.do_handshake()
+    except (ssl.SSLError, OSError) as e:
+        metricas.handshake_failed()
+        log.debug(f"[{client_name}] Handshake TLS fallido: {e}")
+        conn.close()
+        return None
+    metricas.handshake(conn.session_reused, time.perf_counter_ns() - inicio)
+    log.debug(f"[{client_name}] {conn.version()} {conn.cipher()[0]}, ALPN={conn.selected_alpn_protocol()}, "
+              f"sesion {'reanudada' if conn.session_reused else 'nueva'}")
+    return conn
 
-        if not os.path.exists(filepath):
-            error_msg = HTTPErrorHandler.not_found(conn, filename)
-            print(f"[{client_name}] {error_msg}")
+def manejar_cliente(conn, addr, client_id, cifrada=False):
+    client_name = f"Cliente-{client_id}"
+    log.debug(f"[{client_name}] CONEXION ACEPTADA desde {addr[0]}:{addr[1]}")
+    # Sin Nagle: las respuestas pequeñas (y las de requests en pipeline) salen sin esperar el ACK
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if cifrada:
+        conn = negociar_tls(conn, client_id, client_name)
+        if conn is None:
+            clients_handler.remove_client(client_id)
             return
+    if contadores is not None:
+        contadores.conexion_abierta()
+
+    # Los broadcast se escriben entre respuestas, nunca en medio de una
+    lock_envio = threading.Lock()
+    sock = conn
+    if cifrada:
+        outbox = None
+        vaciar = lambda: enviar_outbox_tls(client_id, sock)
+    else:
+        outbox = OutboxConexion(client_id, sock, lock_envio)
+        vaciar = outbox.vaciar
+        clients_handler.set_flusher(client_id, vaciar)
+
+    # La inactividad entre requests la controla el reaper (cierra el socket con shutdown);
+    # el timeout del socket solo es un respaldo para envios que no avanzan
+    conn.settimeout(TIMEOUT_SOCKET)
+    conn = ConexionMedida(conn)
+    parser = crear_parser()
+    recv_buffer = bytearray(RECV_SIZE)
+    requests_atendidos = 0
+
+    try:
+        # Bucle de conexion persistente: los requests en pipeline quedan en el buffer del parser
+        while requests_atendidos < MAX_REQUESTS_POR_CONEXION:
+            try:
+                request = leer_request(conn, parser, recv_buffer)
+            except socket.timeout:
+                log.debug(f"[{client_name}] Timeout del socket ({TIMEOUT_SOCKET}s)")
+                break
+            except HTTPParseError as e:
+                error_msg = responder_error_parseo(conn, e)
+                log.warning(f"[{client_name}] {error_msg}: {e.message}")
+                break
 
-        # Servir archivo
-        content_type = get_content_type(filename)
-        with open(filepath, "rb") as f:
-            body_bytes = f.read()
+            if request is None:
+                if requests_atendidos == 0:
+                    log.debug(f"[{client_name}] Request vacio")
+                break
 
-        success_msg = HTTPErrorHandler.success_response(conn, content_type, body_bytes)
-        print(f"[{client_name}] {success_msg}")
-        print(f"[{client_name}] Archivo servido: {filename}")
-        print(f"[{client_name}] Tamaño: {len(body_bytes)} bytes")
-        print(f"[{client_name}] Content-Type: {content_type}")
+            requests_atendidos += 1
+            if contadores is not None:
+                contadores.request()
+            # El ultimo request permitido (o cualquiera durante el drenaje) se responde con Connection: close
+            permitir_keep_alive = requests_atendidos < MAX_REQUESTS_POR_CONEXION and not drenando.is_set()
+            clients_handler.update_client_activity(client_id)
+            subida = None
+            if request.streaming:
+                # PUT/POST: se valida con los headers y el cuerpo va a disco a medida que llega
+                with lock_envio:
+                    if outbox is not None:
+                        outbox.completar()
+                    subida = iniciar_subida(conn, addr, client_name, request)
+                if subida is None:
+                    break
+                try:
+                    completo = leer_cuerpo(conn, parser, recv_buffer, subida)
+                except HTTPParseError as e:
+                    subida.abort()
+                    error_msg = responder_error_parseo(conn, e)
+                    log.warning(f"[{client_name}] {error_msg}: {e.message}")
+                    break
+                except (socket.timeout, OSError) as e:
+                    subida.abort()
+                    log.debug(f"[{client_name}] Subida interrumpida: {e}")
+                    break
+                if not completo:
+                    subida.abort()
+                    log.debug(f"[{client_name}] El cliente cerro antes de terminar la subida")
+                    break
+            with lock_envio:
+                if outbox is not None:
+                    outbox.completar()
+                seguir = procesar_request(conn, addr, client_name, request, permitir_keep_alive, subida)
+            clients_handler.set_client_idle(client_id)
+            if not seguir or drenando.is_set():
+                break
+            vaciar()
 
     except Exception as e:
-        error_msg = HTTPErrorHandler.internal_server_error(conn, str(e))
-        print(f"[{client_name}] {error_msg}")
+        try:
+            error_msg = HTTPErrorHandler.internal_server_error(conn, str(e))
+            log.error(f"[{client_name}] {error_msg}")
+        except OSError:
+            log.error(f"[{client_name}] Error: {e}")
     finally:
         conn.close()
-        clientes_conectados[client_id]['connected'] = False
-        print(f"[{client_name}] CONEXION CERRADA")
-        print(f"[ESTADISTICAS] Clientes activos: {len([c for c in clientes_conectados.values() if c['connected']])}")
+        clients_handler.remove_client(client_id)
+        if contadores is not None:
+            contadores.conexion_cerrada()
+        log.debug(f"[{client_name}] CONEXION CERRADA ({requests_atendidos} requests atendidos)")
 
-def main():
+def crear_socket_servidor(backlog, reuse_port=False, port=None):
+    """Crea el socket de escucha en HOST:PORT (o en el puerto indicado)"""
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen(10)
+    if reuse_port:
+        # Varios procesos escuchan el mismo puerto y el kernel reparte las conexiones
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((HOST, PORT if port is None else port))
+    server.listen(backlog)
+    return server
 
-    print("=" * 60)
-    print("SERVIDOR HTTP - CONEXIONES PERSISTENTES INDEFINIDAS")
-    print(f"Escuchando en: {HOST}:{PORT}")
-    print(f"Directorio base: {BASE_DIR}")
-    print(f"MAC del servidor: {obtener_direccion_mac()}")
-    print("=" * 60)
+def config_a_argumentos(ruta):
+    """
+    Convierte el archivo de configuracion en argumentos de linea de comandos. Es un objeto
+    JSON con las mismas claves que las opciones, p. ej. {"port": 8080, "pool_workers": 32}
+    """
+    with open(ruta, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("se esperaba un objeto JSON")
+    argumentos = []
+    for clave, valor in config.items():
+        opcion = "--" + clave.replace("_", "-")
+        if valor is True:
+            argumentos.append(opcion)
+        elif valor is not False and valor is not None:
+            argumentos += [opcion, str(valor)]
+    return argumentos
 
-    # Comando thread para manejar desconexiones
-    def comando_handler():
-        while True:
-            try:
-                cmd = input("\nComando (q=quit, stats=estadisticas, disconnect=desconectar todos): ").strip().lower()
-                if cmd == 'q':
-                    print("Cerrando servidor...")
-                    clients_handler.disconnect_all_clients()
-                    os._exit(0)
-                elif cmd == 'stats':
-                    clients_handler.print_stats()
-                elif cmd == 'disconnect':
-                    disconnected = clients_handler.disconnect_all_clients()
-                    print(f"Desconectados {disconnected} clientes")
-                elif cmd == 'broadcast':
-                    msg = input("Mensaje para broadcast: ")
-                    sent = clients_handler.broadcast_message(msg)
-                    print(f"Mensaje enviado a {sent} clientes")
-            except:
+def crear_parser_argumentos():
+    parser = argparse.ArgumentParser(description="Servidor HTTP de archivos estaticos")
+    parser.add_argument("--config",
+                        help="Archivo JSON de configuracion (la linea de comandos tiene prioridad; SIGHUP lo relee)")
+    parser.add_argument("--host", default=HOST,
+                        help="Direccion IP de escucha")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="Puerto TCP de escucha")
+    parser.add_argument("--base-dir", default=BASE_DIR,
+                        help="Directorio de los archivos servidos")
+    parser.add_argument("--tls-port", type=int, default=TLS_PORT,
+                        help="Puerto del listener HTTPS (0 = desactivado)")
+    parser.add_argument("--tls-cert", default=TLS_CERT,
+                        help="Certificado PEM del listener HTTPS")
+    parser.add_argument("--tls-key", default=TLS_KEY,
+                        help="Clave privada PEM del listener HTTPS")
+    parser.add_argument("--tls-generar", action="store_true",
+                        help="Genera un certificado autofirmado de pruebas si no existe")
+    parser.add_argument("--engine", choices=["threads", "async"], default=ENGINE,
+                        help="Motor de atencion: pool de hilos o event loop asyncio")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help="Tamaño de la cola de conexiones pendientes de accept()")
+    parser.add_argument("--pool-workers", type=int, default=POOL_WORKERS,
+                        help="Cantidad de hilos trabajadores del motor threads")
+    parser.add_argument("--pool-cola", type=int, default=POOL_COLA,
+                        help="Conexiones que pueden esperar un hilo libre antes de responder 503")
+    parser.add_argument("--procesos", type=int, default=PROCESOS,
+                        help="Modo pre-fork: cantidad de procesos con SO_REUSEPORT (0 = un solo proceso)")
+    parser.add_argument("--cache-max-bytes", type=int, default=CACHE_MAX_BYTES,
+                        help="Presupuesto en bytes de la cache de archivos")
+    parser.add_argument("--cache-max-archivo", type=int, default=CACHE_MAX_ARCHIVO,
+                        help="Tamaño maximo de un archivo cacheado en memoria")
+    parser.add_argument("--keepalive-timeout", type=float, default=KEEPALIVE_TIMEOUT,
+                        help="Segundos de inactividad antes de cerrar una conexion keep-alive")
+    parser.add_argument("--timeout-socket", type=float, default=TIMEOUT_SOCKET,
+                        help="Segundos maximos de un envio que no avanza (motor threads)")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS_POR_CONEXION,
+                        help="Requests por conexion keep-alive antes de cerrarla")
+    parser.add_argument("--limite-requests", type=float, default=LIMITE_REQUESTS,
+                        help="Requests por segundo por IP (0 = sin limite); el exceso recibe 429")
+    parser.add_argument("--limite-rafaga", type=float, default=LIMITE_RAFAGA,
+                        help="Requests seguidos permitidos por IP (0 = un segundo de requests)")
+    parser.add_argument("--limite-conexiones", type=int, default=LIMITE_CONEXIONES,
+                        help="Conexiones simultaneas por IP (0 = sin limite)")
+    parser.add_argument("--ancho-banda", type=int, default=ANCHO_BANDA,
+                        help="Bytes por segundo de salida de todo el servidor (0 = sin limite)")
+    parser.add_argument("--subidas", action="store_true",
+                        help="Acepta PUT/POST para crear o reemplazar archivos de --base-dir")
+    parser.add_argument("--max-subida", type=int, default=MAX_TAMANO_SUBIDA,
+                        help="Tamaño maximo en bytes del cuerpo de una subida (mas grande responde 413)")
+    parser.add_argument("--drenaje-timeout", type=float, default=DRENAJE_TIMEOUT,
+                        help="Segundos para terminar las respuestas en curso al cerrar (SIGTERM o q)")
+    parser.add_argument("--socket-control", default=SOCKET_CONTROL,
+                        help="Socket Unix para el relevo sin cortes de los sockets de escucha")
+    parser.add_argument("--heredar", action="store_true",
+                        help="Toma los sockets de escucha del proceso en servicio en --socket-control y lo drena")
+    parser.add_argument("--log-level", choices=list(LEVELS), default=LOG_LEVEL,
+                        help="Nivel de detalle del log de diagnostico")
+    parser.add_argument("--access-log", default=ACCESS_LOG,
+                        help="Archivo del access log ('-' = salida estandar)")
+    parser.add_argument("--access-log-formato", choices=["combined", "json"], default=ACCESS_LOG_FORMATO,
+                        help="Formato de las lineas del access log")
+    parser.add_argument("--analisis-muestreo", type=float, default=ANALISIS_MUESTREO,
+                        help="Fraccion de requests con analisis completo por capas (0 a 1)")
+    return parser
+
+# Se arma una sola vez: los valores por defecto son los del modulo antes de aplicar cualquier configuracion
+_parser_argumentos = None
+
+def parse_args(argv):
+    global _parser_argumentos
+    if _parser_argumentos is None:
+        _parser_argumentos = crear_parser_argumentos()
+    parser = _parser_argumentos
+    args = parser.parse_args(argv)
+    if args.config:
+        try:
+            desde_archivo = config_a_argumentos(args.config)
+        except (OSError, ValueError) as e:
+            parser.error(f"--config {args.config}: {e}")
+        # El archivo va primero: si una opcion esta en los dos lados, gana la linea de comandos
+        args = parser.parse_args(desde_archivo + list(argv))
+    return args
+
+def aplicar_config(args):
+    """Aplica las opciones recargables (al iniciar y con cada SIGHUP)"""
+    global ANALISIS_MUESTREO, KEEPALIVE_TIMEOUT, TIMEOUT_SOCKET, MAX_REQUESTS_POR_CONEXION, DRENAJE_TIMEOUT
+    global config_actual
+    log.set_level(args.log_level)
+    ANALISIS_MUESTREO = args.analisis_muestreo
+    KEEPALIVE_TIMEOUT = reaper.timeout = args.keepalive_timeout
+    TIMEOUT_SOCKET = args.timeout_socket
+    MAX_REQUESTS_POR_CONEXION = args.max_requests
+    DRENAJE_TIMEOUT = args.drenaje_timeout
+    cache_archivos.resize(args.cache_max_bytes, args.cache_max_archivo)
+    # Los archivos que ya no entran en la cache pasan al pool de mmap
+    mapeos.min_file_size = args.cache_max_archivo
+    if pool is not None:
+        pool.resize(args.pool_workers, args.pool_cola)
+    limitador.configure(args.limite_requests, args.limite_rafaga, args.limite_conexiones)
+    ancho_banda.configure(args.ancho_banda, ANCHO_BANDA_RAFAGA)
+    config_actual = args
+
+def recargar_config():
+    """Relee el archivo de configuracion (SIGHUP o comando reload) y aplica lo que se puede cambiar en caliente"""
+    try:
+        nuevos = parse_args(ARGV)
+    except SystemExit:
+        log.error("[CONFIG] Configuracion invalida, se mantiene la actual")
+        return False
+    anteriores = config_actual
+    cambios = [clave for clave in RECARGABLES if getattr(nuevos, clave) != getattr(anteriores, clave)]
+    fijas = [clave for clave, valor in vars(nuevos).items()
+             if clave not in RECARGABLES and valor != getattr(anteriores, clave)]
+    for clave in fijas:
+        setattr(nuevos, clave, getattr(anteriores, clave))
+    aplicar_config(nuevos)
+    resumen = ", ".join(f"{clave}={getattr(nuevos, clave)}" for clave in cambios) or "sin cambios"
+    log.info(f"[CONFIG] Configuracion recargada: {resumen}")
+    if fijas:
+        log.warning(f"[CONFIG] Requieren reiniciar el servidor (no se aplicaron): {', '.join(fijas)}")
+    return True
+
+def iniciar_drenaje(motivo):
+    """
+    Cierre ordenado: deja de aceptar conexiones, cierra las keep-alive que esperan su
+    proximo request y deja terminar las respuestas en curso (con Connection: close)
+    """
+    if drenando.is_set():
+        return
+    drenando.set()
+    log.info(f"[DRENAJE] {motivo}: no se aceptan conexiones nuevas, {clients_handler.count_connected()} "
+             f"abiertas (hasta {DRENAJE_TIMEOUT}s para terminar)")
+    if servidor_relevo is not None:
+        servidor_relevo.stop()
+    if despertar_escucha is not None:
+        despertar_escucha()
+    clients_handler.disconnect_idle_clients("cierre del servidor")
+
+def esperar_drenaje(timeout):
+    """Espera que se cierren las conexiones; las que terminan su respuesta y quedan inactivas se cierran"""
+    limite = time.monotonic() + timeout
+    while clients_handler.count_connected() > 0:
+        if time.monotonic() >= limite:
+            restantes = clients_handler.disconnect_all_clients()
+            log.warning(f"[DRENAJE] Timeout: {restantes} conexiones cerradas sin terminar")
+            return False
+        clients_handler.disconnect_idle_clients("cierre del servidor")
+        time.sleep(0.1)
+    return True
+
+def atender_senales(senales):
+    """Hilo que recibe las señales con sigwait: SIGHUP recarga la configuracion, SIGTERM drena y cierra"""
+    while True:
+        senal = signal.sigwait(senales)
+        if senal == signal.SIGHUP:
+            recargar_config()
+        else:
+            iniciar_drenaje("SIGTERM")
+
+def instalar_senales():
+    """
+    Bloquea SIGHUP y SIGTERM antes de crear los demas hilos (heredan la mascara): solo las
+    recibe el hilo de sigwait, aunque el hilo principal este esperando en select()
+    """
+    if not hasattr(signal, "pthread_sigmask"):
+        # Windows: sin SIGHUP ni sigwait
+        signal.signal(signal.SIGTERM, lambda senal, frame: iniciar_drenaje("SIGTERM"))
+        return
+    senales = {signal.SIGHUP, signal.SIGTERM}
+    signal.pthread_sigmask(signal.SIG_BLOCK, senales)
+    thread = threading.Thread(target=atender_senales, args=(senales,), name="Senales")
+    thread.daemon = True
+    thread.start()
+
+def comando_handler():
+    """Consola interactiva del servidor"""
+    while True:
+        try:
+            cmd = input("\nComando (q=quit, stats=estadisticas, disconnect=desconectar todos, "
+                        "reload=recargar configuracion): ").strip().lower()
+            if cmd == 'q':
+                print("Cerrando servidor (se terminan las respuestas en curso)...")
+                iniciar_drenaje("comando q")
                 break
+            elif cmd == 'reload':
+                recargar_config()
+            elif cmd == 'stats':
+                if pool is not None:
+                    pool.print_stats()
+                clients_handler.print_stats()
+                stats = reaper.get_stats()
+                print(f"Reaper: {stats['reaped']} conexiones inactivas cerradas (timeout {stats['timeout']}s), "
+                      f"{stats['pending']} agendadas")
+            elif cmd == 'disconnect':
+                disconnected = clients_handler.disconnect_all_clients()
+                print(f"Desconectados {disconnected} clientes")
+            elif cmd == 'broadcast':
+                msg = input("Mensaje para broadcast: ")
+                result = clients_handler.broadcast_message(msg)
+                print(f"Mensaje encolado para {result['queued']} clientes "
+                      f"({result['dropped']} descartados, {result['disconnected']} desconectados por outbox lleno)")
+        except:
+            break
+
+def encolar_conexion(conn, addr, cifrada):
+    """Registra la conexion aceptada y la encola en el pool (o la rechaza con 503 si la cola esta llena)"""
+    if not admitir_conexion(conn, addr, cifrada):
+        return
+    client_id, _ = registrar_cliente(conn, addr)
+
+    # Control de admision: si la cola esta llena se rechaza rapido con 503
+    if not pool.submit(conn, addr, client_id, cifrada):
+        if cifrada:
+            # Sin handshake no se puede responder: solo se cierra
+            conn.close()
+            error_msg = "conexion TLS cerrada"
+        else:
+            try:
+                error_msg = HTTPErrorHandler.service_unavailable(conn, RETRY_AFTER)
+            except OSError:
+                conn.close()
+                error_msg = "503 Service Unavailable"
+        clients_handler.remove_client(client_id)
+        log.warning(f"[POOL] Cliente-{client_id} rechazado: {error_msg}")
+        return
+    log.debug(f"[POOL] Cliente-{client_id} encolado")
+
+def aceptar_conexiones(listeners, despertador):
+    """
+    Bucle de accept del motor threads sobre todos los sockets de escucha (HTTP y HTTPS).
+    Termina al empezar el drenaje: el despertador lo saca del select() sin tocar los
+    sockets de escucha, que pueden estar compartidos con el proceso que tomo el relevo.
+    """
+    selector = selectors.DefaultSelector()
+    for sock, cifrada in listeners:
+        # No bloqueante: con pre-fork o durante un relevo otro proceso puede ganar el accept()
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, cifrada)
+    selector.register(despertador, selectors.EVENT_READ, None)
+    try:
+        while not drenando.is_set():
+            for key, _ in selector.select():
+                if key.data is None:
+                    continue
+                try:
+                    conn, addr = key.fileobj.accept()
+                except (BlockingIOError, InterruptedError, ConnectionAbortedError):
+                    continue
+                conn.setblocking(True)
+                encolar_conexion(conn, addr, key.data)
+    finally:
+        selector.close()
+
+def ejecutar_motor(server, args, consola=True, servidor_tls=None):
+    """Atiende conexiones sobre los sockets de escucha (HTTP y opcionalmente HTTPS) con el motor elegido"""
+    global pool, despertar_escucha
+
+    # Antes que cualquier hilo: todos heredan la mascara de señales
+    instalar_senales()
+    # Con fork los hilos del log y del reaper no pasan al proceso hijo: se inician aqui
+    log.start()
+    reaper.start()
+    indice_estatico.start()
+    mapeos.start()
+    limitador.start()
+    if servidor_relevo is not None:
+        servidor_relevo.start()
+
+    if consola:
+        thread = threading.Thread(target=comando_handler)
+        thread.daemon = True
+        thread.start()
+
+    if args.engine == "async":
+        import async_server
+        async_server.ejecutar(server, args.backlog, servidor_tls)
+    else:
+        pool = WorkerPool(manejar_cliente, args.pool_workers, args.pool_cola)
+        log.info(f"[POOL] {args.pool_workers} hilos trabajadores, cola de {args.pool_cola} conexiones")
+
+        despertador, aviso = socket.socketpair()
+        despertar_escucha = lambda: aviso.send(b"\0")
+        listeners = [(server, False)]
+        if servidor_tls is not None:
+            listeners.append((servidor_tls, True))
+        try:
+            aceptar_conexiones(listeners, despertador)
+        except KeyboardInterrupt:
+            iniciar_drenaje("Ctrl+C")
+        # Se cierra solo la copia de este proceso: tras un relevo el socket sigue escuchando en el nuevo
+        for sock, _ in listeners:
+            sock.close()
+        esperar_drenaje(DRENAJE_TIMEOUT)
+        pool.shutdown()
+
+    log.info("[DRENAJE] Servidor detenido")
+    log.stop()
+
+def main(argv=None):
+    global IP_SERVIDOR, MAC_SERVIDOR, HOST, PORT, BASE_DIR, ARGV, contexto_tls, servidor_relevo
+    global SUBIDAS, MAX_TAMANO_SUBIDA, ENGINE
+    ARGV = list(sys.argv[1:] if argv is None else argv)
+    args = parse_args(ARGV)
+    HOST, PORT, BASE_DIR = args.host, args.port, args.base_dir
+    SUBIDAS, MAX_TAMANO_SUBIDA = args.subidas, args.max_subida
+    ENGINE = args.engine
+    indice_estatico.base_dir = listados.base_dir = BASE_DIR
+    aplicar_config(args)
+
+    IP_SERVIDOR = obtener_direccion_ip()
+    MAC_SERVIDOR = obtener_direccion_mac()
+    access_stream = None if args.access_log == "-" else open(args.access_log, "a", encoding="utf-8")
+    log.set_access_log(access_stream, args.access_log_formato)
+
+    if args.tls_port:
+        if args.tls_generar and not os.path.exists(args.tls_cert):
+            tls.generar_certificado(args.tls_cert, args.tls_key)
+            print(f"Certificado autofirmado de pruebas generado en '{args.tls_cert}'")
+        # Se crea antes del fork: los procesos worker comparten las claves de los tickets de sesion
+        contexto_tls = tls.crear_contexto_servidor(args.tls_cert, args.tls_key)
 
     print("=" * 60)
     print("SERVIDOR HTTP MULTIHILO - ANALISIS DE CAPAS DE RED")
     print(f"Escuchando en: {HOST}:{PORT}")
+    if contexto_tls is not None:
+        print(f"HTTPS en: {HOST}:{args.tls_port} (ALPN http/1.1, reanudacion de sesion)")
     print(f"Directorio base: {BASE_DIR}")
-    print(f"MAC del servidor: {obtener_direccion_mac()}")
+    if SUBIDAS:
+        print(f"Subidas PUT/POST habilitadas (maximo {MAX_TAMANO_SUBIDA} bytes)")
+    print(f"Motor: {args.engine} (backlog={args.backlog})")
+    if args.config:
+        print(f"Configuracion: {args.config} (SIGHUP para recargar)")
+    print(f"IP del servidor: {IP_SERVIDOR or 'No disponible'}")
+    print(f"MAC del servidor: {MAC_SERVIDOR}")
     print("=" * 60)
 
-    global contador_clientes
-
     if not os.path.exists(BASE_DIR):
         os.makedirs(BASE_DIR)
         print(f"Directorio '{BASE_DIR}' creado")
+    archivos = indice_estatico.build()
+    print(f"Indice de '{BASE_DIR}': {archivos} rutas ({indice_estatico.build_ms:.1f} ms)")
 
-    while True:
-        print("\nEsperando conexiones...")
-        conn, addr = server.accept()
-        contador_clientes += 1
-        client_id = contador_clientes
+    if args.procesos > 0:
+        if args.socket_control:
+            # Los workers escuchan con SO_REUSEPORT: el grupo nuevo puede arrancar junto al viejo
+            print("--socket-control no se usa en modo pre-fork: iniciar la version nueva y enviar SIGTERM a la anterior")
+        import prefork
+        prefork.Supervisor(args).ejecutar()
+        return
 
-        thread = threading.Thread(target=manejar_cliente, args=(conn, addr, client_id))
-        thread.daemon = True
-        thread.start()
-        print(f"[THREAD] Hilo {client_id} iniciado")
+    conexion_relevo = None
+    if args.heredar:
+        if not args.socket_control:
+            print("--heredar necesita --socket-control con la ruta del proceso en servicio")
+            return
+        conexion_relevo, heredados = relevo.pedir_sockets(args.socket_control)
+        server = heredados["http"]
+        servidor_tls = heredados.get("https")
+        print("Sockets de escucha heredados: " +
+              ", ".join(f"{nombre} en el puerto {sock.getsockname()[1]}" for nombre, sock in heredados.items()))
+        if contexto_tls is None and servidor_tls is not None:
+            servidor_tls.close()
+            servidor_tls = None
+        elif contexto_tls is not None and servidor_tls is None:
+            servidor_tls = crear_socket_servidor(args.backlog, port=args.tls_port)
+    else:
+        server = crear_socket_servidor(args.backlog)
+        servidor_tls = crear_socket_servidor(args.backlog, port=args.tls_port) if contexto_tls is not None else None
+
+    if args.socket_control:
+        control = relevo.escuchar_control(args.socket_control, heredado=args.heredar)
+        escucha = {"http": server}
+        if servidor_tls is not None:
+            escucha["https"] = servidor_tls
+        servidor_relevo = relevo.ServidorRelevo(args.socket_control, control, escucha,
+                                                lambda pid: iniciar_drenaje(f"relevo al proceso {pid}"))
+    if conexion_relevo is not None:
+        # Los sockets ya escuchan en este proceso: el anterior puede dejar de aceptar y drenar
+        relevo.confirmar(conexion_relevo)
+
+    ejecutar_motor(server, args, servidor_tls=servidor_tls)
 
 if __name__ == "__main__":
+    # Los motores alternativos hacen "import server": reutilizar este modulo en vez de cargar otra copia
+    sys.modules.setdefault("server", sys.modules[__name__])
     main()
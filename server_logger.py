@@ -0,0 +1,163 @@
+import sys
+import os
+import json
+import time
+import threading
+from collections import deque
+
+LEVELS = {"error": 40, "warning": 30, "info": 20, "debug": 10}
+LEVEL_NAMES = {valor: nombre.upper() for nombre, valor in LEVELS.items()}
+
+# Escape de los campos entre comillas del formato combined, como Apache/nginx: comillas y barras
+# con "\", y los bytes de control o no ASCII como \xHH (los headers llegan decodificados en latin-1)
+COMBINED_ESCAPES = {codigo: f"\\x{codigo:02x}" for codigo in (*range(0x20), *range(0x7f, 0x100))}
+COMBINED_ESCAPES[ord('"')] = '\\"'
+COMBINED_ESCAPES[ord("\\")] = "\\\\"
+
+def escape_combined(value):
+    """Un campo del request tal como va en una linea combined: no puede cortar la linea ni cerrar las comillas"""
+    return value.translate(COMBINED_ESCAPES)
+
+class ServerLogger:
+    """
+    Logging asincrono del servidor. Los hilos que atienden requests solo agregan
+    el registro a un buffer circular acotado; un hilo escritor les da formato y
+    los escribe en lotes. Si el buffer se llena se descartan los mas viejos.
+    """
+
+    def __init__(self, level="info", stream=None, access_stream=None, access_format="combined",
+                 buffer_size=10000, flush_interval=0.2):
+        self.stream = stream or sys.stdout
+        self.access_stream = access_stream or self.stream
+        self.access_format = access_format
+        self.flush_interval = flush_interval
+        self.buffer = deque(maxlen=buffer_size)
+        self.event = threading.Event()
+        self.dropped = 0
+        self.thread = None
+        self.pid = None
+        self.running = False
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level_name = level
+        self.level = LEVELS[level]
+
+    def set_access_log(self, stream=None, access_format=None):
+        """Cambia el destino (None = mismo stream que el log) y el formato del access log"""
+        self.access_stream = stream or self.stream
+        if access_format is not None:
+            self.access_format = access_format
+
+    def enabled(self, level):
+        """Permite evitar armar mensajes caros que no se van a escribir"""
+        return LEVELS[level] >= self.level
+
+    def start(self):
+        """Inicia el hilo escritor (tambien en un proceso hijo creado con fork)"""
+        if self.running and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.running = True
+        self.thread = threading.Thread(target=self._writer, name="ServerLogger")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Detiene el hilo escritor despues de vaciar el buffer"""
+        if not self.running:
+            return
+        self.running = False
+        self.event.set()
+        self.thread.join(timeout=2)
+
+    def _push(self, record):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+        if len(self.buffer) > self.buffer.maxlen // 2:
+            # Despertar antes al escritor para no llegar a descartar registros
+            self.event.set()
+        if not self.running:
+            # Sin hilo escritor (antes de start o despues de stop) se escribe directo
+            self._flush()
+
+    def _log(self, level, message):
+        if level >= self.level:
+            self._push(("log", time.time(), level, message))
+
+    def debug(self, message):
+        self._log(10, message)
+
+    def info(self, message):
+        self._log(20, message)
+
+    def warning(self, message):
+        self._log(30, message)
+
+    def error(self, message):
+        self._log(40, message)
+
+    def access(self, addr, method, uri, version, status, size, duration_ms, referer=None, user_agent=None):
+        """Registro de acceso: una linea por request en formato combined o JSON"""
+        self._push(("access", time.time(), addr[0], method, uri, version, status, size,
+                    duration_ms, referer, user_agent))
+
+    def _format(self, record):
+        if record[0] == "log":
+            _, ts, level, message = record
+            hora = time.strftime("%H:%M:%S", time.localtime(ts))
+            return self.stream, f"{hora} {LEVEL_NAMES[level]:<7} {message}\n"
+
+        _, ts, ip, method, uri, version, status, size, duration_ms, referer, user_agent = record
+        if self.access_format == "json":
+            line = json.dumps({
+                "time": ts,
+                "remote_addr": ip,
+                "method": method,
+                "uri": uri,
+                "version": version,
+                "status": status,
+                "bytes": size,
+                "duration_ms": round(duration_ms, 3),
+                "referer": referer,
+                "user_agent": user_agent
+            })
+        else:
+            fecha = time.strftime("%d/%b/%Y:%H:%M:%S %z", time.localtime(ts))
+            request_line = escape_combined(f"{method} {uri} {version}")
+            referer = escape_combined(referer) if referer else "-"
+            user_agent = escape_combined(user_agent) if user_agent else "-"
+            line = f'{ip} - - [{fecha}] "{request_line}" {status} {size or "-"} "{referer}" "{user_agent}"'
+        return self.access_stream, line + "\n"
+
+    def _flush(self):
+        lotes = {}
+        while True:
+            try:
+                record = self.buffer.popleft()
+            except IndexError:
+                break
+            stream, line = self._format(record)
+            lotes.setdefault(stream, []).append(line)
+        for stream, lines in lotes.items():
+            try:
+                stream.write("".join(lines))
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def get_stats(self):
+        return {
+            'level': self.level_name,
+            'buffered': len(self.buffer),
+            'buffer_size': self.buffer.maxlen,
+            'dropped': self.dropped
+        }
+
+    def _writer(self):
+        while self.running:
+            self.event.wait(self.flush_interval)
+            self.event.clear()
+            self._flush()
+        self._flush()
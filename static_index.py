@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from urllib.parse import unquote
+
+from file_cache import PRECOMPRESSED_EXTENSIONS
+
+# Tipos MIME por extension (en minusculas)
+MIME_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".htm": "text/html; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".json": "application/json",
+    ".xml": "application/xml",
+    ".svg": "image/svg+xml",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".ico": "image/x-icon",
+    ".pdf": "application/pdf",
+    ".zip": "application/zip",
+    ".tar": "application/x-tar",
+    ".mp3": "audio/mpeg",
+    ".mp4": "video/mp4",
+    ".wasm": "application/wasm",
+    ".gz": "application/gzip",
+    ".br": "application/octet-stream"
+}
+DEFAULT_MIME = "application/octet-stream"
+
+def content_type_for(filename):
+    """Tipo MIME segun la extension del archivo"""
+    return MIME_TYPES.get(os.path.splitext(filename)[1].lower(), DEFAULT_MIME)
+
+def canonical_path(uri):
+    """
+    Ruta URL canonica de un request: sin query ni fragmento, decodificada y normalizada
+    solo como texto. Devuelve None si intenta salir del directorio base o es invalida.
+    """
+    path = uri.split("?", 1)[0].split("#", 1)[0]
+    if "%" in path:
+        path = unquote(path, errors="strict")
+    if not path.startswith("/") or "\x00" in path or "\\" in path:
+        return None
+    segmentos = []
+    for segmento in path.split("/"):
+        if segmento in ("", "."):
+            continue
+        if segmento == "..":
+            # Subir mas arriba de la raiz es un intento de salir del directorio base
+            if not segmentos:
+                return None
+            segmentos.pop()
+        else:
+            segmentos.append(segmento)
+    canonica = "/" + "/".join(segmentos)
+    if path.endswith("/") and segmentos:
+        canonica += "/"
+    return canonica
+
+def is_current_variant(variant, original):
+    """Un archivo precomprimido solo representa al original si no es mas viejo que el"""
+    return variant is not None and original is not None and variant.mtime_ns >= original.mtime_ns
+
+class IndexEntry:
+    """Metadatos de un archivo servible, calculados al indexar"""
+
+    __slots__ = ('uri', 'path', 'size', 'mtime_ns', 'content_type', 'variants')
+
+    def __init__(self, uri, path, size, mtime_ns, content_type):
+        self.uri = uri
+        self.path = path  # ruta en disco
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_type = content_type
+        self.variants = {}  # {encoding: ruta del archivo precomprimido}
+
+class StaticIndex:
+    """
+    Indice en memoria de BASE_DIR: ruta URL canonica -> IndexEntry.
+    Resolver un request es una sola busqueda en un dict; los 404 y los intentos de
+    salir del directorio (..) se rechazan sin tocar el sistema de archivos.
+    Un hilo revisa el arbol cada refresh_interval segundos con un os.stat por directorio
+    y vuelve a leer solo los directorios cuyo mtime cambio (crear, borrar o renombrar una
+    entrada). Cada full_rescan_interval segundos se relee todo, para notar los archivos
+    modificados en el lugar; HEAD y la eleccion de variantes no esperan y usan revalidate().
+    El indice nuevo reemplaza al anterior de una vez, asi los lectores nunca ven uno a
+    medio armar.
+    """
+
+    def __init__(self, base_dir, refresh_interval=2.0, full_rescan_interval=60.0):
+        self.base_dir = base_dir
+        self.refresh_interval = refresh_interval
+        self.full_rescan_interval = full_rescan_interval
+        self.entries = {}
+        self.dirs = {}  # {ruta en disco: (mtime_ns, {uri: IndexEntry}, [(subdirectorio, prefijo)])}
+        self.builds = 0
+        self.build_ms = 0.0
+        self.refreshes = 0
+        self.dirs_rescanned = 0
+        self.last_full = 0.0
+        self.lock = threading.Lock()  # serializa reconstrucciones y actualizaciones puntuales
+        self.running = False
+        self.thread = None
+        self.pid = None
+
+    def _scan_dir(self, base, directorio, prefijo):
+        """Archivos publicables y subdirectorios de un solo directorio"""
+        files = {}
+        subdirs = []
+        with os.scandir(directorio) as it:
+            for item in it:
+                # Los archivos ocultos (y las subidas temporales) no se publican
+                if item.name.startswith("."):
+                    continue
+                try:
+                    if item.is_symlink():
+                        # Un enlace solo se sigue si apunta dentro del directorio base
+                        destino = os.path.realpath(item.path)
+                        if os.path.commonpath([base, destino]) != base:
+                            continue
+                        # Los directorios enlazados no se recorren (evita ciclos)
+                        if item.is_dir():
+                            continue
+                    if item.is_dir():
+                        subdirs.append((item.path, f"{prefijo}{item.name}/"))
+                        continue
+                    if not item.is_file():
+                        continue
+                    st = item.stat()
+                except OSError:
+                    continue
+                uri = prefijo + item.name
+                files[uri] = IndexEntry(uri, item.path, st.st_size, st.st_mtime_ns, content_type_for(item.name))
+        return files, subdirs
+
+    def _scan(self, full):
+        """
+        Recorre el arbol reutilizando los directorios sin cambios (salvo con full).
+        Devuelve el indice nuevo, o None si ningun directorio cambio
+        """
+        base = os.path.realpath(self.base_dir)
+        dirs = {}
+        changed = full or not self.dirs
+        pendientes = [(base, "/")]
+        while pendientes:
+            directorio, prefijo = pendientes.pop()
+            try:
+                mtime_ns = os.stat(directorio).st_mtime_ns
+                cached = self.dirs.get(directorio)
+                if full or cached is None or cached[0] != mtime_ns:
+                    files, subdirs = self._scan_dir(base, directorio, prefijo)
+                    cached = (mtime_ns, files, subdirs)
+                    changed = True
+                    self.dirs_rescanned += 1
+            except OSError:
+                continue
+            dirs[directorio] = cached
+            pendientes.extend(cached[2])
+        # Un directorio borrado no cambia el recorrido si su padre no se volvio a leer
+        changed = changed or len(dirs) != len(self.dirs)
+        self.dirs = dirs
+        if not changed:
+            return None
+
+        entries = {}
+        for _, files, _ in dirs.values():
+            entries.update(files)
+        # Variantes precomprimidas (archivo.gz / archivo.br) y el index.html de cada directorio.
+        # Las entradas se comparten con el indice en uso: variants se reemplaza, no se modifica
+        for uri, entry in list(entries.items()):
+            variants = {}
+            for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+                variante = entries.get(uri + extension)
+                if is_current_variant(variante, entry):
+                    variants[encoding] = variante.path
+            entry.variants = variants
+            if uri.endswith("/index.html"):
+                entries[uri[:-len("index.html")]] = entry
+        return entries
+
+    def build(self, full=True):
+        """Reconstruye el indice (con full=False solo relee los directorios que cambiaron)"""
+        inicio = time.perf_counter()
+        with self.lock:
+            if full:
+                self.last_full = time.monotonic()
+            else:
+                self.refreshes += 1
+            entries = self._scan(full)
+            if entries is not None:
+                self.entries = entries
+                self.builds += 1
+        self.build_ms = (time.perf_counter() - inicio) * 1000
+        return len(self.entries)
+
+    def add(self, uri, path):
+        """Publica o actualiza un archivo sin esperar al proximo escaneo (p. ej. despues de una subida)"""
+        st = os.stat(path)
+        entry = IndexEntry(uri, path, st.st_size, st.st_mtime_ns, content_type_for(uri))
+        with self.lock:
+            entries = self.entries
+            for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+                # Un .gz/.br anterior al archivo subido tiene el contenido viejo: no se sirve
+                variante = entries.get(uri + extension)
+                if is_current_variant(variante, entry):
+                    entry.variants[encoding] = variante.path
+                # El archivo subido puede ser la variante precomprimida de otro
+                if uri.endswith(extension):
+                    original = entries.get(uri[:-len(extension)])
+                    if is_current_variant(entry, original):
+                        original.variants[encoding] = path
+            entries[uri] = entry
+            if uri.endswith("/index.html"):
+                entries[uri[:-len("index.html")]] = entry
+            # El proximo refresco relee el directorio aunque su mtime no haya avanzado
+            self.dirs.pop(os.path.dirname(path), None)
+        return entry
+
+    def revalidate(self, entry):
+        """
+        Confirma con un os.stat que la entrada sigue al dia (un archivo modificado en el lugar
+        no cambia el mtime de su directorio). Si cambio la reemplaza en el indice con sus
+        variantes recalculadas; devuelve None si el archivo ya no existe
+        """
+        if entry is None:
+            return None
+        try:
+            st = os.stat(entry.path)
+        except OSError:
+            return None
+        if st.st_mtime_ns == entry.mtime_ns and st.st_size == entry.size:
+            return entry
+        nueva = IndexEntry(entry.uri, entry.path, st.st_size, st.st_mtime_ns, entry.content_type)
+        for encoding, extension in PRECOMPRESSED_EXTENSIONS.items():
+            if encoding in entry.variants:
+                variante = self.revalidate(self.entries.get(entry.uri + extension))
+                if is_current_variant(variante, nueva):
+                    nueva.variants[encoding] = variante.path
+        with self.lock:
+            entries = self.entries
+            if entries.get(entry.uri) is entry:
+                entries[entry.uri] = nueva
+                if entry.uri.endswith("/index.html"):
+                    entries[entry.uri[:-len("index.html")]] = nueva
+        return nueva
+
+    def lookup(self, uri):
+        """IndexEntry del request o None (no existe o la ruta es invalida)"""
+        entry = self.entries.get(uri)
+        if entry is not None:
+            return entry
+        # Camino lento: query string, %xx, '//' o '..' que hay que normalizar
+        try:
+            path = canonical_path(uri)
+        except UnicodeDecodeError:
+            return None
+        if path is None or path == uri:
+            return None
+        return self.entries.get(path)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.refresh_interval)
+            try:
+                self.build(full=time.monotonic() - self.last_full >= self.full_rescan_interval)
+            except Exception as e:
+                print(f"[INDICE] Error al reconstruir: {e}")
+
+    def start(self):
+        """Inicia el hilo que mantiene el indice al dia (tambien en un proceso hijo creado con fork)"""
+        if self.running and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="StaticIndex")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        return {
+            'entries': len(self.entries),
+            'directories': len(self.dirs),
+            'builds': self.builds,
+            'refreshes': self.refreshes,
+            'dirs_rescanned': self.dirs_rescanned,
+            'build_ms': self.build_ms,
+            'refresh_interval': self.refresh_interval,
+            'full_rescan_interval': self.full_rescan_interval
+        }
@@ -0,0 +1,169 @@
+import pytest
+
+from http_parser import HTTPParseError, HTTPRequestParser
+
+def parsear(data, **kwargs):
+    parser = HTTPRequestParser(**kwargs)
+    parser.feed(data)
+    return parser, parser.next_request()
+
+def status_de_error(data, **kwargs):
+    with pytest.raises(HTTPParseError) as error:
+        parsear(data, **kwargs)
+    return error.value.status
+
+def test_request_simple():
+    _, request = parsear(b"GET /index.html HTTP/1.1\r\nHost: x\r\nX-A: 1\r\nX-A: 2\r\n\r\n")
+    assert (request.method, request.uri, request.version) == ("GET", "/index.html", "HTTP/1.1")
+    assert request.get_header("host") == "x"
+    # Headers repetidos se combinan
+    assert request.get_header("X-A") == "1, 2"
+    assert request.keep_alive
+
+def test_request_incompleto_espera_mas_datos():
+    parser, request = parsear(b"GET / HTTP/1.1\r\nHost: x\r\n")
+    assert request is None
+    parser.feed(b"\r\n")
+    assert parser.next_request().uri == "/"
+
+def test_crlf_partido_entre_lecturas():
+    parser, request = parsear(b"GET / HTTP/1.1\r\nHost: x\r\n\r")
+    assert request is None
+    parser.feed(b"\n")
+    assert parser.next_request() is not None
+
+def test_headers_demasiado_grandes_431():
+    data = b"GET / HTTP/1.1\r\nX: " + b"a" * 200 + b"\r\n\r\n"
+    assert status_de_error(data, max_header_bytes=100) == 431
+    # Sin fin de headers tambien se corta al pasar el limite
+    assert status_de_error(b"GET / HTTP/1.1\r\nX: " + b"a" * 200, max_header_bytes=100) == 431
+
+def test_demasiados_headers_431():
+    headers = b"".join(b"X-%d: v\r\n" % i for i in range(5))
+    assert status_de_error(b"GET / HTTP/1.1\r\n" + headers + b"\r\n", max_headers=4) == 431
+
+@pytest.mark.parametrize("data", [
+    b"GET /\r\n\r\n",
+    b"GET / FTP/1.0\r\n\r\n",
+    b"GET / HTTP/1.1\r\nSin dos puntos\r\n\r\n",
+    b"GET / HTTP/1.1\r\nX : espacio antes\r\n\r\n",
+])
+def test_request_mal_formado_400(data):
+    assert status_de_error(data) == 400
+
+def test_cuerpo_content_length():
+    _, request = parsear(b"POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\nhola!")
+    assert request.body == b"hola!"
+
+def test_content_length_supera_limite_413():
+    assert status_de_error(b"POST / HTTP/1.1\r\nContent-Length: 11\r\n\r\n", max_body=10) == 413
+
+@pytest.mark.parametrize("valor", [b"-1", b"+5", b"5x", b"", b"\xb2", b"1\xb9"])
+def test_content_length_invalido_400(valor):
+    assert status_de_error(b"POST / HTTP/1.1\r\nContent-Length: " + valor + b"\r\n\r\n") == 400
+
+def test_content_length_y_transfer_encoding_400():
+    data = b"POST / HTTP/1.1\r\nContent-Length: 3\r\nTransfer-Encoding: chunked\r\n\r\n"
+    assert status_de_error(data) == 400
+
+def test_transfer_encoding_no_soportado_400():
+    assert status_de_error(b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n") == 400
+
+def test_cuerpo_chunked_con_extensiones_y_trailers():
+    data = (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"4;ext=1\r\nhola\r\nA\r\n, mundo!!!\r\n0\r\nX-Trailer: si\r\n\r\n")
+    _, request = parsear(data)
+    assert request.body == b"hola, mundo!!!"
+
+def test_chunked_llega_de_a_un_byte():
+    data = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n"
+    parser = HTTPRequestParser()
+    request = None
+    for i in range(len(data)):
+        parser.feed(data[i:i + 1])
+        request = parser.next_request() or request
+    assert request.body == b"abcde"
+
+@pytest.mark.parametrize("cuerpo", [
+    b"-5\r\n\r\n0x3\r\nabc\r\n0\r\n\r\n",
+    b"+3\r\nabc\r\n0\r\n\r\n",
+    b"0x3\r\nabc\r\n0\r\n\r\n",
+    b"3_0\r\n",
+    b" \r\n",
+    b"\r\n",
+    b"zz\r\n",
+])
+def test_tamano_de_chunk_invalido_400(cuerpo):
+    assert status_de_error(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n" + cuerpo) == 400
+
+def test_chunk_mal_terminado_400():
+    data = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabcX\r\n0\r\n\r\n"
+    assert status_de_error(data) == 400
+
+def test_linea_de_chunk_o_trailer_demasiado_larga_400():
+    inicio = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+    assert status_de_error(inicio + b"1" * 2000) == 400
+    assert status_de_error(inicio + b"0\r\nX-T: " + b"a" * 2000) == 400
+
+def test_chunked_supera_limite_413():
+    data = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n6\r\nabcdef\r\n6\r\nghijkl\r\n0\r\n\r\n"
+    assert status_de_error(data, max_body=10) == 413
+
+def test_pipeline_deja_el_resto_para_el_siguiente():
+    parser, primero = parsear(b"GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\nContent-Length: 2\r\n\r\nokGET /c HT")
+    assert primero.uri == "/a"
+    segundo = parser.next_request()
+    assert (segundo.uri, segundo.body) == ("/b", b"ok")
+    assert parser.next_request() is None
+    assert parser.has_pending_data()
+    parser.feed(b"TP/1.1\r\n\r\n")
+    assert parser.next_request().uri == "/c"
+    assert not parser.has_pending_data()
+
+def leer_cuerpo(parser):
+    partes = []
+    while True:
+        data = parser.read_body()
+        if data is None:
+            return partes, False
+        if not data:
+            return partes, True
+        partes.append(data)
+
+def test_read_body_content_length_en_partes():
+    parser = HTTPRequestParser(streaming_methods=("PUT",))
+    parser.feed(b"PUT /x HTTP/1.1\r\nContent-Length: 6\r\n\r\nabc")
+    request = parser.next_request()
+    assert request.streaming and request.body == b""
+    partes, fin = leer_cuerpo(parser)
+    assert (partes, fin) == ([b"abc"], False)
+    parser.feed(b"defGET /y HTTP/1.1\r\n\r\n")
+    partes, fin = leer_cuerpo(parser)
+    assert (partes, fin) == ([b"def"], True)
+    # Terminado el cuerpo, el request siguiente del pipeline queda disponible
+    assert parser.next_request().uri == "/y"
+
+def test_read_body_chunked():
+    parser = HTTPRequestParser(streaming_methods=("PUT",))
+    parser.feed(b"PUT /x HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n")
+    parser.next_request()
+    assert leer_cuerpo(parser) == ([b"abc"], False)
+    parser.feed(b"2\r\nde\r\n0\r\n\r\n")
+    assert leer_cuerpo(parser) == ([b"de"], True)
+
+def test_read_body_usa_el_limite_de_subidas():
+    parser = HTTPRequestParser(max_body=10, streaming_methods=("PUT",), max_stream_body=100)
+    parser.feed(b"PUT /x HTTP/1.1\r\nContent-Length: 50\r\n\r\n" + b"a" * 50)
+    parser.next_request()
+    assert b"".join(leer_cuerpo(parser)[0]) == b"a" * 50
+    parser.feed(b"PUT /x HTTP/1.1\r\nContent-Length: 101\r\n\r\n")
+    with pytest.raises(HTTPParseError) as error:
+        parser.next_request()
+    assert error.value.status == 413
+
+def test_next_request_con_cuerpo_sin_leer_falla():
+    parser = HTTPRequestParser(streaming_methods=("PUT",))
+    parser.feed(b"PUT /x HTTP/1.1\r\nContent-Length: 3\r\n\r\n")
+    parser.next_request()
+    with pytest.raises(RuntimeError):
+        parser.next_request()
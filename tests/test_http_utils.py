@@ -0,0 +1,83 @@
+import pytest
+
+from http_utils import http_date, is_not_modified, parse_range, range_applies
+
+ETAG = '"3e8-18df97bd55711e0b"'
+MTIME = 1_700_000_000.5
+LAST_MODIFIED = http_date(MTIME)
+
+@pytest.mark.parametrize("header, esperado", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),  # abierto: hasta el final
+    ("bytes=-100", [(900, 999)]),  # sufijo: los ultimos 100 bytes
+    ("bytes=-5000", [(0, 999)]),  # sufijo mas grande que el recurso
+    ("bytes=990-2000", [(990, 999)]),  # el fin se recorta al tamaño
+    ("bytes=0-0,-1", [(0, 0), (999, 999)]),
+    ("bytes= 0-9 , 20-29 ,50-", [(0, 9), (20, 29), (50, 999)]),
+    ("BYTES=0-9", [(0, 9)]),
+])
+def test_parse_range(header, esperado):
+    assert parse_range(header, 1000) == esperado
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=5000-6000",
+    "bytes=-0",
+    "bytes=1000-1001,2000-",
+])
+def test_parse_range_no_satisfacible_416(header):
+    assert parse_range(header, 1000) == []
+
+def test_parse_range_satisfacible_descarta_los_demas():
+    assert parse_range("bytes=2000-,0-9", 1000) == [(0, 9)]
+
+def test_parse_range_recurso_vacio():
+    assert parse_range("bytes=-10", 0) == []
+    assert parse_range("bytes=0-", 0) == []
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-9",
+    "bytes=",
+    "bytes=abc",
+    "bytes=9-0",
+    "bytes=x-9",
+    "bytes=0-9,nada",
+])
+def test_parse_range_invalido_se_ignora(header):
+    assert parse_range(header, 1000) is None
+
+def test_parse_range_demasiados_rangos_se_ignora():
+    header = "bytes=" + ",".join(f"{i}-{i}" for i in range(17))
+    assert parse_range(header, 1000) is None
+    assert len(parse_range(header, 1000, max_ranges=17)) == 17
+
+def test_range_applies():
+    assert range_applies(None, ETAG, LAST_MODIFIED)
+    assert range_applies(ETAG, ETAG, LAST_MODIFIED)
+    assert not range_applies('"otro"', ETAG, LAST_MODIFIED)
+    # If-Range usa comparacion fuerte: un ETag debil nunca coincide
+    assert not range_applies("W/" + ETAG, ETAG, LAST_MODIFIED)
+    assert range_applies(LAST_MODIFIED, ETAG, LAST_MODIFIED)
+    assert not range_applies(http_date(MTIME - 60), ETAG, LAST_MODIFIED)
+
+def test_is_not_modified_if_none_match():
+    assert is_not_modified(ETAG, None, ETAG, MTIME)
+    assert is_not_modified(f'"a", {ETAG}', None, ETAG, MTIME)
+    assert is_not_modified("*", None, ETAG, MTIME)
+    # Comparacion debil en ambos sentidos
+    assert is_not_modified("W/" + ETAG, None, ETAG, MTIME)
+    assert is_not_modified(ETAG, None, "W/" + ETAG, MTIME)
+    assert not is_not_modified('"otro"', None, ETAG, MTIME)
+
+def test_is_not_modified_if_none_match_tiene_prioridad():
+    # Con If-None-Match presente, If-Modified-Since se ignora
+    assert not is_not_modified('"otro"', LAST_MODIFIED, ETAG, MTIME)
+
+def test_is_not_modified_if_modified_since():
+    assert is_not_modified(None, LAST_MODIFIED, ETAG, MTIME)
+    assert is_not_modified(None, http_date(MTIME + 60), ETAG, MTIME)
+    assert not is_not_modified(None, http_date(MTIME - 60), ETAG, MTIME)
+    assert not is_not_modified(None, "no es una fecha", ETAG, MTIME)
+    assert not is_not_modified(None, None, ETAG, MTIME)
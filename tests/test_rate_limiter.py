@@ -0,0 +1,114 @@
+import pytest
+
+from rate_limiter import BandwidthShaper, RateLimiter, retry_after
+
+class Reloj:
+    """Reloj manual: el tiempo solo avanza con avanzar()"""
+
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+    def avanzar(self, segundos):
+        self.ahora += segundos
+
+def test_limiter_desactivado_siempre_permite():
+    limiter = RateLimiter(clock=Reloj())
+    assert all(limiter.allow_request("10.0.0.1") == 0 for _ in range(1000))
+    assert all(limiter.connection_opened("10.0.0.1") for _ in range(1000))
+    assert limiter.get_stats()['tracked_ips'] == 0
+
+def test_token_bucket_rafaga_y_recarga():
+    reloj = Reloj()
+    limiter = RateLimiter(rate=2, burst=3, clock=reloj)
+    # La rafaga inicial deja pasar burst requests seguidos
+    assert [limiter.allow_request("a") for _ in range(3)] == [0, 0, 0]
+    # Sin tokens: la espera es lo que falta para el proximo (1 token / 2 por segundo)
+    assert limiter.allow_request("a") == pytest.approx(0.5)
+    reloj.avanzar(0.25)
+    assert limiter.allow_request("a") == pytest.approx(0.25)
+    reloj.avanzar(0.25)
+    assert limiter.allow_request("a") == 0
+    assert limiter.allow_request("a") == pytest.approx(0.5)
+
+def test_token_bucket_no_acumula_mas_que_la_rafaga():
+    reloj = Reloj()
+    limiter = RateLimiter(rate=10, burst=5, clock=reloj)
+    limiter.allow_request("a")
+    reloj.avanzar(3600)
+    assert [limiter.allow_request("a") for _ in range(5)] == [0] * 5
+    assert limiter.allow_request("a") > 0
+
+def test_rafaga_por_defecto_es_un_segundo_de_requests():
+    limiter = RateLimiter(rate=4, clock=Reloj())
+    assert limiter.burst == 4
+    assert RateLimiter(rate=0.5, clock=Reloj()).burst == 1
+
+def test_buckets_independientes_por_ip():
+    limiter = RateLimiter(rate=1, burst=1, clock=Reloj())
+    assert limiter.allow_request("a") == 0
+    assert limiter.allow_request("a") > 0
+    assert limiter.allow_request("b") == 0
+    assert limiter.get_stats()['limited_requests'] == 1
+
+def test_limite_de_conexiones():
+    limiter = RateLimiter(max_connections=2, clock=Reloj())
+    assert limiter.connection_opened("a") and limiter.connection_opened("a")
+    assert not limiter.connection_opened("a")
+    assert limiter.connection_opened("b")
+    limiter.connection_closed("a")
+    assert limiter.connection_opened("a")
+    assert limiter.get_stats()['rejected_connections'] == 1
+
+def test_expira_solo_ips_inactivas_sin_conexiones():
+    reloj = Reloj()
+    limiter = RateLimiter(rate=1, max_connections=5, idle_ttl=60, clock=reloj)
+    limiter.allow_request("inactiva")
+    limiter.connection_opened("conectada")
+    reloj.avanzar(30)
+    limiter.allow_request("reciente")
+    reloj.avanzar(31)
+    assert limiter.expire_idle() == 1
+    assert limiter.get_stats()['tracked_ips'] == 2
+
+def test_shaper_desactivado():
+    shaper = BandwidthShaper(clock=Reloj())
+    assert shaper.reserve(10 ** 9) == 0
+    assert shaper.backlog() == 0
+
+def test_gcra_rafaga_sin_espera_y_luego_al_ritmo():
+    reloj = Reloj()
+    shaper = BandwidthShaper(rate=1000, burst=500, clock=reloj)
+    # Los primeros burst bytes salen sin esperar
+    assert shaper.reserve(500) == 0
+    assert shaper.backlog() == 0
+    # Cada byte extra espera 1/rate segundos
+    assert shaper.reserve(100) == pytest.approx(0.1)
+    assert shaper.reserve(100) == pytest.approx(0.2)
+    assert shaper.backlog() == pytest.approx(0.2)
+    # Con el tiempo el turno reservado se consume
+    reloj.avanzar(0.2)
+    assert shaper.backlog() == pytest.approx(0.0)
+    assert shaper.reserve(1000) == pytest.approx(1.0)
+
+def test_gcra_no_acumula_credito_mas_alla_de_la_rafaga():
+    reloj = Reloj()
+    shaper = BandwidthShaper(rate=1000, burst=500, clock=reloj)
+    reloj.avanzar(3600)
+    assert shaper.reserve(500) == 0
+    assert shaper.reserve(500) == pytest.approx(0.5)
+
+def test_gcra_estadisticas():
+    reloj = Reloj()
+    shaper = BandwidthShaper(rate=100, burst=100, clock=reloj)
+    shaper.reserve(100)
+    shaper.reserve(50)
+    stats = shaper.get_stats()
+    assert stats['shaped_bytes'] == 150
+    assert stats['delay_seconds'] == pytest.approx(0.5)
+
+@pytest.mark.parametrize("segundos, esperado", [(0, 1), (0.01, 1), (1, 1), (1.2, 2), (30, 30)])
+def test_retry_after(segundos, esperado):
+    assert retry_after(segundos) == esperado
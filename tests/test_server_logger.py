@@ -0,0 +1,23 @@
+import io
+
+from server_logger import ServerLogger, escape_combined
+
+def linea_combined(method="GET", uri="/", version="HTTP/1.1", referer=None, user_agent=None):
+    logger = ServerLogger(stream=io.StringIO())
+    record = ("access", 1_700_000_000.0, "10.0.0.1", method, uri, version, 200, 5, 1.0, referer, user_agent)
+    return logger._format(record)[1]
+
+def test_escape_combined():
+    assert escape_combined('a"b\\c') == 'a\\"b\\\\c'
+    assert escape_combined("x\r\ny\t\x7f\xe9") == "x\\x0d\\x0ay\\x09\\x7f\\xe9"
+    assert escape_combined("Mozilla/5.0 (X11; Linux)") == "Mozilla/5.0 (X11; Linux)"
+
+def test_linea_combined_normal():
+    linea = linea_combined(uri="/index.html", referer="http://a/", user_agent="curl/8")
+    assert linea.endswith('"GET /index.html HTTP/1.1" 200 5 "http://a/" "curl/8"\n')
+
+def test_linea_combined_no_se_puede_falsificar():
+    # Un User-Agent con comillas y saltos de linea no agrega campos ni lineas al access log
+    linea = linea_combined(uri='/"x', referer=None, user_agent='a" 500 "\n10.6.6.6 - - [x] "GET /')
+    assert linea.count("\n") == 1
+    assert linea.endswith('"GET /\\"x HTTP/1.1" 200 5 "-" "a\\" 500 \\"\\x0a10.6.6.6 - - [x] \\"GET /"\n')
@@ -0,0 +1,65 @@
+import os
+import shutil
+import ssl
+import subprocess
+
+# Protocolo anunciado por ALPN: el servidor solo habla HTTP/1.1
+ALPN_PROTOCOLOS = ["http/1.1"]
+# Tickets de sesion que se entregan por conexion TLS 1.3 (cada reconexion consume uno)
+TICKETS_POR_CONEXION = 2
+CERT_DIAS = 365
+
+def generar_certificado(cert_path, key_path, common_name="localhost"):
+    """Genera un certificado autofirmado para pruebas locales con el comando openssl"""
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        raise RuntimeError("No se encontro el comando openssl para generar el certificado")
+    for path in (cert_path, key_path):
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+    subprocess.run(
+        [openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-sha256",
+         "-days", str(CERT_DIAS), "-subj", f"/CN={common_name}",
+         "-addext", f"subjectAltName=DNS:{common_name},IP:127.0.0.1",
+         "-keyout", key_path, "-out", cert_path],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    os.chmod(key_path, 0o600)
+
+def crear_contexto_servidor(cert_path, key_path):
+    """
+    SSLContext del listener HTTPS. Las claves de los tickets de sesion viven en el
+    contexto: si se crea antes del fork, todos los procesos worker aceptan los tickets
+    emitidos por cualquiera de ellos y una reconexion se reanuda sin handshake completo.
+    """
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.minimum_version = ssl.TLSVersion.TLSv1_2
+    contexto.load_cert_chain(cert_path, key_path)
+    contexto.set_alpn_protocols(ALPN_PROTOCOLOS)
+    contexto.options |= ssl.OP_NO_COMPRESSION
+    # En TLS 1.2 la reanudacion usa tickets (OP_NO_TICKET apagado) o la cache de sesiones del contexto
+    contexto.options &= ~ssl.OP_NO_TICKET
+    contexto.num_tickets = TICKETS_POR_CONEXION
+    return contexto
+
+def crear_contexto_cliente(verificar=False, cafile=None):
+    """SSLContext de cliente; sin verificar acepta el certificado autofirmado de pruebas"""
+    contexto = ssl.create_default_context(cafile=cafile)
+    if not verificar:
+        contexto.check_hostname = False
+        contexto.verify_mode = ssl.CERT_NONE
+    contexto.set_alpn_protocols(ALPN_PROTOCOLOS)
+    return contexto
+
+def get_stats(contexto):
+    """Estadisticas de la cache de sesiones de OpenSSL del contexto"""
+    stats = contexto.session_stats()
+    return {
+        'accepted': stats.get('accept', 0),
+        'accepted_good': stats.get('accept_good', 0),
+        'session_hits': stats.get('hits', 0),
+        'session_misses': stats.get('misses', 0),
+        'session_timeouts': stats.get('timeouts', 0),
+        'cached_sessions': stats.get('number', 0)
+    }
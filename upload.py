@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+from static_index import canonical_path
+
+class UploadError(Exception):
+    """Destino de subida invalido; status indica la respuesta HTTP que corresponde (400, 404)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def resolve_target(base_dir, uri):
+    """
+    (ruta URL canonica, ruta en disco) del archivo que crea o reemplaza una subida.
+    El directorio que lo contiene tiene que existir dentro de base_dir; no se aceptan
+    directorios, nombres ocultos ni rutas que salgan del directorio base.
+    """
+    try:
+        path = canonical_path(uri)
+    except UnicodeDecodeError:
+        path = None
+    if path is None or path.endswith("/"):
+        raise UploadError(400, "Ruta de destino invalida")
+    if any(segmento.startswith(".") for segmento in path.split("/") if segmento):
+        raise UploadError(400, "No se aceptan nombres ocultos")
+    base = os.path.realpath(base_dir)
+    directorio = os.path.realpath(os.path.join(base, os.path.dirname(path).lstrip("/")))
+    if os.path.commonpath([base, directorio]) != base or not os.path.isdir(directorio):
+        raise UploadError(404, f"No existe el directorio de destino de {path}")
+    destino = os.path.join(directorio, os.path.basename(path))
+    if os.path.isdir(destino) or os.path.islink(destino):
+        raise UploadError(400, f"{path} no es un archivo")
+    return path, destino
+
+class Upload:
+    """
+    Archivo recibido por PUT/POST. Se escribe de a partes en un temporal oculto del mismo
+    directorio (el indice y los listados lo ignoran) y al terminar reemplaza al destino con
+    os.replace: los lectores ven el archivo anterior o el nuevo completo, nunca uno a medias.
+    """
+
+    def __init__(self, uri, path):
+        self.uri = uri
+        self.path = path
+        self.size = 0
+        self.existed = os.path.exists(path)
+        self.created = None  # resultado de commit()
+        self.error = None
+        fd, self.temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".part",
+                                              dir=os.path.dirname(path))
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """
+        Persiste el temporal y lo publica con el nombre de destino. Devuelve True si el archivo es nuevo.
+        Llamarlo de nuevo devuelve (o lanza) lo mismo: el motor async lo ejecuta antes en un hilo
+        """
+        if self.error is not None:
+            raise self.error
+        if self.created is not None:
+            return self.created
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.chmod(self.temp_path, 0o644)
+            os.replace(self.temp_path, self.path)
+        except OSError as e:
+            self.error = e
+            self.abort()
+            raise
+        self.created = not self.existed
+        return self.created
+
+    def abort(self):
+        """Descarta una subida incompleta"""
+        self.file.close()
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
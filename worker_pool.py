@@ -0,0 +1,120 @@
+import threading
+import queue
+
+class WorkerPool:
+    """
+    Pool fijo de hilos trabajadores alimentado por una cola acotada.
+    Si la cola esta llena, submit() devuelve False y el llamador rechaza la conexion.
+    """
+
+    def __init__(self, handler, num_workers=64, queue_size=256):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.retiring = 0  # hilos que deben terminar al completar su trabajo (reduccion con resize)
+        self.threads = []
+        self._names = 0
+
+        for _ in range(num_workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        self._names += 1
+        thread = threading.Thread(target=self._worker, name=f"Worker-{self._names}")
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def resize(self, num_workers, queue_size=None):
+        """
+        Cambia la cantidad de hilos (y el tamaño de la cola) en caliente. Al reducir,
+        los hilos sobrantes terminan cuando completan el trabajo que tienen en curso.
+        """
+        with self.lock:
+            diferencia = num_workers - self.num_workers
+            self.num_workers = num_workers
+            if diferencia < 0:
+                self.retiring -= diferencia
+            else:
+                # Primero se cancelan las reducciones que todavia no ocurrieron
+                cancelados = min(diferencia, self.retiring)
+                self.retiring -= cancelados
+                diferencia -= cancelados
+            if queue_size is not None:
+                self.queue_size = queue_size
+                self.queue.maxsize = queue_size
+            for _ in range(max(0, diferencia)):
+                self._start_worker()
+
+    def submit(self, *args):
+        """Encola un trabajo sin bloquear. Devuelve False si la cola esta llena"""
+        try:
+            self.queue.put_nowait(args)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.submitted += 1
+        return True
+
+    def _worker(self):
+        while True:
+            args = self.queue.get()
+            if args is None:
+                break
+            with self.lock:
+                self.busy += 1
+            try:
+                self.handler(*args)
+            except Exception as e:
+                print(f"[POOL] Error en {threading.current_thread().name}: {e}")
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    retirar = self.retiring > 0
+                    if retirar:
+                        self.retiring -= 1
+                        self.threads.remove(threading.current_thread())
+            if retirar:
+                break
+
+    def shutdown(self):
+        """Detiene los hilos cuando terminen el trabajo en curso"""
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def get_stats(self):
+        """Obtiene estadisticas del pool"""
+        with self.lock:
+            busy = self.busy
+            submitted = self.submitted
+            rejected = self.rejected
+        queued = self.queue.qsize()
+        return {
+            'workers': self.num_workers,
+            'busy_workers': busy,
+            'queue_depth': queued,
+            'queue_size': self.queue_size,
+            'saturation': busy / self.num_workers if self.num_workers else 0.0,
+            'queue_saturation': queued / self.queue_size if self.queue_size else 0.0,
+            'submitted': submitted,
+            'rejected': rejected
+        }
+
+    def print_stats(self):
+        """Imprime estadisticas del pool"""
+        stats = self.get_stats()
+        print("\n" + "=" * 60)
+        print("ESTADISTICAS DEL POOL DE HILOS")
+        print("=" * 60)
+        print(f"Hilos trabajadores: {stats['workers']} (ocupados: {stats['busy_workers']})")
+        print(f"Cola: {stats['queue_depth']}/{stats['queue_size']}")
+        print(f"Saturacion: hilos {stats['saturation']:.0%}, cola {stats['queue_saturation']:.0%}")
+        print(f"Conexiones aceptadas: {stats['submitted']}, rechazadas (503): {stats['rejected']}")
+        print("=" * 60)